@@ -0,0 +1,197 @@
+"""
+Throughput of KIP1 BLZ decompression, against the list based decoder
+nxo64 used before kip1_blz_decompress_into.
+
+    python -m benchmarks.blz [--size BYTES] [--repeat N]
+"""
+from __future__ import print_function
+
+import argparse
+import random
+import struct
+import sys
+import time
+
+from nxo64.compat import iter_range, list_to_bytes
+from nxo64.utils import kip1_blz_decompress
+
+
+def reference_decompress(compressed):
+    """
+    The previous decoder, one list item per byte.
+
+    :type compressed: bytearray
+    :rtype: bytes
+    """
+    compressed_size, init_index, uncompressed_addl_size = struct.unpack('<III', compressed[-0xC:])
+    decompressed = compressed[:] + b'\x00' * uncompressed_addl_size
+    decompressed_size = len(decompressed)
+    if not (compressed_size + uncompressed_addl_size):
+        return b''
+    decompressed = list(decompressed)
+    cmp_start = len(compressed) - compressed_size
+    cmp_ofs = compressed_size - init_index
+    out_ofs = compressed_size + uncompressed_addl_size
+    while out_ofs > 0:
+        cmp_ofs -= 1
+        control = decompressed[cmp_start + cmp_ofs]
+        for _ in iter_range(8):
+            if control & 0x80:
+                if cmp_ofs < 2 - cmp_start:
+                    raise ValueError('Compression out of bounds!')
+                cmp_ofs -= 2
+                segmentoffset = compressed[cmp_start + cmp_ofs] | (compressed[cmp_start + cmp_ofs + 1] << 8)
+                segmentsize = ((segmentoffset >> 12) & 0xF) + 3
+                segmentoffset &= 0x0FFF
+                segmentoffset += 2
+                if out_ofs < segmentsize - cmp_start:
+                    raise ValueError('Compression out of bounds!')
+                for _ in iter_range(segmentsize):
+                    if out_ofs + segmentoffset >= decompressed_size:
+                        raise ValueError('Compression out of bounds!')
+                    data = decompressed[cmp_start + out_ofs + segmentoffset]
+                    out_ofs -= 1
+                    decompressed[cmp_start + out_ofs] = data
+            else:
+                if out_ofs < 1 - cmp_start:
+                    raise ValueError('Compression out of bounds!')
+                out_ofs -= 1
+                cmp_ofs -= 1
+                decompressed[cmp_start + out_ofs] = decompressed[cmp_start + cmp_ofs]
+            control <<= 1
+            control &= 0xFF
+            if not out_ofs:
+                break
+    return list_to_bytes(decompressed)
+
+
+def sample(size, seed=0):
+    """
+    Code-like data: words drawn mostly from a small vocabulary.
+
+    :type size: int
+    :rtype: bytes
+    """
+    rng = random.Random(seed)
+    vocabulary = [rng.getrandbits(32) for _ in iter_range(512)]
+    words = [vocabulary[rng.randrange(512)] if rng.random() < 0.7 else rng.getrandbits(32)
+             for _ in iter_range(size // 4)]
+    return struct.pack('<%dI' % len(words), *words)
+
+
+def _tokens(data):
+    """
+    Greedy BLZ parse from the end of data to its start.
+
+    :type data: bytearray
+    :return: literal bytes and (length, distance) back-references, in decoding order
+    :rtype: list[int | tuple[int, int]]
+    """
+    tokens = []
+    latest = {}  # 3 bytes as an int -> highest position they end at
+    indexed = len(data)
+    pos = len(data)
+    while pos > 0:
+        last = pos - 1
+        length = 0
+        if last >= 2:
+            source = latest.get((data[last - 2] << 16) | (data[last - 1] << 8) | data[last])
+            if source is not None and 3 <= source - last <= 0x1002:
+                limit = min(18, pos)
+                while length < limit and data[last - length] == data[source - length]:
+                    length += 1
+        if length >= 3:
+            tokens.append((length, source - last))
+            pos -= length
+        else:
+            tokens.append(data[last])
+            pos -= 1
+        while indexed > pos:
+            indexed -= 1
+            if indexed >= 2:
+                latest[(data[indexed - 2] << 16) | (data[indexed - 1] << 8) | data[indexed]] = indexed
+    return tokens
+
+
+def compress(data):
+    """
+    BLZ compress data for in-place decoding: the part the decoder would
+    overwrite before reading it is stored uncompressed in front of the stream.
+
+    :type data: bytes
+    :rtype: bytes
+    """
+    data = bytearray(data)
+    tokens = _tokens(data)
+    sizes = [2 if isinstance(token, tuple) else 1 for token in tokens]
+    lengths = [token[0] if isinstance(token, tuple) else 1 for token in tokens]
+    # margin after each token: where the output ends less the stream left
+    # unread, the tokens are kept up to the last lowest margin so that the
+    # output never passes below the unread stream
+    out = len(data)
+    unread = sum(sizes) + (len(tokens) + 7) // 8
+    margins = [out - unread]
+    for i in iter_range(len(tokens)):
+        if not i % 8:
+            unread -= 1  # the control byte
+        unread -= sizes[i]
+        out -= lengths[i]
+        margins.append(out - unread)
+    lowest = min(margins)
+    keep = max(i for i, margin in enumerate(margins) if margin == lowest)
+    raw = len(data) - sum(lengths[:keep])
+    read = bytearray()
+    for i in iter_range(0, keep, 8):
+        group = tokens[i:min(i + 8, keep)]
+        read.append(sum(0x80 >> k for k, token in enumerate(group) if isinstance(token, tuple)))
+        for token in group:
+            if isinstance(token, tuple):
+                value = (token[0] - 3) << 12 | (token[1] - 3)
+                read += bytearray((value >> 8, value & 0xFF))
+            else:
+                read.append(token)
+    stream = bytes(data[:raw]) + bytes(read[::-1])
+    addl = len(data) - len(stream) - 0xC
+    if addl < 0:
+        raise ValueError('data does not compress')
+    return stream + struct.pack('<III', len(read) + 0xC, 0xC, addl)
+
+
+def _best_time(decompress, compressed, repeat):
+    """
+    :type decompress: (bytearray) -> bytes
+    :type compressed: bytes
+    :type repeat: int
+    :rtype: float
+    """
+    best = None
+    for _ in iter_range(repeat):
+        start = time.time()
+        decompress(bytearray(compressed))
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='benchmarks.blz', description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--size', type=int, default=1 << 20, help='uncompressed size in bytes')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per decoder, the best one counts')
+    args = parser.parse_args(argv)
+
+    data = sample(args.size)
+    compressed = compress(data)
+    if kip1_blz_decompress(bytearray(compressed)) != data or reference_decompress(bytearray(compressed)) != data:
+        raise ValueError('round trip failed')
+    print('%d bytes, %d compressed' % (len(data), len(compressed)))
+    times = []
+    for name, decompress in (('before', reference_decompress), ('after', kip1_blz_decompress)):
+        elapsed = _best_time(decompress, compressed, args.repeat)
+        times.append(elapsed)
+        print('%-6s %8.3fs %8.2f MB/s' % (name, elapsed, len(data) / elapsed / 1e6))
+    print('speedup %.1fx' % (times[0] / times[1]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
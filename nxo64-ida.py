@@ -15,9 +15,13 @@
 
 from __future__ import print_function
 
+import bisect
+import struct
+
 from nxo64.compat import *
 from nxo64.consts import *
 
+from nxo64.aarch64 import find_bl_targets
 from nxo64.files import load_nxo
 from nxo64.memory import SegmentKind
 
@@ -42,30 +46,49 @@ else:
                 return 'nxo.py: Switch binary (NRO)'
         return 0
 
-    def ida_make_offset(f, ea):
+    def ida_make_offsets(f, ea, count):
+        """
+        Turn count consecutive pointers at ea into offsets, as one item.
+        """
         if f.armv7:
-            idaapi.create_data(ea, idc.FF_DWORD, 4, idaapi.BADADDR)
+            idaapi.create_data(ea, idc.FF_DWORD, 4 * count, idaapi.BADADDR)
         else:
-            idaapi.create_data(ea, idc.FF_QWORD, 8, idaapi.BADADDR)
+            idaapi.create_data(ea, idc.FF_QWORD, 8 * count, idaapi.BADADDR)
         idc.op_plain_offset(ea, 0, 0)
 
-    def find_bl_targets(text_start, text_end):
-        targets = set()
-        for pc in range(text_start, text_end, 4):
-            d = idc.get_wide_dword(pc)
-            if (d & 0xfc000000) == 0x94000000:
-                imm = d & 0x3ffffff
-                if imm & 0x2000000:
-                    imm |= ~0x1ffffff
-                if 0 <= imm <= 2:
+    def pointer_runs(f, locations):
+        """
+        Split sorted pointer locations into runs of adjacent pointers that stay
+        within one section and one symbol, so back-to-back objects (vtables,
+        typeinfo) keep their own items and names.
+
+        :return: (first location, count) pairs
+        :rtype: list[tuple[int, int]]
+        """
+        starts = set(start for start, end, name, kind in f.sections)
+        starts.update(s.value for s in f.symbols if s.shndx)
+        starts = sorted(starts)
+        runs = []
+        for location in locations:
+            if runs:
+                first, count = runs[-1]
+                end = first + count * f.offsize
+                if location == end and bisect.bisect_right(starts, first) == bisect.bisect_right(starts, location):
+                    runs[-1] = (first, count + 1)
                     continue
-                target = pc + imm * 4
-                if text_start <= target < text_end:
-                    targets.add(target)
-        return targets
+            runs.append((location, 1))
+        return runs
 
     def load_file(li, neflags, format):
         idaapi.set_processor_type("arm", idaapi.SETPROC_LOADER_NON_FATAL | idaapi.SETPROC_LOADER)
+        # nothing is analysed until every function start is queued
+        idaapi.enable_auto(False)
+        try:
+            return load_module(li)
+        finally:
+            idaapi.enable_auto(True)
+
+    def load_module(li):
         f = load_nxo(li)
         if f.armv7:
             idc.set_inf_attr(idc.INF_LFLAGS, idc.get_inf_attr(idc.INF_LFLAGS) | idc.LFLG_PC_FLAT)
@@ -78,15 +101,27 @@ else:
 
         loadbase = 0x60000000 if f.armv7 else 0x7100000000
 
-        f.binfile.seek(0)
-        as_string = f.binfile.read(f.bssoff)
-        idaapi.mem2base(as_string, loadbase)
-        if f.text[1] is not None:
-            li.file2base(f.text[1], loadbase + f.text[2], loadbase + f.text[2] + f.text[3], True)
-        if f.ro[1] is not None:
-            li.file2base(f.ro[1], loadbase + f.ro[2], loadbase + f.ro[2] + f.ro[3], True)
-        if f.data[1] is not None:
-            li.file2base(f.data[1], loadbase + f.data[2], loadbase + f.data[2] + f.data[3], True)
+        # imports go to a synthetic UNDEF segment after the module
+        # TODO: can we make imports show up in "Imports" window?
+        last_ea = max(loadbase + end for start, end, name, kind in f.sections)
+        undef_entry_size = 8
+        undef_start = ((last_ea + 0xFFF) & ~0xFFF) + undef_entry_size  # plus 8 so we don't end up on the "end" symbol
+        undef_eas = {}
+        for s in f.symbols:
+            if not s.shndx and s.name and s.name not in undef_eas:
+                undef_eas[s.name] = undef_start + len(undef_eas) * undef_entry_size
+
+        # relocate in Python, then load the image segment by segment, linking
+        # the ones stored uncompressed to the file
+        image, failed = f.relocated_image(loadbase, lambda s: undef_eas.get(s.name))
+        segments = [f.text, f.ro, f.data]
+        limits = [f.ro[2], f.data[2], f.bssoff]
+        for (_, fileoff, vaddr, vsize), limit in zip(segments, limits):
+            end = min(vaddr + vsize, limit)
+            if vaddr < end:
+                idaapi.mem2base(bytes(image[vaddr:end]), loadbase + vaddr, -1 if fileoff is None else fileoff)
+            if end < limit:
+                idaapi.mem2base(bytes(image[end:limit]), loadbase + end)
 
         for start, end, name, kind in f.sections:
             if name.startswith('.got'):
@@ -105,84 +140,80 @@ else:
             idaapi.set_segm_addressing(segm, 1 if f.armv7 else 2)
 
         # do imports
-        # TODO: can we make imports show up in "Imports" window?
-        undef_count = 0
-        for s in f.symbols:
-            if not s.shndx and s.name:
-                undef_count += 1
-        last_ea = max(loadbase + end for start, end, name, kind in f.sections)
-        undef_entry_size = 8
-        undef_ea = ((last_ea + 0xFFF) & ~0xFFF) + undef_entry_size  # plus 8 so we don't end up on the "end" symbol
-        idaapi.add_segm(0, undef_ea, undef_ea+undef_count*undef_entry_size, "UNDEF", "XTRN")
+        undef_ea = undef_start
+        idaapi.add_segm(0, undef_ea, undef_ea+len(undef_eas)*undef_entry_size, "UNDEF", "XTRN")
         segm = idaapi.get_segm_by_name("UNDEF")
         segm.type = idaapi.SEG_XTRN
         idaapi.update_segm(segm)
+        # one item per import, so each slot keeps its name
+        for ea in sorted(undef_eas.values()):
+            idaapi.create_data(ea, idc.FF_QWORD, undef_entry_size, idaapi.BADADDR)
+        name_flags = idaapi.SN_NOCHECK | idaapi.SN_NOWARN | idaapi.SN_FORCE
+        # function start -> end, None if unknown
+        funcs = {}
         for i, s in enumerate(f.symbols):
             if not s.shndx and s.name:
-                idaapi.create_data(undef_ea, idc.FF_QWORD, 8, idaapi.BADADDR)
-                idaapi.force_name(undef_ea, s.name)
-                s.resolved = undef_ea
-                undef_ea += undef_entry_size
+                s.resolved = undef_eas[s.name]
+                idaapi.set_name(s.resolved, s.name, name_flags)
             elif i != 0:
                 assert s.shndx
                 s.resolved = loadbase + s.value
                 if s.name:
                     if s.type == STT.FUNC:
-                        print(hex(s.resolved), s.name)
                         idaapi.add_entry(s.resolved, s.resolved, s.name, 0)
+                        if s.value:
+                            funcs[s.resolved] = s.resolved + s.size if s.size else None
                     else:
-                        idaapi.force_name(s.resolved, s.name)
-
+                        idaapi.set_name(s.resolved, s.name, name_flags)
             else:
                 # NULL symbol
                 s.resolved = 0
 
-        funcs = set()
-        for s in f.symbols:
-            if s.name and s.shndx and s.value:
-                if s.type == STT.FUNC:
-                    funcs.add(loadbase+s.value)
+        for offset, r_type, sym_index in zip(failed.offsets.tolist(), failed.types.tolist(),
+                                             failed.sym_indices.tolist()):
+            if r_type in (R_AArch64.TLSDESC, R_Arm.TLS_DESC):
+                continue
+            print('error: relocation at %X (type %d, symbol %d) failed' % (loadbase + offset, r_type, sym_index))
+
+        # pointers to .text are likely functions
+        table = f.relocation_table
+        fmt = '<I' if f.armv7 else '<Q'
+        rel_types = (R_Arm.RELATIVE if f.armv7 else R_AArch64.RELATIVE, R_FAKE_RELR)
+        for offset in table.of_type(*rel_types).offsets.tolist():
+            target = struct.unpack_from(fmt, image, offset)[0] - loadbase
+            if 0 <= target < f.textsize:
+                funcs.setdefault(loadbase + target, None)
+
+        for first, count in pointer_runs(f, table.locations.tolist()):
+            ida_make_offsets(f, loadbase + first, count)
 
         got_name_lookup = {}
-        for offset, r_type, sym, addend in f.relocations:
-            target = offset + loadbase
-            if r_type in (R_Arm.GLOB_DAT, R_Arm.JUMP_SLOT, R_Arm.ABS32):
-                if not sym:
-                    print('error: relocation at %X failed' % target)
-                else:
-                    idaapi.put_dword(target, sym.resolved)
-            elif r_type == R_Arm.RELATIVE:
-                idaapi.put_dword(target, idaapi.get_dword(target) + loadbase)
-            elif r_type in (R_AArch64.GLOB_DAT, R_AArch64.JUMP_SLOT, R_AArch64.ABS64):
-                if not sym:
-                    print('error: relocation at %X failed' % target)
-                else:
-                    idaapi.put_qword(target, sym.resolved + addend)
-                    if addend == 0:
-                        got_name_lookup[offset] = sym.name
-            elif r_type == R_AArch64.RELATIVE:
-                idaapi.put_qword(target, loadbase + addend)
-                if addend < f.textsize:
-                    funcs.add(loadbase + addend)
-            elif r_type == R_FAKE_RELR:
-                assert not f.armv7  # TODO
-                addend = idaapi.get_qword(target)
-                idaapi.put_qword(target, addend + loadbase)
-                if addend < f.textsize:
-                    funcs.add(loadbase + addend)
-            else:
-                print('TODO r_type %d' % (r_type,))
-            ida_make_offset(f, target)
+        if not f.armv7:
+            got = table.of_type(R_AArch64.GLOB_DAT, R_AArch64.JUMP_SLOT, R_AArch64.ABS64)
+            for offset, sym_index, addend in zip(got.offsets.tolist(), got.sym_indices.tolist(),
+                                                 got.addends.tolist()):
+                if sym_index and addend == 0:
+                    got_name_lookup[offset] = f.symbols[sym_index].name
 
         for func, target in f.plt_entries:
             if target in got_name_lookup:
                 addr = loadbase + func
-                funcs.add(addr)
-                idaapi.force_name(addr, got_name_lookup[target])
-
-        funcs |= find_bl_targets(loadbase, loadbase+f.textsize)
-
-        for addr in sorted(funcs, reverse=True):
+                funcs.setdefault(addr, None)
+                idaapi.set_name(addr, got_name_lookup[target], name_flags)
+
+        # eh_frame_hdr lists the exact start of nearly every function
+        for pc, _ in f.eh_table:
+            if pc < f.textsize:
+                funcs.setdefault(loadbase + pc, None)
+        for addr in find_bl_targets(f.image.view(0, f.textsize), loadbase):
+            funcs.setdefault(addr, None)
+
+        # one sorted batch: functions with a known size get their bounds, the
+        # rest are queued for auto-analysis to find their ends
+        for addr in sorted(funcs):
+            end = funcs[addr]
+            if end is not None and idaapi.add_func(addr, end):
+                continue
             idc.AutoMark(addr, idc.AU_CODE)
             idc.AutoMark(addr, idc.AU_PROC)
 
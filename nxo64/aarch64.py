@@ -0,0 +1,99 @@
+import re
+import struct
+
+from .compat import numpy, regex_buffer
+
+BR_X17 = 0xD61F0220
+INSTRUCTION = struct.Struct('<I')
+
+_plt_stub = struct.Struct('<IIII')
+_br_x17 = re.compile(re.escape(struct.pack('<I', BR_X17)))
+_bl = re.compile(b'[\x94-\x97]')
+
+
+def _words(code):
+    """
+    :type code: bytes | bytearray | memoryview
+    :rtype: numpy.ndarray
+    """
+    return numpy.frombuffer(code, dtype='<u4', count=len(code) // 4)
+
+
+def find_plt_stubs(text, plt_got_start, plt_got_end):
+    """
+    Find ``adrp x16, page; ldr x17, [x16, #off]; add x16, x16, #off; br x17``
+    stubs loading a .got.plt entry.
+
+    :param text: code, starting at offset 0 of the image
+    :type text: bytes | bytearray | memoryview
+    :type plt_got_start: int
+    :type plt_got_end: int
+    :return: (stub offset, .got.plt entry) pairs, by offset
+    :rtype: list[tuple[int, int]]
+    """
+    if numpy is not None:
+        words = _words(text)
+        br = numpy.flatnonzero(words == BR_X17)
+        br = br[br >= 3]
+        a = words[br - 3].astype(numpy.int64)
+        b = words[br - 2].astype(numpy.int64)
+        match = ((a & 0x9f00001f) == 0x90000010) & ((b & 0xffe003ff) == 0xf9400211)
+        a, b, offs = a[match], b[match], (br[match] - 3) * 4
+        paddr = (offs & ~0xFFF) + ((((a >> 29) & 3) << 12) | (((a >> 5) & 0x7ffff) << 14))
+        targets = paddr + (((b >> 10) & 0xfff) << 3)
+        found = (plt_got_start <= targets) & (targets < plt_got_end)
+        return list(zip(offs[found].tolist(), targets[found].tolist()))
+
+    entries = []
+    for m in _br_x17.finditer(regex_buffer(text), 12):
+        if (m.start() % 4) != 0:
+            continue
+        off = m.start() - 12
+        a, b, c, d = _plt_stub.unpack_from(text, off)
+        if (a & 0x9f00001f) == 0x90000010 and (b & 0xffe003ff) == 0xf9400211:
+            base = off & ~0xFFF
+            immhi = (a >> 5) & 0x7ffff
+            immlo = (a >> 29) & 3
+            paddr = base + ((immlo << 12) | (immhi << 14))
+            poff = ((b >> 10) & 0xfff) << 3
+            target = paddr + poff
+            if plt_got_start <= target < plt_got_end:
+                entries.append((off, target))
+    return entries
+
+
+def find_bl_targets(text, text_start=0):
+    """
+    Decode the targets of all ``bl`` instructions in text.
+
+    :param text: code, starting at address text_start
+    :type text: bytes | bytearray | memoryview
+    :type text_start: int
+    :return: sorted, unique call targets inside text, calls to the next
+             two instructions are skipped
+    :rtype: list[int]
+    """
+    text_end = text_start + len(text) // 4 * 4
+    if numpy is not None:
+        words = _words(text)
+        index = numpy.flatnonzero((words & 0xfc000000) == 0x94000000)
+        imm = ((words[index] & 0x3ffffff).astype(numpy.int64) ^ 0x2000000) - 0x2000000
+        targets = text_start + (index + imm) * 4
+        targets = targets[((imm < 0) | (imm > 2)) & (text_start <= targets) & (targets < text_end)]
+        return numpy.unique(targets).tolist()
+
+    targets = set()
+    # the opcode is in the top byte of each little-endian word
+    for m in _bl.finditer(regex_buffer(text)):
+        pos = m.start() - 3
+        if (pos % 4) != 0 or pos < 0:
+            continue
+        imm = INSTRUCTION.unpack_from(text, pos)[0] & 0x3ffffff
+        if imm & 0x2000000:
+            imm -= 0x4000000
+        if 0 <= imm <= 2:
+            continue
+        target = text_start + pos + imm * 4
+        if text_start <= target < text_end:
+            targets.add(target)
+    return sorted(targets)
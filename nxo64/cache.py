@@ -0,0 +1,141 @@
+import errno
+import hashlib
+import marshal
+import os
+import struct
+import sys
+import tempfile
+
+from .files import NxoFlags
+
+# bump when the layout of NxoFileBase.get_state() changes
+CACHE_FORMAT = 4
+
+_HASH_FLAGS = NxoFlags.TEXT_HASH | NxoFlags.RO_HASH | NxoFlags.DATA_HASH
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+class ParseCache(object):
+    """
+    On-disk cache of parsed module state, one file per module in directory.
+
+    Entries are written to a temporary file and renamed into place, so
+    several processes can share a directory. Reads refresh an entry's mtime,
+    and the least recently used entries are removed once the directory grows
+    past max_size.
+    """
+    SUFFIX = '.nxc'
+
+    def __init__(self, directory, max_size=256 << 20):
+        """
+        :type directory: str
+        :param max_size: bytes
+        :type max_size: int
+        """
+        self.directory = directory
+        self.max_size = max_size
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    @staticmethod
+    def key_for(fileobj):
+        """
+        Cache key for a module: its NSO header (build ID, segment sizes and
+        SHA-256 hashes) if the header flags every segment hash as checked,
+        otherwise a hash of the content.
+
+        :type fileobj: io.BinaryIO | mmap.mmap
+        :rtype: str
+        """
+        fileobj.seek(0)
+        header = fileobj.read(0x100)
+        h = hashlib.sha256()
+        # the marshal format of the entries depends on the interpreter
+        h.update(('%d:%d.%d:' % (CACHE_FORMAT, sys.version_info[0], sys.version_info[1])).encode())
+        if (header[:4] == b'NSO0' and len(header) == 0x100
+                and struct.unpack_from('<I', header, 0xC)[0] & _HASH_FLAGS == _HASH_FLAGS
+                and header[0xA0:0x100].strip(b'\x00')):
+            h.update(header)
+        else:
+            h.update(header)
+            while True:
+                chunk = fileobj.read(1 << 20)
+                if not chunk:
+                    break
+                h.update(chunk)
+        fileobj.seek(0)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def get(self, key):
+        """
+        :type key: str
+        :rtype: dict | None
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fileobj:
+                data = fileobj.read()
+        except (IOError, OSError):
+            return None
+        try:
+            version, state = marshal.loads(data)
+        except (EOFError, ValueError, TypeError):
+            return None
+        if version != CACHE_FORMAT:
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return state
+
+    def put(self, key, state):
+        """
+        :type key: str
+        :type state: dict
+        """
+        data = marshal.dumps((CACHE_FORMAT, state))
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fileobj:
+                fileobj.write(data)
+            _replace(tmp, self._path(key))
+        except Exception:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in max_size.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue  # removed by another process
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+        entries.sort()
+        for mtime, size, name in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,170 @@
+from __future__ import print_function
+
+import argparse
+import binascii
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from .files import KipFile, NroFile, NsoFile, load_nxo
+
+FORMATS = ((NsoFile, 'NSO'), (NroFile, 'NRO'), (KipFile, 'KIP'))
+
+
+def _text(b):
+    """
+    :type b: bytes | str | None
+    :rtype: str | None
+    """
+    if b is None or isinstance(b, str):
+        return b
+    return b.decode('utf-8', 'replace')
+
+
+def _is_module(path):
+    """
+    :type path: str
+    :rtype: bool
+    """
+    try:
+        with open(path, 'rb') as fileobj:
+            header = fileobj.read(0x14)
+    except (IOError, OSError):
+        return True  # let the scan report it
+    return header[:4] in (b'NSO0', b'KIP1') or header[0x10:0x14] == b'NRO0'
+
+
+def scan_file(path, verify=False):
+    """
+    Parse one module and summarize it.
+
+    :type path: str
+    :param verify: also check NSO segment hashes
+    :type verify: bool
+    :rtype: dict
+    """
+    start = time.time()
+    with load_nxo(path, verify=verify) as f:
+        sections = [dict(start=s, end=e, name=name, kind=kind.value) for s, e, name, kind in f.sections]
+        record = dict(
+            path=path,
+            format=next(name for cls, name in FORMATS if isinstance(f, cls)),
+            armv7=f.armv7,
+            name=_text(f.get_name()),
+            needed=f.needed,
+            sections=sections,
+            symbols=len(f.symbols),
+            relocations=len(f.relocation_table),
+        )
+        if verify:
+            record['hash_mismatches'] = [
+                dict(segment=m.name, expected=_text(binascii.hexlify(m.expected)),
+                     actual=_text(binascii.hexlify(m.actual)))
+                for m in f.verify_hashes()]
+    record['parse_time'] = round(time.time() - start, 6)
+    return record
+
+
+def _scan(job):
+    """
+    :type job: tuple[str, bool, bool]
+    :rtype: dict | None
+    """
+    path, explicit, verify = job
+    if not explicit and not _is_module(path):
+        return None
+    try:
+        return scan_file(path, verify)
+    except Exception as e:
+        return dict(path=path, error='%s: %s' % (type(e).__name__, e))
+
+
+def _init_worker(limit):
+    """
+    :param limit: address space limit for a worker, in bytes
+    :type limit: int | None
+    """
+    # the library prints warnings, keep them out of the records
+    sys.stdout = sys.stderr
+    if not limit:
+        return
+    try:
+        import resource
+    except ImportError:
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def iter_paths(paths):
+    """
+    :param paths: files and directories, directories are walked recursively
+    :type paths: list[str]
+    :return: (path, whether it was listed explicitly)
+    :rtype: collections.Iterator[tuple[str, bool]]
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    yield os.path.join(root, name), False
+        else:
+            yield path, True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='nxo64',
+                                     description='Scan NSO/NRO/KIP files and print one JSON record per module.')
+    parser.add_argument('paths', nargs='*', help='files or directories to scan')
+    parser.add_argument('-l', '--list', metavar='FILE',
+                        help='read more paths from FILE, one per line ("-" for stdin)')
+    parser.add_argument('-o', '--output', metavar='FILE', help='write the records to FILE instead of stdout')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+                        help='worker processes (default: number of CPUs)')
+    parser.add_argument('--max-tasks-per-child', type=int, default=32,
+                        help='restart a worker after this many files, to return its memory (default: 32)')
+    parser.add_argument('--memory-limit', type=int, metavar='MB',
+                        help='address space limit per worker, files that exceed it are reported as errors')
+    parser.add_argument('--verify', action='store_true',
+                        help='check NSO segment hashes, files with mismatches are reported as errors')
+    args = parser.parse_args(argv)
+
+    paths = list(args.paths)
+    if args.list == '-':
+        paths.extend(line.strip() for line in sys.stdin if line.strip())
+    elif args.list:
+        with open(args.list) as listing:
+            paths.extend(line.strip() for line in listing if line.strip())
+    if not paths:
+        parser.error('no files given')
+
+    limit = args.memory_limit << 20 if args.memory_limit else None
+    out = open(args.output, 'w') if args.output else sys.stdout
+    errors = 0
+    pool = multiprocessing.Pool(max(args.jobs, 1), _init_worker, (limit,),
+                                maxtasksperchild=args.max_tasks_per_child)
+    try:
+        jobs = ((path, explicit, args.verify) for path, explicit in iter_paths(paths))
+        for record in pool.imap_unordered(_scan, jobs, chunksize=4):
+            if record is None:
+                continue
+            if 'error' in record or record.get('hash_mismatches'):
+                errors += 1
+            out.write(json.dumps(record, sort_keys=True) + '\n')
+            out.flush()
+        pool.close()
+    except BaseException:
+        # join() only works on a closed or terminated pool
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        if out is not sys.stdout:
+            out.close()
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
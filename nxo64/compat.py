@@ -1,4 +1,10 @@
 import sys
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 if sys.version_info[0] > 2:
     iter_range = range
@@ -7,6 +13,14 @@ if sys.version_info[0] > 2:
     bytes_to_list = lambda b: list(b)
     list_to_bytes = lambda l: bytes(l)
     get_ord = lambda b: b
+    string_types = (str,)
+    regex_buffer = lambda v: v
+    view_bytes = lambda v: bytes(v)
+    mmap_views = True
+    array_tobytes = lambda a: a.tobytes()
+    array_frombytes = lambda a, b: a.frombytes(b)
+    struct_iter_unpack = lambda st, buf: st.iter_unpack(buf)
+    int64_typecode = 'q'
 else:
     iter_range = xrange
     int_types = (int, long)
@@ -14,3 +28,21 @@ else:
     bytes_to_list = lambda b: map(ord, b)
     list_to_bytes = lambda l: ''.join(map(chr, l))
     get_ord = lambda b: ord(b)
+    string_types = (basestring,)
+    regex_buffer = lambda v: v.tobytes() if isinstance(v, memoryview) else v
+    view_bytes = lambda v: v.tobytes() if isinstance(v, memoryview) else bytes(v)
+    mmap_views = False  # memoryview() doesn't take an mmap, mapped files are read instead
+    array_tobytes = lambda a: a.tostring()
+    array_frombytes = lambda a, b: a.fromstring(b)
+    struct_iter_unpack = lambda st, buf: (st.unpack_from(buf, i) for i in xrange(0, len(buf), st.size))
+    int64_typecode = 'l'  # LP64
+
+
+def int_column(count, fill=-1):
+    """
+    :return: count int64 items set to fill
+    :rtype: numpy.ndarray | array.array
+    """
+    if numpy is not None:
+        return numpy.full(count, fill, dtype=numpy.int64)
+    return array(int64_typecode, [fill]) * count
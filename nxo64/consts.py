@@ -19,6 +19,8 @@ class STT(IntEnum):
     SECTION = 3
 
 
+SHN_ABS = 0xFFF1
+
 R_FAKE_RELR = -1
 
 
@@ -0,0 +1,322 @@
+from __future__ import print_function
+
+import argparse
+import hashlib
+import json
+import sys
+from array import array
+
+from .aarch64 import INSTRUCTION, find_bl_targets
+from .compat import array_tobytes, int_column, numpy, struct_iter_unpack
+from .consts import STT
+from .files import load_nxo
+from .nxo_exceptions import NxoException
+
+NOP = 0xD503201F
+
+# (match mask, match value, bits to keep) of instructions with a pc-relative
+# immediate, which changes whenever code moves
+_PCREL = (
+    (0x7C000000, 0x14000000, 0xFC000000),  # b, bl
+    (0x1F000000, 0x10000000, 0x9F00001F),  # adr, adrp
+    (0xFF000010, 0x54000000, 0xFF00001F),  # b.cond
+    (0x7E000000, 0x34000000, 0xFF00001F),  # cbz, cbnz
+    (0x7E000000, 0x36000000, 0xFFF8001F),  # tbz, tbnz
+    (0x3B000000, 0x18000000, 0xFF00001F),  # ldr (literal)
+)
+# the page offset half of an adrp pair: add (immediate) and ldr/str (unsigned offset)
+_PAGEOFF = ((0x7F800000, 0x11000000), (0x3B000000, 0x39000000))
+_PAGEOFF_KEEP = 0xFFC003FF
+
+
+def _keep_bits(word, prev):
+    """
+    :type word: int
+    :param prev: the preceding instruction
+    :type prev: int
+    :rtype: int
+    """
+    for mask, value, keep in _PCREL:
+        if word & mask == value:
+            return keep
+    if prev & 0x9F000000 == 0x90000000 and (word >> 5) & 0x1F == prev & 0x1F:
+        for mask, value in _PAGEOFF:
+            if word & mask == value:
+                return _PAGEOFF_KEEP
+    return 0xFFFFFFFF
+
+
+def _check_aarch64(f):
+    """
+    :type f: nxo64.files.NxoFileBase
+    """
+    if f.armv7:
+        raise NxoException('function diffs only support AArch64 modules, not 32-bit ARM')
+
+
+def masked_text(f):
+    """
+    .text of a module with everything that depends on the layout of the module
+    cleared: relocated words and the immediates of pc-relative instructions
+    (branches, adr/adrp and the page offset following an adrp).
+
+    :type f: nxo64.files.NxoFileBase
+    :return: the masked words
+    :rtype: numpy.ndarray | array.array
+    """
+    _check_aarch64(f)
+    text = f.image.view(0, f.textsize // 4 * 4)
+    locations = f.relocation_table.locations
+    if numpy is not None:
+        words = numpy.frombuffer(text, dtype='<u4')
+        keep = numpy.full(len(words), 0xFFFFFFFF, dtype=numpy.uint32)
+        for mask, value, bits in _PCREL:
+            keep[(words & mask) == value] = bits
+        prev = numpy.concatenate([numpy.zeros(1, dtype=words.dtype), words[:-1]])
+        pair = ((prev & 0x9F000000) == 0x90000000) & (((words >> 5) & 0x1F) == (prev & 0x1F))
+        for mask, value in _PAGEOFF:
+            keep[pair & ((words & mask) == value)] = _PAGEOFF_KEEP
+        locations = numpy.asarray(locations, dtype=numpy.int64)
+        index = locations[locations < len(text)] // 4
+        keep[index] = 0
+        keep[index[index + 1 < len(words)] + 1] = 0
+        return words & keep
+
+    words = array('I', (w for w, in struct_iter_unpack(INSTRUCTION, text)))
+    prev = 0
+    for i, word in enumerate(words):
+        words[i] = word & _keep_bits(word, prev)
+        prev = word
+    for location in locations:
+        if location >= len(text):
+            break
+        for i in (location // 4, location // 4 + 1):
+            if i < len(words):
+                words[i] = 0
+    return words
+
+
+def function_starts(f):
+    """
+    Function entry points in .text: the .eh_frame_hdr table, defined function
+    symbols and bl targets.
+
+    :type f: nxo64.files.NxoFileBase
+    :rtype: list[int]
+    """
+    _check_aarch64(f)
+    starts = set(start for start, _ in f.eh_table)
+    starts.update(sym.value for sym in f.symbols if sym.shndx and sym.type == STT.FUNC)
+    starts.update(find_bl_targets(f.image.view(0, f.textsize)))
+    return sorted(start for start in starts if 0 <= start < f.textsize and not start & 3)
+
+
+class Function(object):
+    __slots__ = ('start', 'end', 'name', 'hash')
+
+    def __init__(self, start, end, name, hash):
+        """
+        :type start: int
+        :param end: address after the last instruction, trailing padding excluded
+        :type end: int
+        :param name: name of a function symbol at start
+        :type name: str | None
+        :param hash: digest of the masked instructions
+        :type hash: bytes
+        """
+        self.start = start
+        self.end = end
+        self.name = name
+        self.hash = hash
+
+    @property
+    def size(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return 'Function(start=0x%X, end=0x%X, name=%r)' % (self.start, self.end, self.name)
+
+
+def split_functions(f):
+    """
+    Split .text of a module into functions, each running up to the next
+    entry point with padding (zero and nop words) trimmed off its end, and
+    hash their content with masked_text().
+
+    :type f: nxo64.files.NxoFileBase
+    :return: functions by address, none if .text is only padding
+    :rtype: list[Function]
+    """
+    starts = function_starts(f)
+    if not starts:
+        return []
+    words = masked_text(f)
+    raw = f.image.view(0, len(words) * 4)
+    count = len(words)
+    if numpy is not None:
+        first = numpy.asarray(starts, dtype=numpy.int64) // 4
+        limit = numpy.append(first[1:], count)
+        unmasked = numpy.frombuffer(raw, dtype='<u4')
+        code = numpy.flatnonzero((unmasked != 0) & (unmasked != NOP))
+        if not len(code):
+            return []  # only padding
+        # last code word before each limit, but at least the first word
+        last = numpy.searchsorted(code, limit) - 1
+        last = numpy.where(last >= 0, code[numpy.maximum(last, 0)], -1)
+        ends = (numpy.maximum(last, first) + 1).tolist()
+    else:
+        if not any(word not in (0, NOP) for word, in struct_iter_unpack(INSTRUCTION, raw)):
+            return []
+        first = [start // 4 for start in starts]
+        ends = []
+        for i, start in enumerate(first):
+            end = first[i + 1] if i + 1 < len(first) else count
+            while end - 1 > start and INSTRUCTION.unpack_from(raw, (end - 1) * 4)[0] in (0, NOP):
+                end -= 1
+            ends.append(end)
+    data = memoryview(array_tobytes(words))
+
+    names = {}
+    for sym in f.symbols:
+        if sym.shndx and sym.type == STT.FUNC and sym.name:
+            names.setdefault(sym.value, sym.name)
+    sha1 = hashlib.sha1
+    return [Function(start, end * 4, names.get(start), sha1(data[start:end * 4]).digest())
+            for start, end in zip(starts, ends)]
+
+
+def _unique(functions, indices, key):
+    """
+    :type functions: list[Function]
+    :type indices: collections.Iterable[int]
+    :return: key -> index, for keys of exactly one function
+    :rtype: dict
+    """
+    found = {}
+    for i in indices:
+        k = key(functions[i])
+        if k is not None:
+            found[k] = -1 if k in found else i
+    return dict((k, i) for k, i in found.items() if i >= 0)
+
+
+class FunctionDiff(object):
+    """
+    Functions of two builds of a module, matched by name, then by content and
+    then by position between already matched neighbors.
+
+    matches holds (old, new, method) tuples, method being 'name', 'hash' or
+    'neighbor'. Matched functions with different hashes are changed; the
+    remaining ones were added or removed.
+    """
+
+    def __init__(self, old, new):
+        """
+        :type old: list[Function]
+        :type new: list[Function]
+        """
+        self.old = old
+        self.new = new
+        forward = int_column(len(old))
+        backward = int_column(len(new))
+        methods = {}
+
+        def match(i, j, method):
+            forward[i] = j
+            backward[j] = i
+            methods[i] = method
+
+        old_by_name = _unique(old, range(len(old)), lambda fn: fn.name)
+        new_by_name = _unique(new, range(len(new)), lambda fn: fn.name)
+        for name, i in old_by_name.items():
+            j = new_by_name.get(name)
+            if j is not None:
+                match(i, j, 'name')
+
+        old_by_hash = _unique(old, (i for i in range(len(old)) if forward[i] < 0), lambda fn: fn.hash)
+        new_by_hash = _unique(new, (j for j in range(len(new)) if backward[j] < 0), lambda fn: fn.hash)
+        for h, i in old_by_hash.items():
+            j = new_by_hash.get(h)
+            if j is not None:
+                match(i, j, 'hash')
+
+        # an unmatched function right after (or before) a matched one pairs up
+        # with the function after (or before) its match, runs grow a step per function
+        progress = True
+        while progress:
+            progress = False
+            for i in range(1, len(old)):
+                if forward[i] < 0 and forward[i - 1] >= 0:
+                    j = forward[i - 1] + 1
+                    if j < len(new) and backward[j] < 0:
+                        match(i, j, 'neighbor')
+                        progress = True
+            for i in range(len(old) - 2, -1, -1):
+                if forward[i] < 0 and forward[i + 1] >= 0:
+                    j = forward[i + 1] - 1
+                    if j >= 0 and backward[j] < 0:
+                        match(i, j, 'neighbor')
+                        progress = True
+
+        self.matches = [(old[i], new[forward[i]], methods[i]) for i in range(len(old)) if forward[i] >= 0]
+        self.removed = [old[i] for i in range(len(old)) if forward[i] < 0]
+        self.added = [new[j] for j in range(len(new)) if backward[j] < 0]
+
+    @property
+    def changed(self):
+        """
+        :rtype: list[tuple[Function, Function]]
+        """
+        return [(a, b) for a, b, _ in self.matches if a.hash != b.hash]
+
+    @property
+    def unchanged(self):
+        """
+        :rtype: list[tuple[Function, Function]]
+        """
+        return [(a, b) for a, b, _ in self.matches if a.hash == b.hash]
+
+    def __repr__(self):
+        return 'FunctionDiff(matched=%d, changed=%d, added=%d, removed=%d)' % (
+            len(self.matches), len(self.changed), len(self.added), len(self.removed))
+
+
+def diff_modules(old, new):
+    """
+    :type old: nxo64.files.NxoFileBase
+    :type new: nxo64.files.NxoFileBase
+    :rtype: FunctionDiff
+    """
+    return FunctionDiff(split_functions(old), split_functions(new))
+
+
+def _record(fn):
+    """
+    :type fn: Function
+    :rtype: dict
+    """
+    return dict(start=fn.start, end=fn.end, name=fn.name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='nxo64.diff',
+                                     description='Compare the functions of two builds of a module.')
+    parser.add_argument('old', help='module of the old build')
+    parser.add_argument('new', help='module of the new build')
+    parser.add_argument('--all', action='store_true', help='list unchanged functions too')
+    args = parser.parse_args(argv)
+
+    result = diff_modules(load_nxo(args.old), load_nxo(args.new))
+    for a, b, method in result.matches:
+        if a.hash != b.hash or args.all:
+            print(json.dumps(dict(status='changed' if a.hash != b.hash else 'unchanged', match=method,
+                                  old=_record(a), new=_record(b)), sort_keys=True))
+    for fn in result.removed:
+        print(json.dumps(dict(status='removed', old=_record(fn)), sort_keys=True))
+    for fn in result.added:
+        print(json.dumps(dict(status='added', new=_record(fn)), sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,337 @@
+import struct
+
+from .compat import numpy, struct_iter_unpack, view_bytes
+from .nxo_exceptions import NxoException
+
+# DW_EH_PE_* pointer encodings
+DW_EH_PE_omit = 0xFF
+DW_EH_PE_absptr = 0x00
+DW_EH_PE_uleb128 = 0x01
+DW_EH_PE_udata2 = 0x02
+DW_EH_PE_udata4 = 0x03
+DW_EH_PE_udata8 = 0x04
+DW_EH_PE_sleb128 = 0x09
+DW_EH_PE_sdata2 = 0x0A
+DW_EH_PE_sdata4 = 0x0B
+DW_EH_PE_sdata8 = 0x0C
+DW_EH_PE_pcrel = 0x10
+DW_EH_PE_datarel = 0x30
+DW_EH_PE_indirect = 0x80
+
+_table_entry = struct.Struct('<ii')
+
+_fixed_formats = {
+    DW_EH_PE_absptr: '<Q',
+    DW_EH_PE_udata2: '<H',
+    DW_EH_PE_udata4: '<I',
+    DW_EH_PE_udata8: '<Q',
+    DW_EH_PE_sdata2: '<h',
+    DW_EH_PE_sdata4: '<i',
+    DW_EH_PE_sdata8: '<q',
+}
+
+
+def _leb128(data, pos, signed):
+    """
+    :type data: memoryview | bytes
+    :type pos: int
+    :type signed: bool
+    :return: value and position after it
+    :rtype: tuple[int, int]
+    """
+    value = shift = 0
+    while True:
+        byte = struct.unpack_from('<B', data, pos)[0]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    if signed and byte & 0x40:
+        value -= 1 << shift
+    return value, pos
+
+
+class Cie(object):
+    __slots__ = ('offset', 'end', 'augmentation', 'code_align', 'data_align', 'return_register',
+                 'fde_encoding', 'lsda_encoding', 'personality')
+
+    def __init__(self, offset, end, augmentation, code_align, data_align, return_register,
+                 fde_encoding=DW_EH_PE_absptr, lsda_encoding=DW_EH_PE_omit, personality=None):
+        """
+        :param offset: address of the record
+        :type offset: int
+        :param end: address after the record
+        :type end: int
+        :type augmentation: bytes
+        :type code_align: int
+        :type data_align: int
+        :type return_register: int
+        :type fde_encoding: int
+        :type lsda_encoding: int
+        :type personality: int | None
+        """
+        self.offset = offset
+        self.end = end
+        self.augmentation = augmentation
+        self.code_align = code_align
+        self.data_align = data_align
+        self.return_register = return_register
+        self.fde_encoding = fde_encoding
+        self.lsda_encoding = lsda_encoding
+        self.personality = personality
+
+    def __repr__(self):
+        return 'Cie(offset=0x%X, augmentation=%r)' % (self.offset, self.augmentation)
+
+
+class Fde(object):
+    __slots__ = ('offset', 'end', 'cie', 'start_address', 'end_address')
+
+    def __init__(self, offset, end, cie, start_address, end_address):
+        """
+        :param offset: address of the record
+        :type offset: int
+        :param end: address after the record
+        :type end: int
+        :type cie: Cie
+        :param start_address: first address of the function it describes
+        :type start_address: int
+        :param end_address: address after the function
+        :type end_address: int
+        """
+        self.offset = offset
+        self.end = end
+        self.cie = cie
+        self.start_address = start_address
+        self.end_address = end_address
+
+    def __contains__(self, address):
+        return self.start_address <= address < self.end_address
+
+    def __repr__(self):
+        return 'Fde(offset=0x%X, start_address=0x%X, end_address=0x%X)' % (
+            self.offset, self.start_address, self.end_address)
+
+
+class EhFrame(object):
+    """
+    .eh_frame of a module, found through its .eh_frame_hdr. Addresses are
+    looked up with a binary search of the header's sorted table, and CIE/FDE
+    records are decoded only when asked for, each once.
+    """
+
+    def __init__(self, view, hdr_start, hdr_end):
+        """
+        :param view: returns the module content in [start, end)
+        :type view: (int, int) -> memoryview
+        :type hdr_start: int
+        :type hdr_end: int
+        """
+        self._view = view
+        hdr = view(hdr_start, hdr_end)
+        if len(hdr) < 12:
+            raise NxoException('eh_frame_hdr too short')
+        version, eh_frame_ptr_enc, fde_count_enc, table_enc = struct.unpack_from('<BBBB', hdr, 0)
+        # only the layout every linker emits: pcrel sdata4 pointer, udata4 count, datarel sdata4 table
+        if (eh_frame_ptr_enc, fde_count_enc, table_enc) != (
+                DW_EH_PE_pcrel | DW_EH_PE_sdata4, DW_EH_PE_udata4, DW_EH_PE_datarel | DW_EH_PE_sdata4):
+            raise NxoException('unsupported eh_frame_hdr encoding')
+        self.hdr_start = hdr_start
+        self.start = hdr_start + 4 + struct.unpack_from('<i', hdr, 4)[0]
+        count = struct.unpack_from('<I', hdr, 8)[0]
+        # a truncated table is ignored, like a missing one
+        self._table = hdr[12:12 + 8 * count] if 8 * count <= len(hdr) - 12 else hdr[12:12]
+        self._cies = {}
+        self._fdes = {}
+        self._end = None
+
+    def __len__(self):
+        return len(self._table) // 8
+
+    def entry(self, i):
+        """
+        :type i: int
+        :return: (function start, FDE address) of the i-th table entry
+        :rtype: tuple[int, int]
+        """
+        pc, fde = _table_entry.unpack_from(self._table, 8 * i)
+        return self.hdr_start + pc, self.hdr_start + fde
+
+    def entries(self):
+        """
+        :rtype: list[tuple[int, int]]
+        """
+        base = self.hdr_start
+        return [(base + pc, base + fde) for pc, fde in struct_iter_unpack(_table_entry, self._table)]
+
+    def _find(self, address):
+        """
+        :return: index of the last entry starting at or before address, -1 if none
+        :rtype: int
+        """
+        lo, hi = 0, len(self)
+        rel = address - self.hdr_start
+        table = self._table
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if struct.unpack_from('<i', table, 8 * mid)[0] <= rel:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    def lookup(self, address):
+        """
+        :type address: int
+        :return: the FDE of the function containing address
+        :rtype: Fde | None
+        """
+        i = self._find(address)
+        if i < 0:
+            return None
+        fde = self.fde_at(self.entry(i)[1])
+        return fde if address in fde else None
+
+    @property
+    def end(self):
+        """
+        Address after the last record listed in the header, and after the
+        zero terminator if one follows it.
+
+        :rtype: int
+        """
+        if self._end is None:
+            end = self.start
+            if len(self):
+                if numpy is not None:
+                    last = int(numpy.frombuffer(self._table, dtype='<i4')[1::2].max())
+                else:
+                    last = max(fde for _, fde in struct_iter_unpack(_table_entry, self._table))
+                end = self._record(self.hdr_start + last)[1]
+            terminator = self._view(end, end + 4)
+            if len(terminator) == 4 and struct.unpack_from('<I', terminator, 0)[0] == 0:
+                end += 4
+            self._end = end
+        return self._end
+
+    def _fixed(self, fmt, offset):
+        """
+        :return: the value of the length field at offset
+        :rtype: int
+        """
+        size = struct.calcsize(fmt)
+        data = self._view(offset, offset + size) if offset >= 0 else b''
+        if len(data) < size:
+            raise NxoException('truncated eh_frame record at 0x%X' % offset)
+        return struct.unpack_from(fmt, data, 0)[0]
+
+    def _record(self, offset):
+        """
+        :return: record content, without the length field, and the address after the record
+        :rtype: tuple[memoryview, int]
+        """
+        length = self._fixed('<I', offset)
+        start = offset + 4
+        if length == 0xFFFFFFFF:
+            length = self._fixed('<Q', start)
+            start += 8
+        data = self._view(start, start + length)
+        if len(data) < max(length, 4):
+            raise NxoException('truncated eh_frame record at 0x%X' % offset)
+        return data, start + length
+
+    def _pointer(self, data, pos, address, encoding):
+        """
+        :param address: address of data[0]
+        :return: decoded pointer and position after it
+        :rtype: tuple[int, int]
+        """
+        fmt = encoding & 0x0F
+        if fmt == DW_EH_PE_uleb128 or fmt == DW_EH_PE_sleb128:
+            value, end = _leb128(data, pos, fmt == DW_EH_PE_sleb128)
+        elif fmt in _fixed_formats:
+            value = struct.unpack_from(_fixed_formats[fmt], data, pos)[0]
+            end = pos + struct.calcsize(_fixed_formats[fmt])
+        else:
+            raise NxoException('unsupported pointer encoding 0x%X' % encoding)
+        application = encoding & 0x70
+        if application == DW_EH_PE_pcrel:
+            value += address + pos
+        elif application == DW_EH_PE_datarel:
+            value += self.hdr_start
+        elif application:
+            raise NxoException('unsupported pointer encoding 0x%X' % encoding)
+        return value & 0xFFFFFFFFFFFFFFFF, end
+
+    def cie_at(self, offset):
+        """
+        :param offset: address of the record
+        :type offset: int
+        :rtype: Cie
+        """
+        try:
+            return self._cies[offset]
+        except KeyError:
+            pass
+        data, end = self._record(offset)
+        address = end - len(data)
+        if struct.unpack_from('<I', data, 0)[0] != 0:
+            raise NxoException('no CIE at 0x%X' % offset)
+        try:
+            version = struct.unpack_from('<B', data, 4)[0]
+            aug_end = view_bytes(data[5:]).index(b'\x00') + 5
+            augmentation = view_bytes(data[5:aug_end])
+            pos = aug_end + 1
+            if b'eh' in augmentation:
+                pos += 8
+            code_align, pos = _leb128(data, pos, False)
+            data_align, pos = _leb128(data, pos, True)
+            if version == 1:
+                return_register = struct.unpack_from('<B', data, pos)[0]
+                pos += 1
+            else:
+                return_register, pos = _leb128(data, pos, False)
+            cie = Cie(offset, end, augmentation, code_align, data_align, return_register)
+            if augmentation.startswith(b'z'):
+                _, pos = _leb128(data, pos, False)
+                for c in bytearray(augmentation[1:]):
+                    if c == ord('R'):
+                        cie.fde_encoding = struct.unpack_from('<B', data, pos)[0]
+                        pos += 1
+                    elif c == ord('L'):
+                        cie.lsda_encoding = struct.unpack_from('<B', data, pos)[0]
+                        pos += 1
+                    elif c == ord('P'):
+                        encoding = struct.unpack_from('<B', data, pos)[0]
+                        cie.personality, pos = self._pointer(data, pos + 1, address, encoding & ~DW_EH_PE_indirect)
+                    elif c not in (ord('S'), ord('B')):
+                        break  # the remaining augmentation data can't be interpreted
+        except (struct.error, ValueError):
+            raise NxoException('truncated CIE at 0x%X' % offset)
+        self._cies[offset] = cie
+        return cie
+
+    def fde_at(self, offset):
+        """
+        :param offset: address of the record
+        :type offset: int
+        :rtype: Fde
+        """
+        try:
+            return self._fdes[offset]
+        except KeyError:
+            pass
+        data, end = self._record(offset)
+        address = end - len(data)
+        cie_pointer = struct.unpack_from('<I', data, 0)[0]
+        if cie_pointer == 0:
+            raise NxoException('no FDE at 0x%X' % offset)
+        cie = self.cie_at(address - cie_pointer)
+        try:
+            start_address, pos = self._pointer(data, 4, address, cie.fde_encoding)
+            size, _ = self._pointer(data, pos, address, cie.fde_encoding & 0x0F)
+        except struct.error:
+            raise NxoException('truncated FDE at 0x%X' % offset)
+        fde = self._fdes[offset] = Fde(offset, end, cie, start_address, start_address + size)
+        return fde
@@ -1,7 +1,11 @@
 from __future__ import print_function
 
+import binascii
+import hashlib
+import mmap
 import re
 import struct
+from array import array
 from io import BytesIO
 
 try:
@@ -11,13 +15,17 @@ except ImportError:
 
 from lz4.block import decompress as uncompress
 
-from .memory import SegmentKind
+from .aarch64 import find_plt_stubs
+from .memory import IntervalIndex, SegmentKind
 from .memory.builder import SegmentBuilder
-from .compat import iter_range, ascii_string
-from .consts import MULTIPLE_DTS, DT, R_AArch64, R_Arm, R_FAKE_RELR
+from .compat import iter_range, mmap_views, regex_buffer, string_types, struct_iter_unpack, view_bytes
+from .consts import MULTIPLE_DTS, DT, SHN_ABS, STB
+from .ehframe import EhFrame
 from .nxo_exceptions import NxoException
-from .symbols import ElfSym
-from .utils import kip1_blz_decompress
+from .relocations import RelocationTable, apply_relocations
+from .symbols import DictSymbolTable, ElfSym, GnuHashTable, StringTable, SysvHashTable
+from .utils import (kip1_blz_decompress, kip1_blz_decompress_into, kip1_blz_decompressed_size,
+                    lz4_block_decompress_into, lz4_block_decompress_prefix)
 
 
 class NxoFlags(IntFlag):
@@ -29,24 +37,218 @@ class NxoFlags(IntFlag):
     DATA_HASH = 32
 
 
-def load_nxo(fileobj):
+def load_nxo(fileobj, lazy=False, executor=None, eager=False, cache=None, verify=False, previous=None):
     """
-    :type fileobj: io.BytesIO | io.BinaryIO
+    :param fileobj: file object, mmap or path; segments stored uncompressed in
+                    a mapping (paths are mapped) are used in place without copying;
+                    the mapping of a path is released by close() or a with block
+    :type fileobj: io.BytesIO | io.BinaryIO | mmap.mmap | str
+    :param lazy: only load/decompress a segment once its bytes are first read
+    :type lazy: bool
+    :param executor: decompress NSO segments concurrently on this executor
+    :type executor: concurrent.futures.Executor | None
+    :param eager: run every analysis stage while loading instead of on first use
+    :type eager: bool
+    :param cache: reuse the parse results stored for this file; on a hit nothing is
+                  parsed and segments load lazily, so fileobj must stay open
+    :type cache: nxo64.cache.ParseCache | None
+    :param verify: check NSO segment hashes as the segments are decompressed,
+                   mismatches are reported by verify_hashes()
+    :type verify: bool
+    :param previous: an earlier build of the same NSO (or its get_state()), unchanged
+                     segments and the parse results depending only on them are reused
+    :type previous: NsoFile | dict | None
     :rtype: NsoFile | NroFile | KipFile
     """
-    fileobj.seek(0)
-    header = fileobj.read(0x14)
+    opened = None
+    if isinstance(fileobj, string_types):
+        fileobj = opened = map_file(fileobj)
+    try:
+        key = state = None
+        if cache is not None:
+            key = cache.key_for(fileobj)
+            state = cache.get(key)
+        fileobj.seek(0)
+        header = fileobj.read(0x14)
+
+        options = dict(lazy=lazy or state is not None, eager=eager and state is None, state=state)
+        if header[:4] == b'NSO0':
+            f = NsoFile(fileobj, executor=executor, verify=verify, previous=previous, **options)
+        elif header[0x10:0x14] == b'NRO0':
+            f = NroFile(fileobj, **options)
+        elif header[:4] == b'KIP1':
+            f = KipFile(fileobj, **options)
+        else:
+            raise NxoException("not an NRO or NSO or KIP file")
+
+        if cache is not None and state is None:
+            cache.put(key, f.get_state())
+    except Exception:
+        if opened is not None:
+            _close_mapping(opened)
+        raise
+    f._file = opened
+    return f
+
+
+class SegmentHeader(object):
+    __slots__ = ('name', 'file_offset', 'file_size', 'vaddr', 'size', 'compressed', 'hash')
+
+    def __init__(self, name, file_offset, file_size, vaddr, size, compressed=False, hash=None):
+        """
+        :type name: str
+        :type file_offset: int
+        :param file_size: size stored in the file (compressed size)
+        :type file_size: int
+        :type vaddr: int
+        :type size: int
+        :type compressed: bool
+        :param hash: SHA-256 of the decompressed segment, if the header says to check it
+        :type hash: bytes | None
+        """
+        self.name = name
+        self.file_offset = file_offset
+        self.file_size = file_size
+        self.vaddr = vaddr
+        self.size = size
+        self.compressed = compressed
+        self.hash = hash
+
+    def __repr__(self):
+        return 'SegmentHeader(%r, file=0x%X+0x%X, vaddr=0x%X+0x%X, compressed=%r, hashed=%r)' % (
+            self.name, self.file_offset, self.file_size, self.vaddr, self.size, self.compressed,
+            self.hash is not None)
+
+
+class NxoHeader(object):
+    """
+    What the fixed-size file header says about a module, see probe_nxo.
+    """
+
+    def __init__(self, format, segments, bss_size, flags=0, build_id=None, title_id=None, name=None):
+        """
+        :param format: 'NSO', 'NRO' or 'KIP'
+        :type format: str
+        :type segments: list[SegmentHeader]
+        :type bss_size: int
+        :param flags: raw flags field (NxoFlags bits for NSO and KIP)
+        :type flags: int
+        :type build_id: bytes | None
+        :type title_id: int | None
+        :param name: KIP process name
+        :type name: str | None
+        """
+        self.format = format
+        self.segments = segments
+        self.bss_size = bss_size
+        self.flags = flags
+        self.build_id = build_id
+        self.title_id = title_id
+        self.name = name
+
+    @property
+    def text(self):
+        """
+        :rtype: SegmentHeader
+        """
+        return self.segments[0]
+
+    @property
+    def ro(self):
+        """
+        :rtype: SegmentHeader
+        """
+        return self.segments[1]
+
+    @property
+    def data(self):
+        """
+        :rtype: SegmentHeader
+        """
+        return self.segments[2]
+
+    def __repr__(self):
+        return 'NxoHeader(%r, %r, bss_size=0x%X)' % (self.format, self.segments, self.bss_size)
+
+
+def probe_nxo(fileobj):
+    """
+    Read only the fixed header of a module, without loading any segment.
+
+    :type fileobj: io.BinaryIO | mmap.mmap | str
+    :rtype: NxoHeader
+    """
+    if isinstance(fileobj, string_types):
+        with open(fileobj, 'rb') as f:
+            header = f.read(0x100)
+    else:
+        fileobj.seek(0)
+        header = fileobj.read(0x100)
+    if len(header) < 0x100:
+        header += b'\x00' * (0x100 - len(header))
 
     if header[:4] == b'NSO0':
-        return NsoFile(fileobj)
+        flags = NxoFlags(struct.unpack_from('<I', header, 0xC)[0])
+        file_sizes = struct.unpack_from('<III', header, 0x60)
+        segments = []
+        for i, (name, off, compressed, hashed) in enumerate([
+            ('.text', 0x10, NxoFlags.TEXT_COMPRESSED, NxoFlags.TEXT_HASH),
+            ('.rodata', 0x20, NxoFlags.RO_COMPRESSED, NxoFlags.RO_HASH),
+            ('.data', 0x30, NxoFlags.DATA_COMPRESSED, NxoFlags.DATA_HASH),
+        ]):
+            fileoff, vaddr, size = struct.unpack_from('<III', header, off)
+            segments.append(SegmentHeader(name, fileoff, file_sizes[i], vaddr, size, compressed in flags,
+                                          header[0xA0 + i * 0x20:0xC0 + i * 0x20] if hashed in flags else None))
+        return NxoHeader('NSO', segments, struct.unpack_from('<I', header, 0x3C)[0], int(flags),
+                         build_id=header[0x40:0x60])
     elif header[0x10:0x14] == b'NRO0':
-        return NroFile(fileobj)
+        segments = []
+        for name, off in [('.text', 0x20), ('.rodata', 0x28), ('.data', 0x30)]:
+            vaddr, size = struct.unpack_from('<II', header, off)
+            segments.append(SegmentHeader(name, vaddr, size, vaddr, size))
+        return NxoHeader('NRO', segments, struct.unpack_from('<I', header, 0x38)[0],
+                         struct.unpack_from('<I', header, 0x1C)[0], build_id=header[0x40:0x60])
     elif header[:4] == b'KIP1':
-        return KipFile(fileobj)
+        flags = NxoFlags(struct.unpack_from('<B', header, 0x1F)[0])
+        segments = []
+        fileoff = 0x100
+        for name, off, compressed in [
+            ('.text', 0x20, NxoFlags.TEXT_COMPRESSED),
+            ('.rodata', 0x30, NxoFlags.RO_COMPRESSED),
+            ('.data', 0x40, NxoFlags.DATA_COMPRESSED),
+        ]:
+            vaddr, size, file_size = struct.unpack_from('<III', header, off)
+            segments.append(SegmentHeader(name, fileoff, file_size, vaddr, size, compressed in flags))
+            fileoff += file_size
+        return NxoHeader('KIP', segments, struct.unpack_from('<I', header, 0x54)[0], int(flags),
+                         title_id=struct.unpack_from('<Q', header, 0x10)[0],
+                         name=header[0x4:0x10].rstrip(b'\x00').decode('ascii', 'replace'))
     else:
         raise NxoException("not an NRO or NSO or KIP file")
 
 
+def map_file(path):
+    """
+    Map a file copy-on-write, so writes to the mapping never reach the file.
+
+    :type path: str
+    :rtype: mmap.mmap
+    """
+    with open(path, 'rb') as fileobj:
+        return mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_COPY)
+
+
+def _close_mapping(mapping):
+    """
+    :type mapping: mmap.mmap
+    """
+    try:
+        mapping.close()
+    except BufferError:
+        # views handed out earlier are still alive, the mapping goes away with them
+        pass
+
+
 def get_file_size(f):
     """
     :type f: io.BytesIO | BinFile
@@ -62,12 +264,34 @@ def get_file_size(f):
         return filesize
 
 
+_structs = {}
+_scalar_structs = set()
+
+
+def get_struct(fmt):
+    """
+    Cached little-endian struct.Struct for fmt.
+
+    :type fmt: str
+    :rtype: struct.Struct
+    """
+    try:
+        return _structs[fmt]
+    except KeyError:
+        st = _structs[fmt] = struct.Struct('<' + fmt)
+        if len(st.unpack(b'\x00' * st.size)) == 1:
+            _scalar_structs.add(fmt)
+        return st
+
+
 class BinFile(object):
     def __init__(self, li):
         """
-        :type li: io.BytesIO
+        :type li: io.BytesIO | mmap.mmap
         """
         self._f = li
+        # a mapping whose content can be used in place
+        self.mapping = li if mmap_views and isinstance(li, mmap.mmap) else None
 
     def read(self, arg=None):
         """
@@ -75,10 +299,9 @@ class BinFile(object):
         :rtype: bytes | tuple[Any, ...]
         """
         if isinstance(arg, str):
-            fmt = '<' + arg
-            size = struct.calcsize(fmt)
-            raw = self._f.read(size)
-            out = struct.unpack(fmt, raw)
+            st = get_struct(arg)
+            raw = self._f.read(st.size)
+            out = st.unpack(raw)
             if len(out) == 1:
                 return out[0]
             return out
@@ -88,6 +311,44 @@ class BinFile(object):
             out = self._f.read(arg)
             return out
 
+    def read_array(self, fmt, count):
+        """
+        Read ``count`` consecutive records in one go.
+
+        :type fmt: str
+        :type count: int
+        :return: a list of tuples, or of values if fmt has a single field
+        :rtype: list[tuple[Any, ...]] | list[Any]
+        """
+        st = get_struct(fmt)
+        raw = self._f.read(st.size * count)
+        count = len(raw) // st.size
+        if st.size * count != len(raw):
+            raw = raw[:st.size * count]
+        if fmt in _scalar_structs:
+            return list(struct.unpack('<%d%s' % (count, fmt), raw))
+        return list(struct_iter_unpack(st, raw))
+
+    def iter_array(self, fmt, count=None, chunk=0x100):
+        """
+        Lazily read consecutive records, ``chunk`` at a time, for loops that stop
+        on a condition. The file position is only defined once the iterator is exhausted.
+
+        :type fmt: str
+        :type count: int | None
+        :type chunk: int
+        :rtype: collections.Iterator[tuple[Any, ...] | Any]
+        """
+        while count is None or count > 0:
+            n = chunk if count is None else min(chunk, count)
+            records = self.read_array(fmt, n)
+            for i in records:
+                yield i
+            if len(records) < n:
+                return
+            if count is not None:
+                count -= n
+
     def read_to_end(self):
         """
         :rtype: bytes | tuple[Any, ...]
@@ -113,6 +374,42 @@ class BinFile(object):
             self.seek(old)
         return out
 
+    def view_from(self, size, offset):
+        """
+        Like read_from, but without copying if the file is mapped.
+
+        :type size: int
+        :type offset: int
+        :rtype: bytes | memoryview
+        """
+        if self.mapping is not None:
+            return memoryview(self.mapping)[offset:offset + size]
+        return self.read_from(size, offset)
+
+    def readinto_from(self, buf, offset, size, fileoff):
+        """
+        Read ``size`` bytes at ``fileoff`` straight into ``buf[offset:]``.
+
+        :type buf: bytearray
+        :type offset: int
+        :type size: int
+        :type fileoff: int
+        :return: number of bytes read
+        :rtype: int
+        """
+        old = self.tell()
+        try:
+            self.seek(fileoff)
+            if hasattr(self._f, 'readinto'):
+                n = self._f.readinto(memoryview(buf)[offset:offset + size])
+            else:
+                data = self._f.read(size)
+                n = len(data)
+                buf[offset:offset + n] = data
+        finally:
+            self.seek(old)
+        return n
+
     def seek(self, off):
         """
         :type off: int
@@ -132,18 +429,399 @@ class BinFile(object):
         return self._f.tell()
 
 
+class SegmentSource(object):
+    # reads that end within this many bytes of the segment start are served
+    # from a partially decoded prefix if the segment supports it (MOD0 lookup)
+    PREFIX_LIMIT = 0x1000
+
+    def __init__(self, load_into, load_prefix=None, view=None):
+        """
+        :param load_into: writes the segment content to buf at offset (at most size bytes)
+                          and returns the length of the full content
+        :type load_into: (bytearray, int, int) -> int
+        :param load_prefix: returns at least the first n bytes of the segment content
+        :type load_prefix: ((int) -> bytes) | None
+        :param view: (mapping, offset, size) of the segment content inside a mapped file,
+                     used as-is instead of copying it
+        :type view: tuple[mmap.mmap, int, int] | None
+        """
+        self.load_into = load_into
+        self.load_prefix = load_prefix
+        self.view = view
+
+    @classmethod
+    def from_bytes(cls, content):
+        """
+        :type content: bytes
+        :rtype: SegmentSource
+        """
+        return cls(lambda buf, offset, size: _copy_into(buf, offset, size, content),
+                   lambda n: content[:n])
+
+    @classmethod
+    def from_view(cls, mapping, offset, size):
+        """
+        :type mapping: mmap.mmap
+        :type offset: int
+        :type size: int
+        :rtype: SegmentSource
+        """
+        view = memoryview(mapping)[offset:offset + size]
+        return cls(lambda buf, boffset, bsize: _copy_into(buf, boffset, bsize, view),
+                   lambda n: view_bytes(view[:n]), view=(mapping, offset, len(view)))
+
+    @classmethod
+    def from_segment(cls, view):
+        """
+        Content already loaded by another image. The view is dropped once it is
+        copied, so the other image isn't kept alive.
+
+        :type view: memoryview
+        :rtype: SegmentSource
+        """
+        holder = [view]
+        return cls(lambda buf, offset, size: _copy_into(buf, offset, size, holder.pop()),
+                   lambda n: view_bytes(holder[0][:n]))
+
+
+def _copy_into(buf, offset, size, content):
+    """
+    :type buf: bytearray
+    :type offset: int
+    :type size: int
+    :type content: bytes | memoryview
+    :rtype: int
+    """
+    n = min(size, len(content))
+    buf[offset:offset + n] = content[:n] if n < len(content) else content
+    return len(content)
+
+
+class ImageSegment(object):
+    def __init__(self, name, vaddr, limit, source):
+        """
+        :type name: str
+        :type vaddr: int
+        :param limit: end of the space this segment may occupy
+        :type limit: int
+        :type source: SegmentSource
+        """
+        self.name = name
+        self.vaddr = vaddr
+        self.limit = limit
+        self.source = source
+        self.length = None  # type: int | None
+        self.prefix = 0
+        # object holding the content (the image buffer or a mapping) and where in it
+        self.backing = None
+        self.backing_offset = 0
+        # SHA-256 the content should have, and what it has once checked
+        self.expected_hash = None  # type: bytes | None
+        self.hash = None  # type: bytes | None
+
+    def overlaps(self, start, end):
+        """
+        :type start: int
+        :type end: int
+        :rtype: bool
+        """
+        return self.vaddr < end and start < self.limit
+
+
+class SegmentHashMismatch(object):
+    __slots__ = ('name', 'expected', 'actual')
+
+    def __init__(self, name, expected, actual):
+        """
+        :type name: str
+        :type expected: bytes
+        :type actual: bytes
+        """
+        self.name = name
+        self.expected = expected
+        self.actual = actual
+
+    def __repr__(self):
+        return 'SegmentHashMismatch(%r, expected=%s, actual=%s)' % (
+            self.name, binascii.hexlify(self.expected).decode(), binascii.hexlify(self.actual).decode())
+
+
+class NxoImage(object):
+    """
+    File-like flat module image. Every segment is written straight to its
+    vaddr in one preallocated buffer, lazy segments when first read.
+    Segments that are stored uncompressed in a mapped file are used in
+    place; their part of the buffer is never touched.
+
+    With verify set, a segment with an expected hash is hashed right after it
+    is loaded, by the same thread, while its content is still in the cache.
+    """
+    HASH_CHUNK = 1 << 20
+
+    def __init__(self, size, verify=False):
+        """
+        :type size: int
+        :param verify: check segment hashes as the segments are loaded
+        :type verify: bool
+        """
+        self.buffer = bytearray(size)
+        self.verify = verify
+        self._segments = []  # type: list[ImageSegment]
+        self._pos = 0
+        self.closed = False
+
+    def add_segment(self, name, vaddr, limit, source, lazy=False, expected_hash=None):
+        """
+        :type name: str
+        :type vaddr: int
+        :param limit: end of the space this segment may occupy
+        :type limit: int
+        :type source: SegmentSource
+        :type lazy: bool
+        :param expected_hash: SHA-256 of the segment content
+        :type expected_hash: bytes | None
+        """
+        segment = ImageSegment(name, vaddr, min(limit, len(self.buffer)), source)
+        segment.expected_hash = expected_hash
+        self._segments.append(segment)
+        if source.view is not None and source.view[2] <= segment.limit - vaddr:
+            segment.backing, segment.backing_offset, segment.length = source.view
+        elif not lazy:
+            self._materialize(segment)
+
+    def materialize(self, executor=None):
+        """
+        Load every segment that is not loaded yet.
+
+        :param executor: loads the segments concurrently and waits for all of them,
+                         their sources must not share file state
+        :type executor: concurrent.futures.Executor | None
+        """
+        pending = [segment for segment in self._segments
+                   if segment.length is None or self._unchecked(segment)]
+        if executor is None or len(pending) < 2:
+            for segment in pending:
+                self._materialize(segment)
+            return
+        # segments are decoded into disjoint parts of the buffer
+        for future in [executor.submit(self._materialize, segment) for segment in pending]:
+            future.result()
+
+    def _materialize(self, segment):
+        """
+        :type segment: ImageSegment
+        :rtype: int
+        """
+        if segment.length is None:
+            length = segment.source.load_into(self.buffer, segment.vaddr, segment.limit - segment.vaddr)
+            if length > segment.limit - segment.vaddr:
+                print('truncating %s?' % segment.name)
+                length = segment.limit - segment.vaddr
+            segment.backing = self.buffer
+            segment.backing_offset = segment.vaddr
+            segment.length = length
+        if self._unchecked(segment):
+            self._hash(segment)
+        return segment.length
+
+    def _unchecked(self, segment):
+        """
+        :type segment: ImageSegment
+        :rtype: bool
+        """
+        return self.verify and segment.expected_hash is not None and segment.hash is None
+
+    def _hash(self, segment):
+        """
+        :type segment: ImageSegment
+        """
+        # hashlib releases the GIL on large updates, so segments hash in parallel on an executor
+        h = hashlib.sha256()
+        view = memoryview(segment.backing)[segment.backing_offset:segment.backing_offset + segment.length]
+        for pos in iter_range(0, len(view), self.HASH_CHUNK):
+            h.update(view[pos:pos + self.HASH_CHUNK])
+        segment.hash = h.digest()
+
+    def hash_mismatches(self, executor=None):
+        """
+        Load and hash every segment that has an expected hash and was not checked yet.
+
+        :param executor: check the segments concurrently on it
+        :type executor: concurrent.futures.Executor | None
+        :rtype: list[SegmentHashMismatch]
+        """
+        self.verify = True
+        self.materialize(executor)
+        return [SegmentHashMismatch(segment.name, segment.expected_hash, segment.hash)
+                for segment in self._segments
+                if segment.expected_hash is not None and segment.hash != segment.expected_hash]
+
+    def _ensure(self, start, end):
+        if self.closed:
+            raise ValueError('I/O operation on closed image')
+        for segment in self._segments:
+            if segment.length is not None or not segment.overlaps(start, end):
+                continue
+            needed = end - segment.vaddr
+            if needed <= segment.prefix:
+                continue
+            if segment.source.load_prefix is not None and needed <= SegmentSource.PREFIX_LIMIT:
+                requested = max(needed, 0x100)
+                content = segment.source.load_prefix(requested)
+                _copy_into(self.buffer, segment.vaddr, segment.limit - segment.vaddr, content)
+                segment.prefix = min(len(content), segment.limit - segment.vaddr)
+                if len(content) < requested and len(content) == segment.prefix:
+                    # shorter than asked for, so that is the whole segment
+                    segment.backing = self.buffer
+                    segment.backing_offset = segment.vaddr
+                    segment.length = len(content)
+                    self._materialize(segment)
+                    continue
+                if needed <= segment.prefix:
+                    continue
+            self._materialize(segment)
+
+    def _get_segment(self, name):
+        for segment in self._segments:
+            if segment.name == name:
+                return segment
+        raise KeyError(name)
+
+    def segment(self, name):
+        """
+        Materialize a segment and return a view of its content.
+
+        :type name: str
+        :rtype: memoryview
+        """
+        if self.closed:
+            raise ValueError('I/O operation on closed image')
+        segment = self._get_segment(name)
+        length = self._materialize(segment)
+        return memoryview(segment.backing)[segment.backing_offset:segment.backing_offset + length]
+
+    def is_materialized(self, name):
+        """
+        :type name: str
+        :rtype: bool
+        """
+        return self._get_segment(name).length is not None
+
+    @property
+    def materialized_segments(self):
+        """
+        :rtype: list[str]
+        """
+        return [segment.name for segment in self._segments if segment.length is not None]
+
+    def _mapped(self, start, end):
+        """
+        Segments overlapping [start, end) whose content lives outside the buffer.
+
+        :rtype: list[ImageSegment]
+        """
+        return [segment for segment in self._segments
+                if segment.backing is not None and segment.backing is not self.buffer
+                and segment.overlaps(start, end)]
+
+    def view(self, start, end):
+        """
+        Zero-copy view of [start, end) when it lies in a single backing object,
+        otherwise a view of an assembled copy.
+
+        :type start: int
+        :type end: int
+        :rtype: memoryview
+        """
+        end = min(end, len(self.buffer))
+        self._ensure(start, end)
+        mapped = self._mapped(start, end)
+        if not mapped:
+            return memoryview(self.buffer)[start:end]
+        if len(mapped) == 1:
+            segment = mapped[0]
+            if segment.vaddr <= start and end <= segment.vaddr + segment.length:
+                offset = segment.backing_offset + start - segment.vaddr
+                return memoryview(segment.backing)[offset:offset + end - start]
+        out = bytearray(memoryview(self.buffer)[start:end])
+        for segment in mapped:
+            lo = max(start, segment.vaddr)
+            hi = min(end, segment.vaddr + segment.length)
+            if lo < hi:
+                offset = segment.backing_offset + lo - segment.vaddr
+                out[lo - start:hi - start] = memoryview(segment.backing)[offset:offset + hi - lo]
+        return memoryview(out)
+
+    def read(self, n=-1):
+        """
+        :type n: int
+        :rtype: bytes
+        """
+        start = self._pos
+        end = len(self.buffer) if n is None or n < 0 else min(len(self.buffer), start + n)
+        if end <= start:
+            return b''
+        self._pos = end
+        return view_bytes(self.view(start, end))
+
+    def seek(self, off, whence=0):
+        """
+        :type off: int
+        :type whence: int
+        """
+        if whence == 1:
+            off += self._pos
+        elif whence == 2:
+            off += len(self.buffer)
+        self._pos = off
+
+    def tell(self):
+        """
+        :rtype: int
+        """
+        return self._pos
+
+    def close(self):
+        """
+        Drop the segment sources and the views of mapped files, so the files
+        can be closed. The image can't be read afterwards.
+        """
+        self.closed = True
+        for segment in self._segments:
+            segment.source = None
+            segment.backing = None
+
+
 class NxoFileBase(object):
+    # the file load_nxo() opened for this module, closed by close()
+    _file = None
+
     # segment = (content, file offset, vaddr, vsize)
-    def __init__(self, text, ro, data, bsssize):
+    def __init__(self, text, ro, data, bsssize, lazy=False, executor=None, eager=False, state=None,
+                 hashes=None, verify=False, previous=None):
         """
-        :type text: tuple[bytes, int, int, int]
-        :type ro: tuple[bytes, int, int, int]
-        :type data: tuple[bytes, int, int, int]
+        :type text: tuple[bytes | SegmentSource, int, int, int]
+        :type ro: tuple[bytes | SegmentSource, int, int, int]
+        :type data: tuple[bytes | SegmentSource, int, int, int]
         :type bsssize: int
+        :param lazy: materialize SegmentSource content only once it is read
+        :type lazy: bool
+        :param executor: materialize the segments concurrently on it (ignored if lazy)
+        :type executor: concurrent.futures.Executor | None
+        :param eager: parse symbols, relocations, .plt, .got, eh_frame_hdr and sections
+                      now instead of on first use
+        :type eager: bool
+        :param state: result of get_state() for this file, restored instead of parsing
+        :type state: dict | None
+        :param hashes: expected SHA-256 of text, ro and data, None where not checked
+        :type hashes: tuple[bytes | None, bytes | None, bytes | None] | None
+        :param verify: check the hashes while loading, see verify_hashes
+        :type verify: bool
+        :param previous: get_state() of an earlier build, stages whose input segments
+                         have the same hashes are restored from it instead of parsed
+        :type previous: dict | None
         """
-        self.text = text
-        self.ro = ro
-        self.data = data
+        self._segments = (text, ro, data)
         self.bsssize = bsssize
         self.textoff = text[2]
         self.textsize = text[3]
@@ -152,22 +830,25 @@ class NxoFileBase(object):
         self.dataoff = data[2]
         flatsize = data[2] + data[3]
 
-        full = text[0]
-        if ro[2] >= len(full):
-            full += b'\x00' * (ro[2] - len(full))
-        else:
-            print('truncating .text?')
-            full = full[:ro[2]]
-        full += ro[0]
-        if data[2] > len(full):
-            full += b'\x00' * (data[2] - len(full))
-        else:
-            print('truncating .rodata?')
-        full += data[0]
-        f = BinFile(BytesIO(full))
+        self.lazy = lazy
+        self.image = image = NxoImage(flatsize, verify=verify)
+        for (content, _, vaddr, _), limit, name, expected_hash in zip(
+            [text, ro, data], [ro[2], data[2], flatsize], ['.text', '.rodata', '.data'], hashes or (None,) * 3,
+        ):
+            if not isinstance(content, SegmentSource):
+                content = SegmentSource.from_bytes(content)
+            image.add_segment(name, vaddr, limit, content, lazy=lazy or executor is not None,
+                              expected_hash=expected_hash)
+        if not lazy:
+            image.materialize(executor)
+        f = BinFile(image)
 
         self.binfile = f
 
+        if state is not None:
+            self._restore_state(state)
+            return
+
         # read MOD
         self.modoff = f.read_from('I', 4)
 
@@ -209,18 +890,27 @@ class NxoFileBase(object):
         self.dynamic = dynamic = {}
         for i in MULTIPLE_DTS:
             dynamic[i] = []
-        for _ in iter_range((flatsize - self.dynamicoff) // 0x10):
-            tag, val = f.read('II' if self.armv7 else 'QQ')
+        dynfmt = 'II' if self.armv7 else 'QQ'
+        self.dynamicsize = 0
+        for tag, val in f.iter_array(dynfmt, (flatsize - self.dynamicoff) // 0x10, chunk=0x20):
+            self.dynamicsize += get_struct(dynfmt).size
             if tag == DT.NULL:
                 break
             if tag in MULTIPLE_DTS:
                 dynamic[tag].append(val)
             else:
                 dynamic[tag] = val
-        self.dynamicsize = f.tell() - self.dynamicoff
         builder.add_section('.dynamic', self.dynamicoff, end=self.dynamicoff + self.dynamicsize)
         builder.add_section('.eh_frame_hdr', self.unwindoff, end=self.unwindend)
 
+        if previous is not None:
+            stages = self._reusable_stages(previous)
+            if stages is not None:
+                self._restore_state(previous, **stages)
+                if eager:
+                    self.sections
+                return
+
         # read .dynstr
         if DT.STRTAB in dynamic and DT.STRSZ in dynamic:
             f.seek(dynamic[DT.STRTAB])
@@ -228,6 +918,7 @@ class NxoFileBase(object):
         else:
             self.dynstr = b'\x00'
             print('warning: no dynstr')
+        self._dynstr_table = StringTable(self.dynstr)
 
         for startkey, szkey, name in [
             (DT.STRTAB, DT.STRSZ, '.dynstr'),
@@ -250,6 +941,449 @@ class NxoFileBase(object):
         #    if build_id >= 0:
         #        builder.add_section('.note.gnu.build-id', build_id, size=0x20)
 
+        self.needed = [self.get_dynstr(i) for i in self.dynamic[DT.NEEDED]]
+
+        # everything below is parsed on first use, see the stage properties
+        self._hash_tables_loaded = False
+        self._sysv_hash = None
+        self._gnu_hash = None
+        self._symbol_table = None
+        self._symbols = None
+        self._relocation_tables = None
+        self._relocation_table = None
+        self._relocations = None
+        self._plt_got = None
+        self._got = None
+        self._eh_table = None
+        self._eh_frame = False
+        self._plt_entries = None
+        self._sections = None
+        self._section_index = None
+        self._symbol_index = None
+        self._path_or_name = None
+        if eager:
+            self.sections
+
+    @property
+    def text(self):
+        """
+        :rtype: tuple[memoryview, int, int, int]
+        """
+        return self._materialized_segment(0)
+
+    @property
+    def ro(self):
+        """
+        :rtype: tuple[memoryview, int, int, int]
+        """
+        return self._materialized_segment(1)
+
+    @property
+    def data(self):
+        """
+        :rtype: tuple[memoryview, int, int, int]
+        """
+        return self._materialized_segment(2)
+
+    def _materialized_segment(self, i):
+        _, fileoff, vaddr, vsize = self._segments[i]
+        return self.image.segment(('.text', '.rodata', '.data')[i]), fileoff, vaddr, vsize
+
+    @property
+    def materialized_segments(self):
+        """
+        Names of the segments whose content has been fully loaded.
+
+        :rtype: list[str]
+        """
+        return self.image.materialized_segments
+
+    def is_materialized(self, name):
+        """
+        :type name: str
+        :rtype: bool
+        """
+        return self.image.is_materialized(name)
+
+    @property
+    def plt_entries(self):
+        """
+        :rtype: list[tuple[int, int]]
+        """
+        if self._plt_entries is None:
+            self.relocation_table
+            self._plt_entries = []
+            if self._plt_got is not None and not self.armv7:
+                self._scan_plt(*self._plt_got)
+        return self._plt_entries
+
+    @property
+    def sections(self):
+        """
+        :rtype: list[tuple[int, int, str, SegmentKind]]
+        """
+        if self._sections is None:
+            self._layout()
+            self.plt_entries
+            self._sections = []
+            for start, end, name, kind in self.segment_builder.flatten():
+                self._sections.append((start, end, name, kind))
+        return self._sections
+
+    @property
+    def symbols(self):
+        """
+        :rtype: list[ElfSym]
+        """
+        if self._symbols is None:
+            self._load_symbols()
+        return self._symbols
+
+    @property
+    def relocation_table(self):
+        """
+        :rtype: RelocationTable
+        """
+        if self._relocation_table is None:
+            self._load_relocations()
+        return self._relocation_table
+
+    @property
+    def got_start(self):
+        """
+        :rtype: int | None
+        """
+        return self._find_got()[0]
+
+    @property
+    def got_end(self):
+        """
+        :rtype: int | None
+        """
+        return self._find_got()[1]
+
+    @property
+    def eh_table(self):
+        """
+        :rtype: list[tuple[int, int]]
+        """
+        if self._eh_table is None:
+            self._load_eh_table()
+        return self._eh_table
+
+    def _layout(self):
+        """
+        Run every stage that adds sections, except the .plt scan of .text.
+        """
+        self._load_hash_tables()
+        self.symbols
+        self.relocation_table
+        self._find_got()
+        self.eh_table
+
+    def close(self):
+        """
+        Release the image and the file load_nxo() mapped for this module.
+        Results of the stages that already ran stay available, everything
+        that still has to read the image fails.
+        """
+        self.image.close()
+        self._segments = tuple((None,) + segment[1:] for segment in self._segments)
+        self._eh_frame = False
+        if self._file is not None:
+            _close_mapping(self._file)
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def verify_hashes(self, executor=None):
+        """
+        Check the segment hashes from the file header (NSO only). Segments already
+        checked while loading (verify=True) are not hashed again.
+
+        :param executor: load and hash the remaining segments concurrently on it
+        :type executor: concurrent.futures.Executor | None
+        :return: segments whose content does not match, empty if all do
+        :rtype: list[SegmentHashMismatch]
+        """
+        return self.image.hash_mismatches(executor)
+
+    _MOD0_STATE = ('modoff', 'dynamicoff', 'bssoff', 'bssend', 'unwindoff', 'unwindend', 'moduleoff', 'isLibnx',
+                   'armv7')
+
+    # sections read by the stages up to and including _layout()
+    _LAYOUT_INPUTS = ('.dynstr', '.dynsym', '.hash', '.gnu.hash', '.rel.dyn', '.rela.dyn', '.relr.dyn',
+                      '.rel.plt', '.rela.plt', '.eh_frame_hdr', '.eh_frame')
+
+    def _segment_headers(self):
+        """
+        :return: (vaddr, size, expected hash) of text, ro and data
+        :rtype: list[tuple[int, int, bytes | None]]
+        """
+        return [(vaddr, vsize, segment.expected_hash)
+                for (_, _, vaddr, vsize), segment in zip(self._segments, self.image._segments)]
+
+    def _reusable_stages(self, previous):
+        """
+        Which parse results of an earlier build still hold for this one, called
+        once MOD0 and .dynamic are read. Segments are compared by their header
+        hashes; everything up to _layout() is reused if MOD0 and .dynamic are the
+        same and the segments the other stages read are unchanged, the .plt scan
+        also needs .text and the path lookup .rodata.
+
+        :param previous: get_state() of the earlier build, stages missing from it
+                         (see _computed_state()) are not reused
+        :type previous: dict
+        :return: _restore_state() arguments, None if nothing can be reused
+        :rtype: dict | None
+        """
+        headers = self._segment_headers()
+        old = previous.get('segment_headers')
+        if old is None or 'symbols' not in previous or [h[:2] for h in headers] != [tuple(h[:2]) for h in old]:
+            return None
+        for name in self._MOD0_STATE:
+            if getattr(self, name) != previous[name]:
+                return None
+        if self.isLibnx and [self.libnx_got_start, self.libnx_got_end] != list(previous['libnx_got']):
+            return None
+        if self.dynamicsize != previous['dynamicsize'] or self.dynamic != dict(previous['dynamic']):
+            return None
+        unchanged = [h[2] is not None and h[2] == o[2] for h, o in zip(headers, old)]
+        for name, start, end in previous['builder_sections']:
+            if name not in self._LAYOUT_INPUTS:
+                continue
+            for (vaddr, vsize, _), same in zip(headers, unchanged):
+                if not same and vaddr < end and start < vaddr + vsize:
+                    return None
+        return dict(plt=unchanged[0] and 'plt_entries' in previous,
+                    path_or_name=unchanged[1] and 'path_or_name' in previous)
+
+    _STATE_HEADER = ('modoff', 'dynamicoff', 'bssoff', 'bssend', 'unwindoff', 'unwindend', 'moduleoff',
+                     'datasize', 'bsssize', 'isLibnx', 'armv7', 'offsize', 'dynamicsize', 'dynstr', 'needed')
+
+    def get_state(self):
+        """
+        Everything parsed from the module, as plain values (for ParseCache).
+        Runs every analysis stage.
+
+        :rtype: dict
+        """
+        self.sections
+        self.get_path_or_name()
+        return self._computed_state()
+
+    def _computed_state(self):
+        """
+        get_state() without running any stage. The stages up to _layout() are
+        included only if all of them ran, the .plt scan (with the section list)
+        and the path lookup only if they ran as well.
+
+        :rtype: dict
+        """
+        state = dict((name, getattr(self, name)) for name in self._STATE_HEADER)
+        if self.isLibnx:
+            state['libnx_got'] = (self.libnx_got_start, self.libnx_got_end)
+        state['dynamic'] = [(int(tag), value) for tag, value in self.dynamic.items()]
+        state['segment_headers'] = self._segment_headers()
+        if not (self._hash_tables_loaded and self._symbols is not None and self._relocation_tables is not None
+                and self._got is not None and self._eh_table is not None):
+            return state
+        state['sysv_hash'] = self._sysv_hash
+        state['gnu_hash'] = self._gnu_hash
+        state['symbols'] = [(sym.name, sym.info, sym.other, sym.shndx, sym.value, sym.size) for sym in self._symbols]
+        state['relocations'] = [table.get_state() for table in self._relocation_tables]
+        state['plt_got'] = self._plt_got
+        state['got'] = self._got
+        state['eh_table'] = self._eh_table
+        state['builder_sections'] = [(section.name, section.range.start, section.range.end)
+                                     for segment in self.segment_builder.segments for section in segment.sections]
+        if self._plt_entries is not None:
+            state['plt_entries'] = self._plt_entries
+            # with every stage done this only flattens the section list
+            state['sections'] = [(start, end, name, kind.value) for start, end, name, kind in self.sections]
+        if self._path_or_name is not None:
+            state['path_or_name'] = self._path_or_name[0]
+        return state
+
+    def _restore_state(self, state, plt=True, path_or_name=True):
+        """
+        :type state: dict
+        :param plt: restore the .plt scan (and with it the section list)
+        :type plt: bool
+        :param path_or_name: restore the result of get_path_or_name()
+        :type path_or_name: bool
+        """
+        for name in self._STATE_HEADER:
+            setattr(self, name, state[name])
+        if self.isLibnx:
+            self.libnx_got_start, self.libnx_got_end = state['libnx_got']
+
+        self.segment_builder = builder = SegmentBuilder()
+        for off, sz, name, kind in [
+            (self.textoff, self.textsize, ".text", SegmentKind.CODE),
+            (self.rodataoff, self.rodatasize, ".rodata", SegmentKind.CONST),
+            (self.dataoff, self.datasize, ".data", SegmentKind.DATA),
+            (self.bssoff, self.bsssize, ".bss", SegmentKind.BSS),
+        ]:
+            builder.add_segment(off, sz, name, kind)
+        for name, start, end in state['builder_sections']:
+            if plt or name != '.plt':
+                builder.add_section(name, start, end=end)
+
+        self.dynamic = dict(state['dynamic'])
+        self._dynstr_table = StringTable(self.dynstr)
+        self._hash_tables_loaded = True
+        self._sysv_hash = state['sysv_hash']
+        self._gnu_hash = state['gnu_hash']
+        self._symbol_table = None
+        self._symbols = [ElfSym(*sym) for sym in state['symbols']]
+        self._relocation_tables = [RelocationTable.from_state(table) for table in state['relocations']]
+        self._relocation_table = RelocationTable.concat(self._relocation_tables)
+        self._relocations = None
+        self._plt_got = state['plt_got']
+        self._got = state['got']
+        self._eh_table = state['eh_table']
+        self._eh_frame = False
+        self._plt_entries = None
+        self._sections = None
+        if plt:
+            self._plt_entries = state['plt_entries']
+            self._sections = [(start, end, name, SegmentKind(kind)) for start, end, name, kind in state['sections']]
+        self._section_index = None
+        self._symbol_index = None
+        self._path_or_name = (state['path_or_name'],) if path_or_name else None
+
+    def section_for_address(self, address):
+        """
+        :type address: int
+        :return: the (start, end, name, kind) entry of sections containing address
+        :rtype: tuple[int, int, str, SegmentKind] | None
+        """
+        return self._get_section_index().find(address)
+
+    def sections_for_addresses(self, addresses):
+        """
+        :type addresses: collections.Iterable[int]
+        :rtype: list[tuple[int, int, str, SegmentKind] | None]
+        """
+        return self._get_section_index().find_many(addresses)
+
+    def symbol_for_address(self, address):
+        """
+        Find the defined symbol covering address. Symbols without a size
+        cover everything up to the next symbol or the end of their section.
+
+        :type address: int
+        :return: the symbol and the offset of address into it
+        :rtype: tuple[ElfSym, int] | None
+        """
+        sym = self._get_symbol_index().find(address)
+        if sym is None:
+            return None
+        return sym, address - sym.value
+
+    def symbols_for_addresses(self, addresses):
+        """
+        :type addresses: collections.Iterable[int]
+        :rtype: list[tuple[ElfSym, int] | None]
+        """
+        addresses = list(addresses)
+        return [None if sym is None else (sym, address - sym.value)
+                for address, sym in zip(addresses, self._get_symbol_index().find_many(addresses))]
+
+    def _get_section_index(self):
+        """
+        :rtype: IntervalIndex
+        """
+        if self._section_index is None:
+            self._section_index = index = IntervalIndex()
+            for section in self.sections:
+                index.add(section[0], section[1], section)
+        return self._section_index
+
+    def _get_symbol_index(self):
+        """
+        :rtype: IntervalIndex
+        """
+        if self._symbol_index is None:
+            # of symbols sharing an address, keep the largest
+            by_value = {}
+            for sym in self.symbols:
+                if sym.shndx and sym.value:
+                    other = by_value.get(sym.value)
+                    if other is None or sym.size > other.size:
+                        by_value[sym.value] = sym
+            values = sorted(by_value)
+            self._symbol_index = index = IntervalIndex()
+            for i, value in enumerate(values):
+                sym = by_value[value]
+                end = value + sym.size
+                if not sym.size:
+                    section = self.section_for_address(value)
+                    end = section[1] if section is not None else value + 1
+                    if i + 1 < len(values):
+                        end = min(end, values[i + 1])
+                elif i + 1 < len(values):
+                    # nested symbols end the outer one early, keep the index flat
+                    end = min(end, values[i + 1])
+                index.add(value, end, sym)
+        return self._symbol_index
+
+    def lookup_symbol(self, name):
+        """
+        Find the symbol this module defines under name, through its .gnu.hash
+        or .hash, or a name index if it has neither.
+
+        :type name: str | bytes
+        :rtype: ElfSym | None
+        """
+        return self._get_symbol_table().lookup(name, self.symbols)
+
+    def lookup_symbols(self, names):
+        """
+        :type names: collections.Iterable[str | bytes]
+        :return: the symbol (or None) for each name, in order
+        :rtype: list[ElfSym | None]
+        """
+        table = self._get_symbol_table()
+        symbols = self.symbols
+        return [table.lookup(name, symbols) for name in names]
+
+    def _get_symbol_table(self):
+        """
+        :rtype: GnuHashTable | SysvHashTable | DictSymbolTable
+        """
+        if self._symbol_table is None:
+            self._load_hash_tables()
+            f = self.binfile
+            if self._gnu_hash is not None:
+                start, nbuckets, symoffset, bloom_size, bloom_shift, nchains = self._gnu_hash
+                f.seek(start)
+                bloom = f.read_array('I' if self.armv7 else 'Q', bloom_size)
+                buckets = array('I', f.read_array('I', nbuckets))
+                chains = array('I', f.read_array('I', nchains))
+                self._symbol_table = GnuHashTable(symoffset, bloom_shift, bloom, buckets, chains, self.offsize * 8)
+            elif self._sysv_hash is not None:
+                start, nbucket, nchain = self._sysv_hash
+                f.seek(start)
+                buckets = array('I', f.read_array('I', nbucket))
+                chains = array('I', f.read_array('I', nchain))
+                self._symbol_table = SysvHashTable(buckets, chains)
+            else:
+                self._symbol_table = DictSymbolTable(self.symbols)
+        return self._symbol_table
+
+    def _load_hash_tables(self):
+        if self._hash_tables_loaded:
+            return
+        self._hash_tables_loaded = True
+        f = self.binfile
+        dynamic = self.dynamic
+        builder = self.segment_builder
         if DT.HASH in dynamic:
             hash_start = dynamic[DT.HASH]
             f.seek(hash_start)
@@ -258,199 +1392,255 @@ class NxoFileBase(object):
             f.skip(nchain * 4)
             hash_end = f.tell()
             builder.add_section('.hash', hash_start, end=hash_end)
+            self._sysv_hash = (hash_start + 8, nbucket, nchain)
 
         if DT.GNU_HASH in dynamic:
             gnuhash_start = dynamic[DT.GNU_HASH]
             f.seek(gnuhash_start)
             nbuckets, symoffset, bloom_size, bloom_shift = f.read('IIII')
             f.skip(bloom_size * self.offsize)
-            buckets = [f.read('I') for _ in range(nbuckets)]
+            buckets = f.read_array('I', nbuckets)
 
             max_symix = max(buckets) if buckets else 0
-            if max_symix >= symoffset:
-                f.skip((max_symix - symoffset) * 4)
-                while (f.read('I') & 1) == 0:
-                    pass
             gnuhash_end = f.tell()
+            if max_symix >= symoffset:
+                gnuhash_end += (max_symix - symoffset) * 4
+                f.seek(gnuhash_end)
+                for chain in f.iter_array('I', chunk=0x40):
+                    gnuhash_end += 4
+                    if chain & 1:
+                        break
             builder.add_section('.gnu.hash', gnuhash_start, end=gnuhash_end)
+            chains_start = gnuhash_start + 0x10 + bloom_size * self.offsize + nbuckets * 4
+            self._gnu_hash = (gnuhash_start + 0x10, nbuckets, symoffset, bloom_size, bloom_shift,
+                              (gnuhash_end - chains_start) // 4)
 
-        self.needed = [self.get_dynstr(i) for i in self.dynamic[DT.NEEDED]]
-
+    def _load_symbols(self):
         # load .dynsym
-        self.symbols = symbols = []
+        f = self.binfile
+        dynamic = self.dynamic
+        self._symbols = symbols = []
         if DT.SYMTAB in dynamic and DT.STRTAB in dynamic:
-            f.seek(dynamic[DT.SYMTAB])
-            while True:
-                if dynamic[DT.SYMTAB] < dynamic[DT.STRTAB] <= f.tell():
-                    break
+            symtab = dynamic[DT.SYMTAB]
+            symfmt = 'IIIBBH' if self.armv7 else 'IBBHQQ'
+            symsize = get_struct(symfmt).size
+            count = None
+            if symtab < dynamic[DT.STRTAB]:
+                count = (dynamic[DT.STRTAB] - symtab + symsize - 1) // symsize
+            f.seek(symtab)
+            nread = 0
+            for sym in f.iter_array(symfmt, count):
+                nread += 1
                 if self.armv7:
-                    st_name, st_value, st_size, st_info, st_other, st_shndx = f.read('IIIBBH')
+                    st_name, st_value, st_size, st_info, st_other, st_shndx = sym
                 else:
-                    st_name, st_info, st_other, st_shndx, st_value, st_size = f.read('IBBHQQ')
+                    st_name, st_info, st_other, st_shndx, st_value, st_size = sym
                 if st_name > len(self.dynstr):
                     break
-                symbols.append(ElfSym(self.get_dynstr(st_name), st_info, st_other, st_shndx, st_value, st_size))
-            builder.add_section('.dynsym', dynamic[DT.SYMTAB], end=f.tell())
+                symbols.append(ElfSym(st_name, st_info, st_other, st_shndx, st_value, st_size, self._dynstr_table))
+            self.segment_builder.add_section('.dynsym', symtab, end=symtab + nread * symsize)
 
-        self.plt_entries = []
-        self.relocations = []
-        locations = set()
-        plt_got_end = None
+    def _load_relocations(self):
+        dynamic = self.dynamic
+        tables = []
         if DT.REL in dynamic and DT.RELSZ in dynamic:
-            locations |= self.process_relocations(f, symbols, dynamic[DT.REL], dynamic[DT.RELSZ])
+            tables.append(self.process_relocations(dynamic[DT.REL], dynamic[DT.RELSZ]))
 
         if DT.RELA in dynamic and DT.RELASZ in dynamic:
-            locations |= self.process_relocations(f, symbols, dynamic[DT.RELA], dynamic[DT.RELASZ])
+            tables.append(self.process_relocations(dynamic[DT.RELA], dynamic[DT.RELASZ]))
 
         if DT.RELR in dynamic:
-            locations |= self.process_relocations_relr(f, dynamic[DT.RELR], dynamic[DT.RELRSZ])
+            tables.append(self.process_relocations_relr(dynamic[DT.RELR], dynamic[DT.RELRSZ]))
 
         if DT.JMPREL in dynamic and DT.PLTRELSZ in dynamic:
-            pltlocations = self.process_relocations(f, symbols, dynamic[DT.JMPREL], dynamic[DT.PLTRELSZ])
-            locations |= pltlocations
+            plt_table = self.process_relocations(dynamic[DT.JMPREL], dynamic[DT.PLTRELSZ])
+            tables.append(plt_table)
 
-            plt_got_start = min(pltlocations)
-            plt_got_end = max(pltlocations) + self.offsize
+            pltlocations = plt_table.locations
+            plt_got_start = int(pltlocations[0])
+            plt_got_end = int(pltlocations[-1]) + self.offsize
             if DT.PLTGOT in dynamic:
-                builder.add_section('.got.plt', dynamic[DT.PLTGOT], end=plt_got_end)
+                self.segment_builder.add_section('.got.plt', dynamic[DT.PLTGOT], end=plt_got_end)
+
+            self._plt_got = (plt_got_start, plt_got_end)
 
+        self._relocation_tables = tables
+        self._relocation_table = RelocationTable.concat(tables)
+
+    def _find_got(self):
+        """
+        :return: (got_start, got_end), both None if there is no .got
+        :rtype: tuple[int | None, int | None]
+        """
+        if self._got is not None:
+            return self._got
+        self._got = (None, None)
+        if self.isLibnx:
+            self.segment_builder.add_section('.got', self.libnx_got_start, end=self.libnx_got_end)
+            return self._got
+
+        # try to find the ".got" which should follow the ".got.plt"
+        dynamic = self.dynamic
+        locations = self.relocation_table
+        plt_got_end = self._plt_got[1] if self._plt_got is not None else None
+        good = False
+        got_start = (plt_got_end if plt_got_end is not None else self.dynamicoff + self.dynamicsize)
+        got_end = self.offsize + got_start
+        while (got_end in locations or (plt_got_end is None and got_end < dynamic[DT.INIT_ARRAY])) and (
+                DT.INIT_ARRAY not in dynamic or got_end < dynamic[DT.INIT_ARRAY]
+                or dynamic[DT.INIT_ARRAY] < got_start):
+            good = True
+            got_end += self.offsize
+
+        if good:
+            self._got = (got_start, got_end)
+            self.segment_builder.add_section('.got', got_start, end=got_end)
+        return self._got
+
+    @property
+    def eh_frame(self):
+        """
+        Lazily decoded .eh_frame, None if there is no usable .eh_frame_hdr.
+
+        :rtype: EhFrame | None
+        """
+        if self._eh_frame is False:
+            self._eh_frame = None
             if not self.armv7:
-                f.seek(0)
-                text = f.read(self.textsize)
-                last = 12
-                while True:
-                    pos = text.find(struct.pack('<I', 0xD61F0220), last)
-                    if pos == -1:
-                        break
-                    last = pos + 1
-                    if (pos % 4) != 0:
-                        continue
-                    off = pos - 12
-                    a, b, c, d = struct.unpack_from('<IIII', text, off)
-                    if d == 0xD61F0220 and (a & 0x9f00001f) == 0x90000010 and (b & 0xffe003ff) == 0xf9400211:
-                        base = off & ~0xFFF
-                        immhi = (a >> 5) & 0x7ffff
-                        immlo = (a >> 29) & 3
-                        paddr = base + ((immlo << 12) | (immhi << 14))
-                        poff = ((b >> 10) & 0xfff) << 3
-                        target = paddr + poff
-                        if plt_got_start <= target < plt_got_end:
-                            self.plt_entries.append((off, target))
-                if len(self.plt_entries) > 0:
-                    builder.add_section('.plt', min(self.plt_entries)[0], end=max(self.plt_entries)[0] + 0x10)
-
-        if not self.isLibnx:
-            # try to find the ".got" which should follow the ".got.plt"
-            good = False
-            got_start = (plt_got_end if plt_got_end is not None else self.dynamicoff + self.dynamicsize)
-            got_end = self.offsize + got_start
-            while (got_end in locations or (plt_got_end is None and got_end < dynamic[DT.INIT_ARRAY])) and (
-                    DT.INIT_ARRAY not in dynamic or got_end < dynamic[DT.INIT_ARRAY]
-                    or dynamic[DT.INIT_ARRAY] < got_start):
-                good = True
-                got_end += self.offsize
-
-            if good:
-                self.got_start = got_start
-                self.got_end = got_end
-                builder.add_section('.got', self.got_start, end=self.got_end)
-        else:
-            builder.add_section('.got', self.libnx_got_start, end=self.libnx_got_end)
-
-        self.eh_table = []
-        if not self.armv7:
-            f.seek(self.unwindoff)
-            version, eh_frame_ptr_enc, fde_count_enc, table_enc = f.read('BBBB')
-            if not any(i == 0xff for i in (eh_frame_ptr_enc, fde_count_enc, table_enc)):  # DW_EH_PE_omit
-                # assert eh_frame_ptr_enc == 0x1B # DW_EH_PE_pcrel | DW_EH_PE_sdata4
-                # assert fde_count_enc == 0x03    # DW_EH_PE_absptr | DW_EH_PE_udata4
-                # assert table_enc == 0x3B        # DW_EH_PE_datarel | DW_EH_PE_sdata4
-                if eh_frame_ptr_enc == 0x1B and fde_count_enc == 0x03 and table_enc == 0x3B:
-                    base_offset = f.tell()
-                    eh_frame = base_offset + f.read('i')
-
-                    fde_count = f.read('I')
-                    # assert 8 * fde_count == self.unwindend - f.tell()
-                    if 8 * fde_count <= self.unwindend - f.tell():
-                        for i in range(fde_count):
-                            pc = self.unwindoff + f.read('i')
-                            entry = self.unwindoff + f.read('i')
-                            self.eh_table.append((pc, entry))
-
-                    # TODO: we miss the last one, but better than nothing
-                    last_entry = sorted(self.eh_table, key=lambda x: x[1])[-1][1]
-                    builder.add_section('.eh_frame', eh_frame, end=last_entry)
-
-        self.sections = []
-        for start, end, name, kind in builder.flatten():
-            self.sections.append((start, end, name, kind))
-
-    def process_relocations(self, f, symbols, offset, size):
-        """
-        :type f: BinFile
-        :type symbols: list[ElfSym]
+                try:
+                    self._eh_frame = EhFrame(self.image.view, self.unwindoff, self.unwindend)
+                except NxoException:
+                    pass
+        return self._eh_frame
+
+    def fde_for_address(self, address):
+        """
+        Unwind info of the function containing address, its start_address and
+        end_address are the function bounds.
+
+        :type address: int
+        :rtype: nxo64.ehframe.Fde | None
+        """
+        eh_frame = self.eh_frame
+        return eh_frame.lookup(address) if eh_frame is not None else None
+
+    def _load_eh_table(self):
+        eh_frame = self.eh_frame
+        self._eh_table = []
+        if eh_frame is not None and len(eh_frame):
+            try:
+                end = eh_frame.end
+            except NxoException as e:
+                # a table pointing at corrupt records is dropped, like a missing one
+                print('warning: %s' % e)
+                return
+            self._eh_table = eh_frame.entries()
+            self.segment_builder.add_section('.eh_frame', eh_frame.start, end=end)
+
+    def _scan_plt(self, plt_got_start, plt_got_end):
+        """
+        :type plt_got_start: int
+        :type plt_got_end: int
+        """
+        self._plt_entries = find_plt_stubs(self.image.view(0, self.textsize), plt_got_start, plt_got_end)
+        if len(self._plt_entries) > 0:
+            self.segment_builder.add_section('.plt', min(self._plt_entries)[0],
+                                             end=max(self._plt_entries)[0] + 0x10)
+
+    @property
+    def relocations(self):
+        """
+        Tuple view of ``relocation_table``, in REL, RELA, RELR, JMPREL order.
+
+        :rtype: list[tuple[int, int, ElfSym | None, int | None]]
+        """
+        if self._relocations is None:
+            self.relocation_table
+            self._relocations = []
+            for table in self._relocation_tables:
+                self._relocations.extend(table.to_list(self.symbols))
+        return self._relocations
+
+    def relocated_image(self, base, resolver=None, into=None):
+        """
+        The module image as loaded at base, up to the end of .bss, with its
+        relocations applied.
+
+        :type base: int
+        :param resolver: address of an undefined symbol, None if it can't be resolved
+                         (unresolved weak symbols are 0); called once per symbol
+        :type resolver: ((ElfSym) -> int | None) | None
+        :param into: writable buffer (e.g. an anonymous mmap) of at least the image size
+                     to build the image in, instead of a new bytearray
+        :type into: bytearray | mmap.mmap | None
+        :return: the image, and the relocations that could not be applied
+        :rtype: tuple[bytearray | mmap.mmap, RelocationTable]
+        """
+        size = max(len(self.image.buffer), self.bssend)
+        if into is None:
+            into = bytearray(size)
+        elif len(into) < size:
+            raise NxoException('buffer too small for the image (0x%X < 0x%X)' % (len(into), size))
+        into[:len(self.image.buffer)] = self.image.view(0, len(self.image.buffer))
+        values = []
+        for i, sym in enumerate(self.symbols):
+            if sym.shndx == SHN_ABS:
+                values.append(sym.value)
+            elif sym.shndx:
+                values.append(base + sym.value)
+            elif i == 0:
+                values.append(0)  # the null symbol
+            else:
+                value = resolver(sym) if resolver is not None else None
+                if value is None and sym.bind == STB.WEAK:
+                    value = 0
+                values.append(value)
+        return into, apply_relocations(into, self.relocation_table, base, values, self.armv7)
+
+    def process_relocations(self, offset, size):
+        """
         :type offset: int
         :type size: int
-        :rtype: set[int]
+        :rtype: RelocationTable
         """
-        locations = set()
-        f.seek(offset)
         relocsize = 8 if self.armv7 else 0x18
-        for _ in iter_range(size // relocsize):
-            # NOTE: currently assumes all armv7 relocs have no addends,
-            # and all 64-bit ones do.
-            if self.armv7:
-                offset, info = f.read('II')
-                addend = None
-                r_type = info & 0xff
-                r_sym = info >> 8
-            else:
-                offset, info, addend = f.read('QQq')
-                r_type = info & 0xffffffff
-                r_sym = info >> 32
-
-            sym = symbols[r_sym] if r_sym != 0 else None
-
-            if r_type != R_AArch64.TLSDESC and r_type != R_Arm.TLS_DESC:
-                locations.add(offset)
-            self.relocations.append((offset, r_type, sym, addend))
-        return locations
-
-    def process_relocations_relr(self, f, offset, size):
-        locations = set()
-        f.seek(offset)
-        relocsize = 8
-        for _ in iter_range(size // relocsize):
-            entry = f.read('Q')
-            if entry & 1:
-                entry >>= 1
-                i = 0
-                while i < (relocsize * 8) - 1:
-                    if entry & (1 << i):
-                        locations.add(where + i * relocsize)
-                        self.relocations.append((where + i * relocsize, R_FAKE_RELR, None, 0))
-                    i += 1
-                where += relocsize * ((relocsize * 8) - 1)
-            else:
-                # Where
-                where = entry
-                locations.add(where)
-                self.relocations.append((where, R_FAKE_RELR, None, 0))
-                where += relocsize
-        return locations
+        # NOTE: currently assumes all armv7 relocs have no addends,
+        # and all 64-bit ones do.
+        return RelocationTable.from_bytes(self.image.view(offset, offset + size // relocsize * relocsize),
+                                          self.armv7)
+
+    def process_relocations_relr(self, offset, size):
+        """
+        :type offset: int
+        :type size: int
+        :rtype: RelocationTable
+        """
+        return RelocationTable.from_relr(self.image.view(offset, offset + size // 8 * 8))
 
     def get_dynstr(self, o):
         """
         :type o: int
         """
-        return ascii_string(self.dynstr[o:self.dynstr.index(b'\x00', o)])
+        return self._dynstr_table.get(o)
 
     def get_path_or_name(self):
+        """
+        :rtype: bytes | None
+        """
+        if self._path_or_name is None:
+            self._path_or_name = (self._find_path_or_name(),)
+        return self._path_or_name[0]
+
+    def _find_path_or_name(self):
         """
         :rtype: bytes | None
         """
         path = None
-        for off, end, name, class_ in self.sections:
+        # the .rodata layout doesn't depend on the .plt scan, so don't force .text to load for it
+        if self._sections is None:
+            self._layout()
+        sections = self._sections if self._sections is not None else self.segment_builder.flatten()
+        for off, end, name, class_ in sections:
             if name == '.rodata' and 0x1000 > end - off > 8:
                 id_ = self.binfile.read_from(end - off, off).lstrip(b'\x00')
                 if len(id_) > 0:
@@ -459,8 +1649,7 @@ class NxoFileBase(object):
                         id_ = id_[4:length + 4]
                         return id_
 
-        self.binfile.seek(self.rodataoff)
-        as_string = self.binfile.read(self.rodatasize)
+        as_string = regex_buffer(self.image.view(self.rodataoff, self.rodataoff + self.rodatasize))
         if path is None:
             strs = re.findall(r'[a-z]:[\\/][ -~]{5,}\.n[rs]s'.encode(), as_string, flags=re.IGNORECASE)
             if strs:
@@ -480,10 +1669,88 @@ class NxoFileBase(object):
         return name
 
 
+def _load_segment(f, fileoff, filesize, vaddr, vsize, decompress=None, decompress_prefix=None, preload=False):
+    """
+    :type f: BinFile
+    :type fileoff: int
+    :type filesize: int
+    :type vaddr: int
+    :type vsize: int
+    :param decompress: writes the decompressed segment into (buf, offset, size, compressed),
+                       None if stored as-is
+    :type decompress: ((bytearray, int, int, bytes) -> int) | None
+    :param decompress_prefix: partial decompressor, used for small lazy reads at the segment start
+    :type decompress_prefix: ((bytes, int) -> bytes) | None
+    :param preload: read the compressed data now, so decompressing doesn't touch f
+    :type preload: bool
+    :rtype: tuple[SegmentSource, int | None, int, int]
+    """
+    start = fileoff
+    if decompress is None:
+        if f.mapping is not None:
+            return SegmentSource.from_view(f.mapping, fileoff, filesize), fileoff, vaddr, vsize
+        load_into = lambda buf, offset, size: f.readinto_from(buf, offset, min(size, filesize), start)
+        load_prefix = lambda n: f.read_from(min(n, filesize), start)
+        return SegmentSource(load_into, load_prefix), fileoff, vaddr, vsize
+    if preload:
+        compressed = f.view_from(filesize, start)
+        read = lambda: compressed
+    else:
+        read = lambda: f.view_from(filesize, start)
+    load_into = lambda buf, offset, size: decompress(buf, offset, size, read())
+    load_prefix = None
+    if decompress_prefix is not None:
+        load_prefix = lambda n: decompress_prefix(read(), n)
+    return SegmentSource(load_into, load_prefix), None, vaddr, vsize
+
+
+def _lz4_into(uncompressed_size):
+    """
+    :type uncompressed_size: int
+    :rtype: (bytearray, int, int, bytes) -> int
+    """
+    def load_into(buf, offset, size, compressed):
+        if uncompressed_size <= size:
+            return lz4_block_decompress_into(compressed, buf, offset, uncompressed_size)
+        return _copy_into(buf, offset, size, uncompress(compressed, uncompressed_size=uncompressed_size))
+    return load_into
+
+
+def _blz_into(buf, offset, size, compressed):
+    """
+    :type buf: bytearray
+    :type offset: int
+    :type size: int
+    :type compressed: bytes
+    :rtype: int
+    """
+    length = kip1_blz_decompressed_size(compressed)
+    if length <= size:
+        buf[offset:offset + len(compressed)] = compressed
+        return kip1_blz_decompress_into(buf, offset, len(compressed))
+    return _copy_into(buf, offset, size, kip1_blz_decompress(compressed))
+
+
 class NsoFile(NxoFileBase):
-    def __init__(self, fileobj):
+    def __init__(self, fileobj, lazy=False, executor=None, eager=False, state=None, verify=False, previous=None):
         """
         :type fileobj: io.BytesIO
+        :param lazy: defer decompression of each segment until it is read, fileobj must stay open
+        :type lazy: bool
+        :param executor: decompress the segments concurrently on it, e.g. a shared
+                         concurrent.futures.ThreadPoolExecutor (LZ4 releases the GIL)
+        :type executor: concurrent.futures.Executor | None
+        :param eager: run every analysis stage now instead of on first use
+        :type eager: bool
+        :param state: parse results from get_state(), restored instead of parsing
+        :type state: dict | None
+        :param verify: check each segment's SHA-256 right after it is decompressed,
+                       the result is reported by verify_hashes()
+        :type verify: bool
+        :param previous: an earlier build of the module or its get_state(); segments with
+                         the same hash are copied from it (if it has loaded them) instead of
+                         decompressed, and the stages that only read those are not redone
+        :type previous: NsoFile | dict | None
         """
         f = BinFile(fileobj)
 
@@ -498,22 +1765,48 @@ class NsoFile(NxoFileBase):
 
         tfilesize, rfilesize, dfilesize = f.read_from('III', 0x60)
         bsssize = f.read_from('I', 0x3C)
+        hashes = tuple(f.read_from(0x20, 0xA0 + i * 0x20) if flag in flags else None
+                       for i, flag in enumerate([NxoFlags.TEXT_HASH, NxoFlags.RO_HASH, NxoFlags.DATA_HASH]))
 
-        # print('load text: ')
-        text = ((uncompress(f.read_from(tfilesize, toff), uncompressed_size=tsize), None, tloc, tsize)
-                if NxoFlags.TEXT_COMPRESSED in flags else (f.read_from(tfilesize, toff), toff, tloc, tsize))
-        ro   = ((uncompress(f.read_from(rfilesize, roff), uncompressed_size=rsize), None, rloc, rsize)
-                if NxoFlags.RO_COMPRESSED in flags else (f.read_from(rfilesize, roff), roff, rloc, rsize))
-        data = ((uncompress(f.read_from(dfilesize, doff), uncompressed_size=dsize), None, dloc, dsize)
-                if NxoFlags.DATA_COMPRESSED in flags else (f.read_from(dfilesize, doff), doff, dloc, dsize))
+        preload = executor is not None and not lazy
 
-        super(NsoFile, self).__init__(text, ro, data, bsssize)
+        # print('load text: ')
+        text = _load_segment(f, toff, tfilesize, tloc, tsize, preload=preload,
+                             **(dict(decompress=_lz4_into(tsize), decompress_prefix=lz4_block_decompress_prefix)
+                                if NxoFlags.TEXT_COMPRESSED in flags else {}))
+        ro   = _load_segment(f, roff, rfilesize, rloc, rsize, preload=preload,
+                             **(dict(decompress=_lz4_into(rsize), decompress_prefix=lz4_block_decompress_prefix)
+                                if NxoFlags.RO_COMPRESSED in flags else {}))
+        data = _load_segment(f, doff, dfilesize, dloc, dsize, preload=preload,
+                             **(dict(decompress=_lz4_into(dsize), decompress_prefix=lz4_block_decompress_prefix)
+                                if NxoFlags.DATA_COMPRESSED in flags else {}))
+
+        segments = [text, ro, data]
+        if isinstance(previous, NxoFileBase):
+            old = previous
+            # only what the earlier build already parsed, don't load its segments for more
+            previous = old._computed_state()
+            for i, name in enumerate(['.text', '.rodata', '.data']):
+                source, fileoff, vaddr, vsize = segments[i]
+                # segments used in place from a mapping cost nothing to load
+                if (hashes[i] is not None and tuple(previous['segment_headers'][i]) == (vaddr, vsize, hashes[i])
+                        and not old.image.closed and old.is_materialized(name) and source.view is None):
+                    segments[i] = (SegmentSource.from_segment(old.image.segment(name)), fileoff, vaddr, vsize)
+
+        super(NsoFile, self).__init__(*segments, bsssize=bsssize, lazy=lazy, executor=executor, eager=eager,
+                                      state=state, hashes=hashes, verify=verify, previous=previous)
 
 
 class NroFile(NxoFileBase):
-    def __init__(self, fileobj):
+    def __init__(self, fileobj, lazy=False, eager=False, state=None):
         """
         :type fileobj: io.BytesIO
+        :param lazy: defer reading each segment until it is accessed, fileobj must stay open
+        :type lazy: bool
+        :param eager: run every analysis stage now instead of on first use
+        :type eager: bool
+        :param state: parse results from get_state(), restored instead of parsing
+        :type state: dict | None
         """
         f = BinFile(fileobj)
 
@@ -527,17 +1820,23 @@ class NroFile(NxoFileBase):
         dloc, dsize = f.read('II')
         bsssize = f.read_from('I', 0x28)
 
-        text = (f.read_from(tsize, tloc), tloc, tloc, tsize)
-        ro   = (f.read_from(rsize, rloc), rloc, rloc, rsize)
-        data = (f.read_from(dsize, dloc), dloc, dloc, dsize)
+        text = _load_segment(f, tloc, tsize, tloc, tsize)
+        ro   = _load_segment(f, rloc, rsize, rloc, rsize)
+        data = _load_segment(f, dloc, dsize, dloc, dsize)
 
-        super(NroFile, self).__init__(text, ro, data, bsssize)
+        super(NroFile, self).__init__(text, ro, data, bsssize, lazy=lazy, eager=eager, state=state)
 
 
 class KipFile(NxoFileBase):
-    def __init__(self, fileobj):
+    def __init__(self, fileobj, lazy=False, eager=False, state=None):
         """
         :type fileobj: io.BytesIO
+        :param lazy: defer decompression of each segment until it is read, fileobj must stay open
+        :type lazy: bool
+        :param eager: run every analysis stage now instead of on first use
+        :type eager: bool
+        :param state: parse results from get_state(), restored instead of parsing
+        :type state: dict | None
         """
         f = BinFile(fileobj)
 
@@ -557,12 +1856,13 @@ class KipFile(NxoFileBase):
         bsssize = f.read_from('I', 0x54)
         print('bss size 0x%x' % bsssize)
 
+        # BLZ decodes back to front, so there is no cheap prefix decode
         print('load segments')
-        text = ((kip1_blz_decompress(f.read_from(tfilesize, toff)), None, tloc, tsize)
-                if NxoFlags.TEXT_COMPRESSED in flags else (f.read_from(tfilesize, toff), toff, tloc, tsize))
-        ro   = ((kip1_blz_decompress(f.read_from(rfilesize, roff)), None, rloc, rsize)
-                if NxoFlags.RO_COMPRESSED in flags else (f.read_from(rfilesize, roff), roff, rloc, rsize))
-        data = ((kip1_blz_decompress(f.read_from(dfilesize, doff)), None, dloc, dsize)
-                if NxoFlags.DATA_COMPRESSED in flags else (f.read_from(dfilesize, doff), doff, dloc, dsize))
-
-        super(KipFile, self).__init__(text, ro, data, bsssize)
+        text = _load_segment(f, toff, tfilesize, tloc, tsize,
+                             decompress=_blz_into if NxoFlags.TEXT_COMPRESSED in flags else None)
+        ro   = _load_segment(f, roff, rfilesize, rloc, rsize,
+                             decompress=_blz_into if NxoFlags.RO_COMPRESSED in flags else None)
+        data = _load_segment(f, doff, dfilesize, dloc, dsize,
+                             decompress=_blz_into if NxoFlags.DATA_COMPRESSED in flags else None)
+
+        super(KipFile, self).__init__(text, ro, data, bsssize, lazy=lazy, eager=eager, state=state)
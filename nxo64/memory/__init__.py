@@ -1,3 +1,7 @@
+import bisect
+
+from ..compat import numpy
+
 try:
     # StrEnum is new in python 3.11
     from enum import StrEnum
@@ -50,6 +54,80 @@ class Range(object):
         return 'Range(0x%X -> 0x%X)' % (self.start, self.end)
 
 
+class IntervalIndex(object):
+    """
+    Sorted, non-overlapping [start, end) intervals with a value each,
+    searched by bisection.
+    """
+
+    def __init__(self):
+        self.starts = []  # type: list[int]
+        self.ends = []  # type: list[int]
+        self.values = []
+        self._arrays = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlapping(self, start, end):
+        """
+        :type start: int
+        :type end: int
+        :return: value of an interval overlapping [start, end), if any
+        """
+        if start >= end:
+            return None
+        # intervals don't overlap, so only the last one starting before end can reach start
+        i = bisect.bisect_left(self.starts, end) - 1
+        if i >= 0 and self.ends[i] > start:
+            return self.values[i]
+        return None
+
+    def add(self, start, end, value):
+        """
+        Insert an interval, which must not overlap any other. Empty intervals
+        contain nothing and are not stored.
+
+        :type start: int
+        :type end: int
+        """
+        if start >= end:
+            return
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.values.insert(i, value)
+        self._arrays = None
+
+    def find(self, address):
+        """
+        :type address: int
+        :return: value of the interval containing address, or None
+        """
+        i = bisect.bisect_right(self.starts, address) - 1
+        if i >= 0 and address < self.ends[i]:
+            return self.values[i]
+        return None
+
+    def find_many(self, addresses):
+        """
+        :type addresses: collections.Iterable[int]
+        :return: value of the interval containing each address, or None
+        :rtype: list
+        """
+        if numpy is None:
+            return [self.find(address) for address in addresses]
+        if self._arrays is None:
+            self._arrays = (numpy.asarray(self.starts, dtype=numpy.int64),
+                            numpy.asarray(self.ends, dtype=numpy.int64))
+        starts, ends = self._arrays
+        addresses = numpy.asarray(addresses, dtype=numpy.int64)
+        index = numpy.searchsorted(starts, addresses, side='right') - 1
+        found = (index >= 0) & (addresses < ends[numpy.maximum(index, 0)])
+        values = self.values
+        return [values[i] if ok else None for i, ok in zip(index.tolist(), found.tolist())]
+
+
 class Section(object):
     def __init__(self, r, name):
         """
@@ -77,11 +155,13 @@ class Segment(object):
         self.name = name
         self.kind = kind
         self.sections = []  # type: list[Section]
+        self._index = IntervalIndex()
 
     def add_section(self, s):
         """
         :type s: Section
         """
-        for i in self.sections:
-            assert not i.range.overlaps(s.range), '%r overlaps %r' % (s, i)
+        other = self._index.overlapping(s.range.start, s.range.end)
+        assert other is None, '%r overlaps %r' % (s, other)
+        self._index.add(s.range.start, s.range.end, s)
         self.sections.append(s)
@@ -1,10 +1,11 @@
-from . import Range, Section, Segment, SegmentKind
+from . import IntervalIndex, Range, Section, Segment, SegmentKind
 from ..utils import suffixed_name
 
 
 class SegmentBuilder(object):
     def __init__(self):
         self.segments = []  # type: list[Segment]
+        self._index = IntervalIndex()
 
     def add_segment(self, start, size, name, kind):
         """
@@ -14,9 +15,10 @@ class SegmentBuilder(object):
         :type kind: SegmentKind
         """
         r = Range(start, size)
-        for i in self.segments:
-            assert not r.overlaps(i.range)
-        self.segments.append(Segment(r, name, kind))
+        assert self._index.overlapping(r.start, r.end) is None
+        segment = Segment(r, name, kind)
+        self._index.add(r.start, r.end, segment)
+        self.segments.append(segment)
 
     def add_section(self, name, start, end=None, size=None):
         """
@@ -31,10 +33,16 @@ class SegmentBuilder(object):
         if size is None:
             size = end - start
         r = Range(start, size)
-        for i in self.segments:
-            if i.range.includes(r):
-                i.add_section(Section(r, name))
-                return
+        segment = self._index.find(r.start)
+        if not size:
+            # an empty section at the end of a segment belongs to that segment,
+            # also when another one follows it or it's the last one
+            previous = self._index.find(r.start - 1)
+            if previous is not None and previous.range.end == r.start:
+                segment = previous
+        if segment is not None and segment.range.includes(r):
+            segment.add_section(Section(r, name))
+            return
         assert False, "no containing segment for %r" % (name,)
 
     def flatten(self):
@@ -0,0 +1,230 @@
+import os
+
+from .compat import int_column, numpy
+from .consts import SHN_ABS, STB
+from .files import load_nxo
+
+# the order the loader maps a title's modules in, which is also symbol lookup order
+TITLE_MODULES = ['rtld', 'main'] + ['subsdk%d' % i for i in range(10)] + ['sdk']
+
+_STV_DEFAULT = 0
+_STV_PROTECTED = 3
+
+
+class ModuleSet(object):
+    """
+    The modules of one process (e.g. a title's main, subsdk* and sdk), linked
+    against each other.
+
+    link() builds one index of everything the modules export and resolves
+    every module's undefined symbols against it. The result is kept as dense
+    arrays per module, aligned with that module's symbols: the index of the
+    defining module, the index of the definition in that module's symbols and
+    its value, -1 where the symbol is defined locally or unresolved.
+    Absolute (SHN_ABS) symbols are never moved by a module's base.
+    """
+
+    def __init__(self, modules, names=None):
+        """
+        :param modules: in lookup order, the first definition of a name wins
+        :type modules: list[nxo64.files.NxoFileBase]
+        :param names: module names, defaults to get_name()
+        :type names: list[str] | None
+        """
+        self.modules = list(modules)
+        if names is None:
+            names = []
+            for module in self.modules:
+                name = module.get_name()
+                names.append(name.decode('utf-8', 'replace') if isinstance(name, bytes) else name)
+        self.names = list(names)
+        self._exports = None
+        self.resolved_modules = None
+        self.resolved_symbols = None
+        self.resolved_values = None
+        # per module, 1 where the definition is absolute (SHN_ABS) and no base applies
+        self._resolved_absolute = None
+
+    @classmethod
+    def load(cls, paths, executor=None, names=None, **options):
+        """
+        :param paths: module files, in lookup order
+        :type paths: list[str]
+        :param executor: load the modules concurrently on it
+                         (decompression releases the GIL)
+        :type executor: concurrent.futures.Executor | None
+        :type names: list[str] | None
+        :param options: passed on to load_nxo
+        :rtype: ModuleSet
+        """
+        load = lambda path: load_nxo(path, **options)
+        if executor is None:
+            modules = [load(path) for path in paths]
+        else:
+            modules = list(executor.map(load, paths))
+        return cls(modules, names)
+
+    @classmethod
+    def load_title(cls, directory, executor=None, **options):
+        """
+        Load the modules of an ExeFS directory (rtld, main, subsdk0-9, sdk, with
+        or without an .nso extension) that are present, in load order.
+
+        :type directory: str
+        :type executor: concurrent.futures.Executor | None
+        :param options: passed on to load_nxo
+        :rtype: ModuleSet
+        """
+        paths, names = [], []
+        for name in TITLE_MODULES:
+            for filename in (name, name + '.nso'):
+                path = os.path.join(directory, filename)
+                if os.path.isfile(path):
+                    paths.append(path)
+                    names.append(name)
+                    break
+        return cls.load(paths, executor, names, **options)
+
+    def __len__(self):
+        return len(self.modules)
+
+    def index(self, name):
+        """
+        :type name: str
+        :rtype: int
+        """
+        return self.names.index(name)
+
+    @property
+    def exports(self):
+        """
+        Every exported name, mapped to its first definition.
+
+        :rtype: dict[str, tuple[int, int]]
+        :return: name -> (module index, symbol index)
+        """
+        if self._exports is None:
+            self._exports = exports = {}
+            for i, module in enumerate(self.modules):
+                for j, sym in enumerate(module.symbols):
+                    if (sym.shndx and sym.bind in (STB.GLOBAL, STB.WEAK)
+                            and sym.vis in (_STV_DEFAULT, _STV_PROTECTED)):
+                        name = sym.name
+                        if name and name not in exports:
+                            exports[name] = (i, j)
+        return self._exports
+
+    def link(self):
+        """
+        Resolve the undefined symbols of every module, see the class docstring.
+        """
+        exports = self.exports
+        self.resolved_modules = []
+        self.resolved_symbols = []
+        self.resolved_values = []
+        self._resolved_absolute = []
+        for module in self.modules:
+            symbols = module.symbols
+            modules = int_column(len(symbols), -1)
+            indices = int_column(len(symbols), -1)
+            values = int_column(len(symbols), -1)
+            absolute = int_column(len(symbols), 0)
+            for j, sym in enumerate(symbols):
+                if j == 0 or sym.shndx:
+                    continue
+                target = exports.get(sym.name)
+                if target is not None:
+                    definition = self.modules[target[0]].symbols[target[1]]
+                    modules[j], indices[j] = target
+                    values[j] = definition.value
+                    absolute[j] = definition.shndx == SHN_ABS
+            self.resolved_modules.append(modules)
+            self.resolved_symbols.append(indices)
+            self.resolved_values.append(values)
+            self._resolved_absolute.append(absolute)
+
+    def resolve(self, module_index, symbol_index):
+        """
+        :type module_index: int
+        :type symbol_index: int
+        :return: (defining module index, symbol index there), None if unresolved
+                 or defined in the module itself
+        :rtype: tuple[int, int] | None
+        """
+        if self.resolved_modules is None:
+            self.link()
+        target = int(self.resolved_modules[module_index][symbol_index])
+        if target < 0:
+            return None
+        return target, int(self.resolved_symbols[module_index][symbol_index])
+
+    def unresolved(self, module_index):
+        """
+        :type module_index: int
+        :return: the module's undefined symbols that no module exports
+        :rtype: list[nxo64.symbols.ElfSym]
+        """
+        if self.resolved_modules is None:
+            self.link()
+        symbols = self.modules[module_index].symbols
+        resolved = self.resolved_modules[module_index]
+        return [sym for j, sym in enumerate(symbols) if j and not sym.shndx and resolved[j] < 0]
+
+    def addresses(self, module_index, bases):
+        """
+        Absolute address of every symbol of a module, with the modules loaded at
+        bases; -1 for unresolved undefined symbols.
+
+        :type module_index: int
+        :param bases: load address per module
+        :type bases: list[int]
+        :rtype: numpy.ndarray | array.array
+        """
+        if self.resolved_modules is None:
+            self.link()
+        modules = self.resolved_modules[module_index]
+        values = self.resolved_values[module_index]
+        absolute = self._resolved_absolute[module_index]
+        symbols = self.modules[module_index].symbols
+        own = bases[module_index]
+        if numpy is not None:
+            local = numpy.fromiter((sym.value if sym.shndx else -1 for sym in symbols), dtype=numpy.int64,
+                                   count=len(symbols))
+            own_base = numpy.fromiter((0 if sym.shndx == SHN_ABS else own for sym in symbols), dtype=numpy.int64,
+                                      count=len(symbols))
+            base_of = numpy.append(numpy.asarray(bases, dtype=numpy.int64), 0)
+            out = numpy.where(local >= 0, local + own_base, -1)
+            imported = modules >= 0
+            # absolute definitions take the extra zero base
+            out[imported] = base_of[numpy.where(absolute[imported] != 0, len(bases), modules[imported])] \
+                + values[imported]
+            return out
+        out = int_column(len(symbols), -1)
+        for j, sym in enumerate(symbols):
+            if sym.shndx == SHN_ABS:
+                out[j] = sym.value
+            elif sym.shndx:
+                out[j] = own + sym.value
+            elif modules[j] >= 0:
+                out[j] = values[j] if absolute[j] else bases[modules[j]] + values[j]
+        return out
+
+    def resolver(self, module_index, bases):
+        """
+        A resolver for NxoFileBase.relocated_image() of one module, with the
+        modules loaded at bases. It answers from addresses(), without looking
+        names up again.
+
+        :type module_index: int
+        :type bases: list[int]
+        :rtype: (nxo64.symbols.ElfSym) -> int | None
+        """
+        addresses = self.addresses(module_index, bases)
+        index = dict((sym, j) for j, sym in enumerate(self.modules[module_index].symbols) if j and not sym.shndx)
+
+        def resolve(sym):
+            j = index.get(sym)
+            if j is None or addresses[j] < 0:
+                return None
+            return int(addresses[j])
+        return resolve
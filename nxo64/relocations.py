@@ -0,0 +1,410 @@
+import bisect
+import struct
+import sys
+from array import array
+
+from .compat import array_frombytes, array_tobytes, int64_typecode, numpy, struct_iter_unpack
+from .consts import R_AArch64, R_Arm, R_FAKE_RELR
+
+TLS_DESC_TYPES = (R_AArch64.TLSDESC, R_Arm.TLS_DESC)
+
+_rel_structs = {
+    True: struct.Struct('<II'),
+    False: struct.Struct('<QQq'),
+}
+
+_relr_struct = struct.Struct('<Q')
+
+if numpy is not None:
+    _rel_dtypes = {
+        True: numpy.dtype([('offset', '<u4'), ('info', '<u4')]),
+        False: numpy.dtype([('offset', '<u8'), ('info', '<u8'), ('addend', '<i8')]),
+    }
+
+
+def _column(values=()):
+    """
+    :rtype: numpy.ndarray | array.array
+    """
+    if numpy is not None:
+        return numpy.asarray(values, dtype=numpy.int64)
+    return array(int64_typecode, values)
+
+
+def decode_relr(data):
+    """
+    Expand a RELR section (address entries followed by 63-bit bitmaps of the
+    next words to relocate) into the offsets it relocates.
+
+    :type data: bytes | memoryview
+    :return: sorted offsets
+    :rtype: numpy.ndarray | array.array
+    """
+    count = len(data) // 8
+    if numpy is not None:
+        entries = numpy.frombuffer(data, dtype='<u8', count=count)
+        is_where = (entries & 1) == 0
+        # addresses as int64, mixing uint64 and int64 would promote to float64
+        addresses = entries.astype(numpy.int64)
+        positions = numpy.arange(count, dtype=numpy.int64)
+        # each bitmap continues from the closest address entry before it
+        last_where = numpy.maximum.accumulate(numpy.where(is_where, positions, -1))
+        is_bitmap = ~is_where & (last_where >= 0)
+        bitmaps = entries[is_bitmap]
+        bitmap_where = last_where[is_bitmap]
+        bases = addresses[bitmap_where] + 8 + (positions[is_bitmap] - bitmap_where - 1) * (63 * 8)
+        bits = numpy.unpackbits(bitmaps.view(numpy.uint8).reshape(-1, 8), axis=1,
+                                bitorder='little')[:, 1:].astype(bool)
+        offsets = numpy.concatenate([
+            addresses[is_where],
+            (bases[:, None] + numpy.arange(63, dtype=numpy.int64) * 8)[bits],
+        ])
+        offsets.sort()
+        return offsets
+
+    offsets = []
+    where = None
+    for entry, in struct_iter_unpack(_relr_struct, data[:count * 8]):
+        if entry & 1:
+            if where is None:
+                continue
+            bits = entry >> 1
+            while bits:
+                low = bits & -bits
+                offsets.append(where + (low.bit_length() - 1) * 8)
+                bits ^= low
+            where += 63 * 8
+        else:
+            where = entry
+            offsets.append(where)
+            where += 8
+    offsets.sort()
+    return _column(offsets)
+
+
+def _column_bytes(column):
+    """
+    :type column: array.array
+    :rtype: bytes
+    """
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return array_tobytes(column)
+
+
+class RelocationTable(object):
+    """
+    Relocations stored as parallel columns of offset, type, symbol index and
+    addend. Columns are NumPy arrays if NumPy is installed, array.array otherwise.
+    """
+
+    def __init__(self, offsets, types, sym_indices, addends, has_addends=True):
+        """
+        :type offsets: numpy.ndarray | array.array
+        :type types: numpy.ndarray | array.array
+        :type sym_indices: numpy.ndarray | array.array
+        :type addends: numpy.ndarray | array.array
+        :param has_addends: False for REL tables, whose tuple view has None addends
+        :type has_addends: bool
+        """
+        self.offsets = offsets
+        self.types = types
+        self.sym_indices = sym_indices
+        self.addends = addends
+        self.has_addends = has_addends
+        self._locations = None
+
+    @classmethod
+    def empty(cls):
+        """
+        :rtype: RelocationTable
+        """
+        return cls(_column(), _column(), _column(), _column())
+
+    @classmethod
+    def from_bytes(cls, data, armv7):
+        """
+        Decode a whole .rel(a).dyn / .rel(a).plt section in one pass.
+
+        :type data: bytes | memoryview
+        :param armv7: REL entries without addends if set, RELA otherwise
+        :type armv7: bool
+        :rtype: RelocationTable
+        """
+        st = _rel_structs[armv7]
+        count = len(data) // st.size
+        if numpy is not None:
+            rec = numpy.frombuffer(data, dtype=_rel_dtypes[armv7], count=count)
+            offsets = rec['offset'].astype(numpy.int64)
+            info = rec['info']
+            if armv7:
+                types = (info & 0xff).astype(numpy.int64)
+                sym_indices = (info >> 8).astype(numpy.int64)
+                addends = numpy.zeros(count, dtype=numpy.int64)
+            else:
+                types = (info & 0xffffffff).astype(numpy.int64)
+                sym_indices = (info >> numpy.uint64(32)).astype(numpy.int64)
+                addends = rec['addend'].astype(numpy.int64)
+            return cls(offsets, types, sym_indices, addends, has_addends=not armv7)
+
+        offsets, types, sym_indices, addends = _column(), _column(), _column(), _column()
+        for rel in struct_iter_unpack(st, data[:count * st.size]):
+            offsets.append(rel[0])
+            if armv7:
+                types.append(rel[1] & 0xff)
+                sym_indices.append(rel[1] >> 8)
+                addends.append(0)
+            else:
+                types.append(rel[1] & 0xffffffff)
+                sym_indices.append(rel[1] >> 32)
+                addends.append(rel[2])
+        return cls(offsets, types, sym_indices, addends, has_addends=not armv7)
+
+    @classmethod
+    def from_offsets(cls, offsets, r_type):
+        """
+        Table of symbol-less relocations of one type with zero addends (RELR).
+
+        :type offsets: collections.Iterable[int]
+        :type r_type: int
+        :rtype: RelocationTable
+        """
+        offsets = _column(offsets)
+        count = len(offsets)
+        if numpy is not None:
+            return cls(offsets, numpy.full(count, r_type, dtype=numpy.int64),
+                       numpy.zeros(count, dtype=numpy.int64), numpy.zeros(count, dtype=numpy.int64))
+        return cls(offsets, _column([r_type]) * count, _column([0]) * count, _column([0]) * count)
+
+    @classmethod
+    def from_relr(cls, data):
+        """
+        :type data: bytes | memoryview
+        :rtype: RelocationTable
+        """
+        return cls.from_offsets(decode_relr(data), R_FAKE_RELR)
+
+    @classmethod
+    def concat(cls, tables):
+        """
+        :type tables: list[RelocationTable]
+        :rtype: RelocationTable
+        """
+        if not tables:
+            return cls.empty()
+        if numpy is not None:
+            columns = [numpy.concatenate([getattr(t, name) for t in tables])
+                       for name in ('offsets', 'types', 'sym_indices', 'addends')]
+        else:
+            columns = []
+            for name in ('offsets', 'types', 'sym_indices', 'addends'):
+                column = _column()
+                for t in tables:
+                    column.extend(getattr(t, name))
+                columns.append(column)
+        return cls(*columns, has_addends=all(t.has_addends for t in tables))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get_state(self):
+        """
+        :return: the columns as little-endian int64 bytes, and has_addends
+        :rtype: tuple[bytes, bytes, bytes, bytes, bool]
+        """
+        columns = [self.offsets, self.types, self.sym_indices, self.addends]
+        if numpy is not None:
+            columns = [numpy.asarray(column, dtype='<i8').tobytes() for column in columns]
+        else:
+            columns = [_column_bytes(column) for column in columns]
+        return tuple(columns) + (self.has_addends,)
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        :type state: tuple[bytes, bytes, bytes, bytes, bool]
+        :rtype: RelocationTable
+        """
+        if numpy is not None:
+            columns = [numpy.frombuffer(column, dtype='<i8').astype(numpy.int64) for column in state[:4]]
+        else:
+            columns = []
+            for data in state[:4]:
+                column = _column()
+                array_frombytes(column, data)
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                columns.append(column)
+        return cls(*columns, has_addends=state[4])
+
+    def select(self, indices):
+        """
+        :param indices: row indices (or a boolean mask with NumPy)
+        :rtype: RelocationTable
+        """
+        if numpy is not None:
+            return RelocationTable(self.offsets[indices], self.types[indices], self.sym_indices[indices],
+                                   self.addends[indices], self.has_addends)
+        return RelocationTable(*[_column(column[i] for i in indices)
+                                 for column in (self.offsets, self.types, self.sym_indices, self.addends)],
+                               has_addends=self.has_addends)
+
+    def type_mask(self, *types):
+        """
+        :type types: int
+        :return: row indices (a boolean mask with NumPy) of relocations of the given types
+        """
+        if numpy is not None:
+            return numpy.isin(self.types, numpy.asarray(types, dtype=numpy.int64))
+        types = set(types)
+        return [i for i, r_type in enumerate(self.types) if r_type in types]
+
+    def of_type(self, *types):
+        """
+        :type types: int
+        :rtype: RelocationTable
+        """
+        return self.select(self.type_mask(*types))
+
+    @property
+    def locations(self):
+        """
+        Sorted, unique offsets patched by these relocations (TLS descriptors excluded).
+
+        :rtype: numpy.ndarray | array.array
+        """
+        if self._locations is None:
+            if numpy is not None:
+                self._locations = numpy.unique(self.offsets[~numpy.isin(self.types, TLS_DESC_TYPES)])
+            else:
+                tls = set(TLS_DESC_TYPES)
+                self._locations = _column(sorted(set(o for o, t in zip(self.offsets, self.types) if t not in tls)))
+        return self._locations
+
+    def __contains__(self, offset):
+        """
+        Whether offset is patched by a (non TLS descriptor) relocation.
+
+        :type offset: int
+        :rtype: bool
+        """
+        locations = self.locations
+        if numpy is not None:
+            i = int(numpy.searchsorted(locations, offset))
+        else:
+            i = bisect.bisect_left(locations, offset)
+        return i < len(locations) and locations[i] == offset
+
+    def contains(self, offsets):
+        """
+        Batch version of ``offset in table``.
+
+        :type offsets: collections.Iterable[int]
+        :rtype: list[bool] | numpy.ndarray
+        """
+        if numpy is not None:
+            return numpy.isin(numpy.asarray(offsets, dtype=numpy.int64), self.locations)
+        return [offset in self for offset in offsets]
+
+    def to_list(self, symbols):
+        """
+        The (offset, r_type, sym, addend) tuple view used by ``NxoFileBase.relocations``.
+
+        :type symbols: list[ElfSym]
+        :rtype: list[tuple[int, int, ElfSym | None, int | None]]
+        """
+        columns = [self.offsets, self.types, self.sym_indices, self.addends]
+        if numpy is not None:
+            columns = [column.tolist() for column in columns]
+        offsets, types, sym_indices, addends = columns
+        if not self.has_addends:
+            addends = [None] * len(offsets)
+        return [(offset, r_type, symbols[r_sym] if r_sym != 0 else None, addend)
+                for offset, r_type, r_sym, addend in zip(offsets, types, sym_indices, addends)]
+
+
+_word_formats = {4: '<I', 8: '<Q'}
+
+
+def apply_relocations(buf, table, base, symbol_values, armv7):
+    """
+    Patch a flat module image (offset 0 = module start) in place, as the loader
+    would at base: RELATIVE and RELR add base, GLOB_DAT, JUMP_SLOT and ABS64/ABS32
+    store the symbol value plus the addend. REL tables (armv7) take the addend of
+    RELATIVE and ABS32 from the patched word. Every word is read before any is
+    written, so relocations should not overlap.
+
+    :param buf: writable image, e.g. a bytearray or a writable mmap
+    :type buf: bytearray | mmap.mmap
+    :type table: RelocationTable
+    :type base: int
+    :param symbol_values: resolved address per symbol index, None if unresolved
+    :type symbol_values: list[int | None]
+    :type armv7: bool
+    :return: the relocations that were not applied: unresolved symbols, unknown
+             types or locations outside buf
+    :rtype: RelocationTable
+    """
+    word = 4 if armv7 else 8
+    r = R_Arm if armv7 else R_AArch64
+    symbolic = (r.GLOB_DAT, r.JUMP_SLOT, R_Arm.ABS32 if armv7 else R_AArch64.ABS64)
+    in_place = (r.RELATIVE, R_Arm.ABS32) if armv7 and not table.has_addends else ()
+    mask = (1 << (8 * word)) - 1
+
+    if numpy is not None:
+        offsets, types = table.offsets, table.types
+        sym_indices = table.sym_indices
+        values = numpy.zeros(len(symbol_values) + 1, dtype=numpy.uint64)
+        resolved = numpy.zeros(len(symbol_values) + 1, dtype=bool)
+        for i, value in enumerate(symbol_values):
+            if value is not None:
+                values[i] = value & 0xFFFFFFFFFFFFFFFF
+                resolved[i] = True
+        # out of range symbol indices map to the extra, unresolved entry
+        sym_indices = numpy.where((sym_indices >= 0) & (sym_indices < len(symbol_values)),
+                                  sym_indices, len(symbol_values))
+
+        is_relative = types == r.RELATIVE
+        is_relr = types == R_FAKE_RELR
+        is_symbolic = numpy.isin(types, numpy.asarray(symbolic, dtype=numpy.int64))
+        ok = ((offsets >= 0) & (offsets + word <= len(buf))
+              & (is_relative | is_relr | (is_symbolic & resolved[sym_indices])))
+
+        image = numpy.frombuffer(buf, dtype=numpy.uint8)
+        dtype = numpy.dtype('<u%d' % word)
+        positions = offsets[ok][:, None] + numpy.arange(word)
+        current = numpy.ascontiguousarray(image[positions]).view(dtype).ravel().astype(numpy.uint64)
+        addends = table.addends[ok].astype(numpy.uint64)
+        if in_place:
+            addends = numpy.where(numpy.isin(types[ok], numpy.asarray(in_place, dtype=numpy.int64)),
+                                  current, addends)
+        patched = numpy.where(
+            is_relr[ok], current + numpy.uint64(base),
+            numpy.where(is_relative[ok], addends + numpy.uint64(base), values[sym_indices[ok]] + addends))
+        if word == 4:
+            patched &= numpy.uint64(mask)
+        image[positions] = patched.astype(dtype).view(numpy.uint8).reshape(-1, word)
+        return table.select(~ok)
+
+    fmt = _word_formats[word]
+    failed = []
+    for i, (offset, r_type, r_sym, addend) in enumerate(zip(table.offsets, table.types, table.sym_indices,
+                                                              table.addends)):
+        if offset < 0 or offset + word > len(buf):
+            failed.append(i)
+            continue
+        current = struct.unpack_from(fmt, buf, offset)[0]
+        if r_type in in_place:
+            addend = current
+        if r_type == R_FAKE_RELR:
+            value = current + base
+        elif r_type == r.RELATIVE:
+            value = addend + base
+        elif r_type in symbolic and 0 <= r_sym < len(symbol_values) and symbol_values[r_sym] is not None:
+            value = symbol_values[r_sym] + addend
+        else:
+            failed.append(i)
+            continue
+        struct.pack_into(fmt, buf, offset, value & mask)
+    return table.select(failed)
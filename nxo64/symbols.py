@@ -1,24 +1,249 @@
+import bisect
+import re
+from array import array
+
+from .compat import array_frombytes, ascii_string, int64_typecode, numpy
+
+
+class StringTable(object):
+    """
+    A string table (.dynstr), decoded one string at a time on first use.
+    """
+
+    def __init__(self, data):
+        """
+        :type data: bytes
+        """
+        self.data = data
+        self._ends = None
+        self._strings = {}
+
+    def _end(self, offset):
+        if self._ends is None:
+            # offsets of all terminators, so finding the end of a string is a bisect
+            self._ends = array(int64_typecode)
+            if numpy is not None:
+                ends = numpy.flatnonzero(numpy.frombuffer(self.data, dtype=numpy.uint8) == 0)
+                array_frombytes(self._ends, ends.astype(numpy.int64).tobytes())
+            else:
+                self._ends.extend(m.start() for m in re.finditer(b'\x00', self.data))
+        i = bisect.bisect_left(self._ends, offset)
+        if i == len(self._ends):
+            raise ValueError('unterminated string at 0x%X' % offset)
+        return self._ends[i]
+
+    def get(self, offset):
+        """
+        :type offset: int
+        :rtype: str
+        """
+        try:
+            return self._strings[offset]
+        except KeyError:
+            s = self._strings[offset] = ascii_string(self.data[offset:self._end(offset)])
+            return s
+
+
 class ElfSym(object):
-    resolved = None
+    __slots__ = ('_name', '_strtab', 'info', 'other', 'shndx', 'value', 'size', 'resolved')
 
-    def __init__(self, name, info, other, shndx, value, size):
+    def __init__(self, name, info, other, shndx, value, size, strtab=None):
         """
-        :type name: str
+        :param name: the name, or its offset in strtab
+        :type name: str | int
         :type info: int
         :type other: int
         :type shndx: int
         :type value: int
         :type size: int
+        :param strtab: decode the name from it on first access
+        :type strtab: StringTable | None
         """
-        self.name = name
+        self._name = name
+        self._strtab = strtab
+        self.info = info
+        self.other = other
         self.shndx = shndx
         self.value = value
         self.size = size
+        self.resolved = None
 
-        self.vis = other & 3
-        self.type = info & 0xF
-        self.bind = info >> 4
+    @property
+    def name(self):
+        """
+        :rtype: str
+        """
+        if self._strtab is not None:
+            self._name = self._strtab.get(self._name)
+            self._strtab = None
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        self._name = name
+        self._strtab = None
+
+    @property
+    def vis(self):
+        return self.other & 3
+
+    @property
+    def type(self):
+        return self.info & 0xF
+
+    @property
+    def bind(self):
+        return self.info >> 4
 
     def __repr__(self):
         return 'Sym(name=%r, shndx=0x%X, value=0x%X, size=0x%X, vis=%r, type=%r, bind=%r)' % (
             self.name, self.shndx, self.value, self.size, self.vis, self.type, self.bind)
+
+
+def _name_key(name):
+    """
+    :type name: str | bytes
+    :return: the name as str and as bytes, None if it isn't ASCII like symbol names
+    :rtype: tuple[str, bytes] | None
+    """
+    try:
+        if isinstance(name, bytes) and not isinstance(name, str):
+            return ascii_string(name), name
+        return name, name.encode('ascii')
+    except UnicodeError:
+        return None
+
+
+def elf_hash(name):
+    """
+    SysV ELF hash (DT_HASH).
+
+    :type name: bytes
+    :rtype: int
+    """
+    h = 0
+    for c in bytearray(name):
+        h = (h << 4) + c
+        g = h & 0xf0000000
+        if g:
+            h ^= g >> 24
+        h &= ~g
+    return h
+
+
+def gnu_hash(name):
+    """
+    GNU hash (DT_GNU_HASH), djb2 truncated to 32 bits.
+
+    :type name: bytes
+    :rtype: int
+    """
+    h = 5381
+    for c in bytearray(name):
+        h = (h * 33 + c) & 0xffffffff
+    return h
+
+
+class SysvHashTable(object):
+    def __init__(self, buckets, chains):
+        """
+        :type buckets: array.array | list[int]
+        :type chains: array.array | list[int]
+        """
+        self.buckets = buckets
+        self.chains = chains
+
+    def lookup(self, name, symbols):
+        """
+        :type name: str | bytes
+        :type symbols: list[ElfSym]
+        :rtype: ElfSym | None
+        """
+        if not self.buckets:
+            return None
+        key = _name_key(name)
+        if key is None:
+            return None
+        name, raw = key
+        i = self.buckets[elf_hash(raw) % len(self.buckets)]
+        seen = 0
+        while i and i < len(symbols) and seen < len(self.chains):
+            if symbols[i].shndx and symbols[i].name == name:
+                return symbols[i]
+            i = self.chains[i]
+            seen += 1
+        return None
+
+
+class GnuHashTable(object):
+    def __init__(self, symoffset, bloom_shift, bloom, buckets, chains, word_bits):
+        """
+        :type symoffset: int
+        :type bloom_shift: int
+        :type bloom: array.array | list[int]
+        :type buckets: array.array | list[int]
+        :param chains: hash values of symbols symoffset and up
+        :type chains: array.array | list[int]
+        :param word_bits: bits in a bloom filter word, 32 or 64
+        :type word_bits: int
+        """
+        self.symoffset = symoffset
+        self.bloom_shift = bloom_shift
+        self.bloom = bloom
+        self.buckets = buckets
+        self.chains = chains
+        self.word_bits = word_bits
+
+    def lookup(self, name, symbols):
+        """
+        :type name: str | bytes
+        :type symbols: list[ElfSym]
+        :rtype: ElfSym | None
+        """
+        if not self.buckets or not self.bloom:
+            return None
+        key = _name_key(name)
+        if key is None:
+            return None
+        name, raw = key
+        h = gnu_hash(raw)
+        bits = self.word_bits
+        word = self.bloom[(h // bits) % len(self.bloom)]
+        mask = (1 << (h % bits)) | (1 << ((h >> self.bloom_shift) % bits))
+        if word & mask != mask:
+            return None
+        i = self.buckets[h % len(self.buckets)]
+        if i < self.symoffset:
+            return None
+        while i < len(symbols) and i - self.symoffset < len(self.chains):
+            h2 = self.chains[i - self.symoffset]
+            if (h | 1) == (h2 | 1) and symbols[i].name == name:
+                return symbols[i]
+            if h2 & 1:
+                break
+            i += 1
+        return None
+
+
+class DictSymbolTable(object):
+    """
+    Name lookup for modules without a hash table, first definition wins.
+    """
+
+    def __init__(self, symbols):
+        """
+        :type symbols: list[ElfSym]
+        """
+        self.by_name = {}
+        for sym in symbols:
+            if sym.shndx:
+                self.by_name.setdefault(sym.name, sym)
+
+    def lookup(self, name, symbols):
+        """
+        :type name: str | bytes
+        :type symbols: list[ElfSym]
+        :rtype: ElfSym | None
+        """
+        key = _name_key(name)
+        return self.by_name.get(key[0]) if key is not None else None
@@ -1,52 +1,266 @@
 import struct
 
-from .compat import bytes_to_list, iter_range, list_to_bytes
+from .compat import iter_range
 
+_lz4_lib = None
 
-def kip1_blz_decompress(compressed):
+
+def _get_lz4_lib():
     """
-    :type compressed: bytearray
+    Look up the C library bundled with the lz4 module, whose
+    ``LZ4_decompress_safe*`` functions decompress into a caller-owned buffer.
+
+    This is a best-effort fast path: ``lz4.block._block`` is a private
+    extension module and not every build exports the liblz4 symbols (Windows
+    builds don't), False means callers fall back to ``lz4.block.decompress``.
+
+    :rtype: ctypes.CDLL | bool
+    """
+    global _lz4_lib
+    if _lz4_lib is None:
+        _lz4_lib = False
+        try:
+            import ctypes
+            from lz4.block import _block
+            lib = ctypes.CDLL(_block.__file__)
+            lib.LZ4_decompress_safe.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_int]
+            lib.LZ4_decompress_safe_partial.argtypes = [ctypes.c_void_p, ctypes.c_void_p,
+                                                        ctypes.c_int, ctypes.c_int, ctypes.c_int]
+        except (ImportError, OSError, AttributeError):
+            pass
+        else:
+            _lz4_lib = lib
+    return _lz4_lib
+
+
+def _c_buffer(obj, offset=0, size=None):
+    """
+    :type obj: bytes | bytearray | memoryview | mmap.mmap
+    :rtype: ctypes.Array | bytes
+    """
+    import ctypes
+    if isinstance(obj, bytes) and not offset:
+        return obj
+    if size is None:
+        size = len(obj) - offset
+    try:
+        return (ctypes.c_char * size).from_buffer(obj, offset)
+    except TypeError:
+        # read-only buffer
+        return (ctypes.c_char * size).from_buffer_copy(obj, offset)
+
+
+def lz4_block_decompress_into(compressed, buf, offset, size):
     """
+    Decompress a raw LZ4 block of exactly ``size`` bytes into ``buf[offset:offset + size]``,
+    without an intermediate copy when the lz4 module's C library can be used.
+    Raises ValueError if the block doesn't decompress to exactly size bytes.
+
+    :type compressed: bytes | memoryview
+    :type buf: bytearray
+    :type offset: int
+    :type size: int
+    :rtype: int
+    """
+    lib = _get_lz4_lib()
+    if not lib:
+        from lz4.block import decompress
+        out = decompress(compressed, uncompressed_size=size)
+        if len(out) != size:
+            raise ValueError('LZ4 decompression failed!')
+        buf[offset:offset + size] = out
+        return size
+    src = _c_buffer(compressed)
+    dst = _c_buffer(buf, offset, size)
+    try:
+        n = lib.LZ4_decompress_safe(src, dst, len(compressed), size)
+    finally:
+        del src, dst
+    if n != size:
+        raise ValueError('LZ4 decompression failed!')
+    return n
+
+
+def kip1_blz_decompressed_size(compressed):
+    """
+    :type compressed: bytes | bytearray
+    :rtype: int
+    """
+    if len(compressed) < 0xC:
+        raise ValueError('Compression out of bounds!')
     compressed_size, init_index, uncompressed_addl_size = struct.unpack('<III', compressed[-0xC:])
-    decompressed = compressed[:] + b'\x00' * uncompressed_addl_size
-    decompressed_size = len(decompressed)
     if not (compressed_size + uncompressed_addl_size):
+        return 0
+    return len(compressed) + uncompressed_addl_size
+
+
+def kip1_blz_decompress(compressed):
+    """
+    :type compressed: bytearray
+    """
+    size = kip1_blz_decompressed_size(compressed)
+    if not size:
         return b''
-    decompressed = bytes_to_list(decompressed)
-    cmp_start = len(compressed) - compressed_size
-    cmp_ofs = compressed_size - init_index
-    out_ofs = compressed_size + uncompressed_addl_size
-    while out_ofs > 0:
-        cmp_ofs -= 1
-        control = decompressed[cmp_start + cmp_ofs]
-        for _ in iter_range(8):
-            if control & 0x80:
-                if cmp_ofs < 2 - cmp_start:
-                    raise ValueError('Compression out of bounds!')
-                cmp_ofs -= 2
-                segmentoffset = compressed[cmp_start + cmp_ofs] | (compressed[cmp_start + cmp_ofs + 1] << 8)
-                segmentsize = ((segmentoffset >> 12) & 0xF) + 3
-                segmentoffset &= 0x0FFF
-                segmentoffset += 2
-                if out_ofs < segmentsize - cmp_start:
-                    raise ValueError('Compression out of bounds!')
-                for _ in iter_range(segmentsize):
-                    if out_ofs + segmentoffset >= decompressed_size:
-                        raise ValueError('Compression out of bounds!')
-                    data = decompressed[cmp_start + out_ofs + segmentoffset]
-                    out_ofs -= 1
-                    decompressed[cmp_start + out_ofs] = data
+    decompressed = bytearray(size)
+    decompressed[:len(compressed)] = compressed
+    kip1_blz_decompress_into(decompressed, 0, len(compressed))
+    return bytes(decompressed)
+
+
+def _blz_runs(control):
+    """
+    Split a BLZ control byte, read from the top bit, into runs of
+    literals (their count) and back-references (0).
+
+    :type control: int
+    :rtype: tuple[int]
+    """
+    runs = []
+    for bit in iter_range(7, -1, -1):
+        if control & (1 << bit):
+            runs.append(0)
+        elif runs and runs[-1]:
+            runs[-1] += 1
+        else:
+            runs.append(1)
+    return tuple(runs)
+
+
+_blz_control_runs = [_blz_runs(control) for control in iter_range(0x100)]
+# high byte of a back-reference -> (length, distance without the low byte)
+_blz_reference_high = [((high >> 4) + 3, ((high & 0xF) << 8) + 3) for high in iter_range(0x100)]
+
+
+def kip1_blz_decompress_into(buf, offset, length):
+    """
+    Decompress in place: ``buf[offset:offset + length]`` holds the compressed
+    data, which is expanded to fill ``kip1_blz_decompressed_size()`` bytes at offset.
+
+    Raises ValueError when the footer doesn't fit the data, or the stream
+    reads before the start of the data or a back-reference reaches outside
+    the output. A corrupt stream whose output overwrites input that wasn't
+    read yet is decoded from the overwritten bytes, so it's usually rejected too.
+
+    :type buf: bytearray
+    :type offset: int
+    :type length: int
+    :rtype: int
+    """
+    if length < 0xC:
+        raise ValueError('Compression out of bounds!')
+    compressed_size, init_index, uncompressed_addl_size = struct.unpack(
+        '<III', bytes(buf[offset + length - 0xC:offset + length]))
+    decompressed_size = length + uncompressed_addl_size
+    if not (compressed_size + uncompressed_addl_size):
+        return 0
+    if not init_index <= compressed_size <= length:
+        raise ValueError('Compression out of bounds!')
+    # absolute positions in buf, both cursors move towards offset
+    cmp_start = offset + length - compressed_size
+    cmp = offset + length - init_index
+    out = offset + decompressed_size
+    end = out
+    control_runs = _blz_control_runs
+    reference_high = _blz_reference_high
+    while out > cmp_start:
+        if cmp <= offset:
+            raise ValueError('Compression out of bounds!')
+        cmp -= 1
+        for run in control_runs[buf[cmp]]:
+            if run:
+                if out - run >= cmp_start and cmp - run >= offset and cmp <= out:
+                    # the copy never reads bytes it has written
+                    out -= run
+                    cmp -= run
+                    buf[out:out + run] = buf[cmp:cmp + run]
+                else:
+                    for _ in iter_range(run):
+                        if out < offset + 1 or cmp < offset + 1:
+                            raise ValueError('Compression out of bounds!')
+                        out -= 1
+                        cmp -= 1
+                        buf[out] = buf[cmp]
+                        if out == cmp_start:
+                            break
             else:
-                if out_ofs < 1 - cmp_start:
+                if cmp < offset + 2:
+                    raise ValueError('Compression out of bounds!')
+                cmp -= 2
+                segmentsize, distance = reference_high[buf[cmp + 1]]
+                distance += buf[cmp]
+                if out < offset + segmentsize or out + distance > end:
                     raise ValueError('Compression out of bounds!')
-                out_ofs -= 1
-                cmp_ofs -= 1
-                decompressed[cmp_start + out_ofs] = decompressed[cmp_start + cmp_ofs]
-            control <<= 1
-            control &= 0xFF
-            if not out_ofs:
+                if segmentsize <= distance:
+                    out -= segmentsize
+                    buf[out:out + segmentsize] = buf[out + distance:out + segmentsize + distance]
+                else:
+                    # the run repeats bytes it writes itself,
+                    # copy it in distance sized chunks from the top down
+                    while segmentsize:
+                        n = min(segmentsize, distance)
+                        out -= n
+                        segmentsize -= n
+                        buf[out:out + n] = buf[out + distance:out + n + distance]
+            if out == cmp_start:
                 break
-    return list_to_bytes(decompressed)
+    return decompressed_size
+
+
+def lz4_block_decompress_prefix(compressed, size):
+    """
+    Decode only the first ``size`` bytes of a raw LZ4 block.
+
+    :type compressed: bytes | memoryview
+    :type size: int
+    :rtype: bytes
+    """
+    lib = _get_lz4_lib()
+    if lib:
+        import ctypes
+        src = _c_buffer(compressed)
+        dst = ctypes.create_string_buffer(size)
+        try:
+            n = lib.LZ4_decompress_safe_partial(src, dst, len(compressed), size, size)
+        finally:
+            del src
+        if n < 0:
+            raise ValueError('LZ4 decompression failed!')
+        return dst.raw[:n]
+
+    src = bytearray(compressed)
+    out = bytearray()
+    pos = 0
+    while pos < len(src) and len(out) < size:
+        token = src[pos]
+        pos += 1
+        length = token >> 4
+        if length == 15:
+            while True:
+                b = src[pos]
+                pos += 1
+                length += b
+                if b != 255:
+                    break
+        out += src[pos:pos + length]
+        pos += length
+        if pos >= len(src):
+            break
+        match_offset = src[pos] | (src[pos + 1] << 8)
+        pos += 2
+        if not match_offset or match_offset > len(out):
+            raise ValueError('LZ4 match offset out of bounds!')
+        length = (token & 0xF) + 4
+        if (token & 0xF) == 15:
+            while True:
+                b = src[pos]
+                pos += 1
+                length += b
+                if b != 255:
+                    break
+        start = len(out) - match_offset
+        for i in iter_range(length):
+            out.append(out[start + i])
+    return bytes(out[:size])
 
 
 def suffixed_name(name, suffix):
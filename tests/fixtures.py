@@ -0,0 +1,260 @@
+"""
+A small synthetic AArch64 module: MOD0, dynamic table, SysV and GNU hash
+tables, RELA/RELR/JMPREL relocations, PLT stubs and an .eh_frame_hdr.
+"""
+import contextlib
+import hashlib
+import struct
+
+import lz4.block
+
+TEXT, RO, DATA = 0x0, 0x4000, 0x8000
+TSIZE, RSIZE, DSIZE = 0x4000, 0x4000, 0x1000
+BSS = 0x200
+
+# functions in .text: (address, size)
+FUNCS = [(0x100, 0x40), (0x200, 0x80), (0x400, 0x100), (0x600, 0x20)]
+PLT = 0x800
+GOT_PLT = DATA + 0x200
+GOT = GOT_PLT + 5 * 8
+INIT_ARRAY = DATA + 0x400
+RELR_BASE = DATA + 0x600
+
+IMPORTS = [
+    # name, info, shndx, value, size
+    ('imp_a', 0x12, 0, 0, 0),
+    ('imp_b', 0x12, 0, 0, 0),
+    ('imp_data', 0x11, 0, 0, 0),
+]
+EXPORTS = [
+    ('func_one', 0x12, 1, 0x100, 0x40),
+    ('func_two', 0x12, 1, 0x200, 0x80),
+    ('func_three', 0x12, 1, 0x400, 0x100),
+    ('obj_x', 0x11, 3, DATA + 0x800, 0x10),
+    ('weak_y', 0x22, 1, 0x600, 0x20),
+]
+GNU_BUCKETS = 2
+
+
+def elf_hash(name):
+    h = 0
+    for c in bytearray(name.encode('ascii')):
+        h = ((h << 4) + c) & 0xFFFFFFFF
+        g = h & 0xF0000000
+        h = (h ^ (g >> 24)) & ~g
+    return h
+
+
+def gnu_hash(name):
+    h = 5381
+    for c in bytearray(name.encode('ascii')):
+        h = (h * 33 + c) & 0xFFFFFFFF
+    return h
+
+
+def symbols():
+    """
+    :return: dynsym entries, exports sorted by GNU hash bucket
+    :rtype: list[tuple[str, int, int, int, int]]
+    """
+    exports = sorted(EXPORTS, key=lambda s: gnu_hash(s[0]) % GNU_BUCKETS)
+    return [('', 0, 0, 0, 0)] + IMPORTS + exports
+
+
+def _uleb(v):
+    out = bytearray()
+    while v > 0x7F:
+        out.append(v & 0x7F | 0x80)
+        v >>= 7
+    out.append(v)
+    return bytes(out)
+
+
+def _adrp(rd, pc, target):
+    off = ((target & ~0xFFF) - (pc & ~0xFFF)) >> 12
+    return 0x90000000 | (off & 3) << 29 | ((off >> 2) & 0x7FFFF) << 5 | rd
+
+
+def bl(pc, target):
+    return 0x94000000 | ((target - pc) >> 2) & 0x3FFFFFF
+
+
+def build_image(sysv_hash=True, gnu_hash_table=True):
+    """
+    :param sysv_hash: list the .hash table in the dynamic table
+    :param gnu_hash_table: list the .gnu.hash table in the dynamic table
+    :return: the flat module image, .text, .rodata and .data back to back
+    :rtype: bytearray
+    """
+    img = bytearray(DATA + DSIZE)
+    syms = symbols()
+    modoff = 0x80
+    struct.pack_into('<II', img, 0, 0x14000002, modoff)
+
+    dynstr = bytearray(b'\x00')
+    name_offsets = []
+    for name, _, _, _, _ in syms:
+        name_offsets.append(len(dynstr) if name else 0)
+        if name:
+            dynstr += name.encode('ascii') + b'\x00'
+    needed = len(dynstr)
+    dynstr += b'nnSdk.nso\x00'
+
+    name = b'sdk\\fake\\main.nss'
+    struct.pack_into('<II', img, RO, 0, len(name))
+    img[RO + 8:RO + 8 + len(name)] = name
+
+    # SysV hash
+    sysv_off = RO + 0x100
+    nbucket = 3
+    buckets = [0] * nbucket
+    chains = [0] * len(syms)
+    for i in range(1, len(syms)):
+        b = elf_hash(syms[i][0]) % nbucket
+        chains[i] = buckets[b]
+        buckets[b] = i
+    table = struct.pack('<II', nbucket, len(syms)) + struct.pack('<%dI' % nbucket, *buckets) + \
+        struct.pack('<%dI' % len(syms), *chains)
+    img[sysv_off:sysv_off + len(table)] = table
+
+    # GNU hash, exports only
+    gnu_off = RO + 0x200
+    symoffset = 1 + len(IMPORTS)
+    exports = syms[symoffset:]
+    bloom = 0
+    gbuckets = [0] * GNU_BUCKETS
+    chain = []
+    for j, sym in enumerate(exports):
+        h = gnu_hash(sym[0])
+        bloom |= 1 << (h % 64) | 1 << ((h >> 6) % 64)
+        if not gbuckets[h % GNU_BUCKETS]:
+            gbuckets[h % GNU_BUCKETS] = symoffset + j
+        last = j + 1 == len(exports) or gnu_hash(exports[j + 1][0]) % GNU_BUCKETS != h % GNU_BUCKETS
+        chain.append(h & ~1 | last)
+    table = struct.pack('<IIIIQ', GNU_BUCKETS, symoffset, 1, 6, bloom) + \
+        struct.pack('<%dI' % GNU_BUCKETS, *gbuckets) + struct.pack('<%dI' % len(chain), *chain)
+    img[gnu_off:gnu_off + len(table)] = table
+
+    dynsym_off = RO + 0x300
+    for i, (_, info, shndx, value, size) in enumerate(syms):
+        struct.pack_into('<IBBHQQ', img, dynsym_off + i * 0x18, name_offsets[i], info, 0, shndx, value, size)
+    dynstr_off = dynsym_off + len(syms) * 0x18
+    img[dynstr_off:dynstr_off + len(dynstr)] = dynstr
+
+    # PLT stubs loading the two .got.plt slots after the reserved ones
+    slots = [GOT_PLT + 3 * 8, GOT_PLT + 4 * 8]
+    for k, slot in enumerate(slots):
+        pc = PLT + k * 0x10
+        struct.pack_into('<IIII', img, pc, _adrp(16, pc, slot), 0xF9400211 | ((slot & 0xFFF) >> 3) << 10,
+                         0x91000210 | (slot & 0xFFF) << 10, 0xD61F0220)
+    # calls between the functions and into the PLT
+    for pc, target in ((0x110, 0x200), (0x210, 0x400), (0x410, 0x100), (0x414, PLT)):
+        struct.pack_into('<I', img, pc, bl(pc, target))
+    for start, size in FUNCS:
+        struct.pack_into('<I', img, start + size - 4, 0xD65F03C0)  # ret
+
+    rela_off = RO + 0x600
+    relas = [(INIT_ARRAY + 8 * k, 1027, 0x100 + 0x100 * k) for k in range(4)]  # RELATIVE
+    relas.append((GOT, 5 << 32 | 1025, 0))  # GLOB_DAT
+    relas.append((GOT + 8, 3 << 32 | 257, 0x10))  # ABS64 imp_data+0x10
+    rela = b''.join(struct.pack('<QQq', *r) for r in relas)
+    img[rela_off:rela_off + len(rela)] = rela
+
+    relr_off = rela_off + len(rela)
+    relr = [RELR_BASE, 0b1011 << 1 | 1, RELR_BASE + 0x400]
+    for k, target in enumerate(relr_locations()):
+        struct.pack_into('<Q', img, target, 0x100 * (k + 1))
+    relr = struct.pack('<%dQ' % len(relr), *relr)
+    img[relr_off:relr_off + len(relr)] = relr
+
+    jmprel_off = relr_off + len(relr)
+    jmprel = b''.join(struct.pack('<QQq', slot, (k + 1) << 32 | 1026, 0) for k, slot in enumerate(slots))
+    img[jmprel_off:jmprel_off + len(jmprel)] = jmprel
+
+    # .eh_frame: a CIE and an FDE per function, then .eh_frame_hdr
+    eh_frame = RO + 0x900
+    cie = struct.pack('<IB', 0, 1) + b'zR\x00' + _uleb(1) + b'\x78' + _uleb(30) + _uleb(1) + b'\x1B' + b'\x0C\x1F\x00'
+    cie += b'\x00' * (-(len(cie) + 4) % 8)
+    frame = bytearray(struct.pack('<I', len(cie)) + cie)
+    fdes = []
+    for start, size in FUNCS:
+        pos = eh_frame + len(frame)
+        fdes.append(pos)
+        body = struct.pack('<Iii', pos + 4 - eh_frame, start - (pos + 8), size) + _uleb(0)
+        body += b'\x00' * (-(len(body) + 4) % 8)
+        frame += struct.pack('<I', len(body)) + body
+    frame += b'\x00' * 4
+    img[eh_frame:eh_frame + len(frame)] = frame
+    eh_hdr = eh_frame + len(frame) + 0x10
+    hdr = b'\x01\x1B\x03\x3B' + struct.pack('<iI', eh_frame - (eh_hdr + 4), len(FUNCS))
+    hdr += b''.join(struct.pack('<ii', start - eh_hdr, pos - eh_hdr) for (start, _), pos in zip(FUNCS, fdes))
+    img[eh_hdr:eh_hdr + len(hdr)] = hdr
+
+    dynamic = [
+        (1, needed),
+        (5, dynstr_off), (10, len(dynstr)), (6, dynsym_off), (11, 0x18),
+        (7, rela_off), (8, len(rela)), (9, 0x18),
+        (0x24, relr_off), (0x23, len(relr)), (0x25, 8),
+        (23, jmprel_off), (2, len(jmprel)), (20, 7), (3, GOT_PLT),
+        (25, INIT_ARRAY), (27, 32),
+    ]
+    if sysv_hash:
+        dynamic.append((4, sysv_off))
+    if gnu_hash_table:
+        dynamic.append((0x6FFFFEF5, gnu_off))
+    dynamic.append((0, 0))
+    for k, entry in enumerate(dynamic):
+        struct.pack_into('<QQ', img, DATA + k * 16, *entry)
+
+    bss = DATA + DSIZE
+    struct.pack_into('<4s6i', img, modoff, b'MOD0', DATA - modoff, bss - modoff, bss + BSS - modoff,
+                     eh_hdr - modoff, eh_hdr + len(hdr) - modoff, bss + 0x10 - modoff)
+    return img
+
+
+def relr_locations():
+    """
+    :return: locations the RELR table of build_image() relocates
+    :rtype: list[int]
+    """
+    return [RELR_BASE, RELR_BASE + 8, RELR_BASE + 16, RELR_BASE + 32, RELR_BASE + 0x400]
+
+
+def make_nso(img, compress=True, hashes=True):
+    """
+    :type img: bytearray | bytes
+    :param compress: compress every segment with LZ4
+    :param hashes: set the flags to check the segment hashes
+    :rtype: bytes
+    """
+    segments = [bytes(img[TEXT:TEXT + TSIZE]), bytes(img[RO:RO + RSIZE]), bytes(img[DATA:DATA + DSIZE])]
+    payloads = [lz4.block.compress(s, store_size=False) if compress else s for s in segments]
+    flags = (7 if compress else 0) | (0x38 if hashes else 0)
+    hdr = bytearray(0x100)
+    hdr[0:4] = b'NSO0'
+    struct.pack_into('<I', hdr, 0xC, flags)
+    offset = 0x100
+    for k, (vaddr, size) in enumerate(((TEXT, TSIZE), (RO, RSIZE), (DATA, DSIZE))):
+        struct.pack_into('<III', hdr, 0x10 + k * 0x10, offset, vaddr, size)
+        offset += len(payloads[k])
+    struct.pack_into('<I', hdr, 0x3C, BSS)
+    hdr[0x40:0x60] = b'\xAB' * 0x20
+    struct.pack_into('<III', hdr, 0x60, *[len(p) for p in payloads])
+    for k, s in enumerate(segments):
+        hdr[0xA0 + k * 0x20:0xC0 + k * 0x20] = hashlib.sha256(s).digest()
+    return bytes(hdr) + b''.join(payloads)
+
+
+@contextlib.contextmanager
+def without_numpy(*modules):
+    """
+    Run the pure Python fallbacks of modules that use compat.numpy.
+    """
+    saved = [module.numpy for module in modules]
+    for module in modules:
+        module.numpy = None
+    try:
+        yield
+    finally:
+        for module, numpy in zip(modules, saved):
+            module.numpy = numpy
@@ -0,0 +1,95 @@
+import io
+import random
+import struct
+import unittest
+
+from nxo64 import aarch64
+from nxo64.aarch64 import BR_X17, find_bl_targets, find_plt_stubs
+from nxo64.compat import numpy
+from nxo64.files import load_nxo
+
+from .fixtures import FUNCS, GOT_PLT, PLT, TSIZE, bl, build_image, make_nso, without_numpy
+
+
+def _code(*words):
+    return struct.pack('<%dI' % len(words), *words)
+
+
+def _stub(pc, slot):
+    """
+    :return: adrp x16; ldr x17, [x16, #off]; add x16, x16, #off; br x17 loading slot
+    :rtype: tuple[int, int, int, int]
+    """
+    page = ((slot & ~0xFFF) - (pc & ~0xFFF)) >> 12
+    return (0x90000010 | (page & 3) << 29 | ((page >> 2) & 0x7FFFF) << 5,
+            0xF9400211 | ((slot & 0xFFF) >> 3) << 10, 0x91000210 | (slot & 0xFFF) << 10, BR_X17)
+
+
+def _random_code(seed, count=0x4000):
+    """
+    Random words with plenty of bl, br x17 and stub halves in them.
+    """
+    rng = random.Random(seed)
+    words = []
+    while len(words) < count:
+        kind = rng.randrange(6)
+        if kind == 0:
+            imm = rng.randrange(-0x4000, 0x4000) if rng.randrange(2) else rng.getrandbits(26)
+            words.append(0x94000000 | imm & 0x3FFFFFF)
+        elif kind == 1:
+            pc = len(words) * 4
+            words.extend(_stub(pc, 0x20000 + rng.randrange(-0x100, 0x200) * 8))
+        elif kind == 2:
+            words.append(BR_X17)
+        else:
+            words.append(rng.getrandbits(32))
+    return _code(*words[:count])
+
+
+class FindPltStubsTest(unittest.TestCase):
+    def test_stubs(self):
+        text = _code(0, *(_stub(4, 0x3008) + _stub(0x14, 0x3010) + _stub(0x24, 0x5000)))
+        self.assertEqual(find_plt_stubs(text, 0x3000, 0x4000), [(4, 0x3008), (0x14, 0x3010)])
+
+    def test_br_without_stub(self):
+        text = _code(BR_X17, 0, BR_X17, 0x90000010, 0, 0, BR_X17)
+        self.assertEqual(find_plt_stubs(text, 0, 0x100000), [])
+
+    def test_fixture(self):
+        f = load_nxo(io.BytesIO(make_nso(build_image())))
+        self.assertEqual(f.plt_entries, [(PLT, GOT_PLT + 3 * 8), (PLT + 0x10, GOT_PLT + 4 * 8)])
+
+    @unittest.skipIf(numpy is None, 'needs NumPy')
+    def test_fallback_matches_numpy(self):
+        for seed in range(4):
+            text = _random_code(seed)
+            expected = find_plt_stubs(text, 0x1F000, 0x21000)
+            self.assertTrue(expected)
+            with without_numpy(aarch64):
+                self.assertEqual(find_plt_stubs(text, 0x1F000, 0x21000), expected)
+
+
+class FindBlTargetsTest(unittest.TestCase):
+    def test_targets(self):
+        text = _code(bl(0, 0x10), bl(4, 0), bl(8, 0xC), bl(0xC, 0x14), bl(0x10, 0x100), bl(0x14, -4), 0)
+        # calls to the next two instructions and outside text are skipped
+        self.assertEqual(find_bl_targets(text), [0, 0x10])
+        self.assertEqual(find_bl_targets(text, 0x1000), [0x1000, 0x1010])
+
+    def test_fixture(self):
+        text = bytes(build_image()[:TSIZE])
+        self.assertEqual(find_bl_targets(text), [start for start, _ in FUNCS[:3]] + [PLT])
+
+    @unittest.skipIf(numpy is None, 'needs NumPy')
+    def test_fallback_matches_numpy(self):
+        for seed in range(4):
+            # an odd length leaves a partial word at the end
+            text = _random_code(seed) + b'\x94'
+            expected = find_bl_targets(text, 0x100)
+            self.assertTrue(expected)
+            with without_numpy(aarch64):
+                self.assertEqual(find_bl_targets(text, 0x100), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
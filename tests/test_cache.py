@@ -0,0 +1,89 @@
+import io
+import marshal
+import os
+import shutil
+import tempfile
+import unittest
+
+from nxo64 import cache
+from nxo64.cache import ParseCache
+from nxo64.files import load_nxo
+
+from .fixtures import TSIZE, build_image, make_nso
+
+
+def _modified(img):
+    """
+    :return: the image with a byte of .text changed
+    :rtype: bytearray
+    """
+    img = bytearray(img)
+    img[TSIZE - 4] ^= 0xFF
+    return img
+
+
+class ParseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = ParseCache(os.path.join(self.dir, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _entries(self):
+        return sorted(name for name in os.listdir(self.cache.directory) if name.endswith(ParseCache.SUFFIX))
+
+    def test_key_from_hashed_header(self):
+        img = build_image()
+        data = make_nso(img)
+        # the header, hashes included, stays the same when only the rest is rewritten
+        same_header = data[:0x100] + make_nso(_modified(img))[0x100:]
+        self.assertEqual(ParseCache.key_for(io.BytesIO(data)), ParseCache.key_for(io.BytesIO(same_header)))
+
+    def test_key_from_content_without_hash_flags(self):
+        img = build_image()
+        data = make_nso(img, hashes=False)
+        # hashes are present, but the flags say they aren't checked
+        same_header = data[:0x100] + make_nso(_modified(img), hashes=False)[0x100:]
+        self.assertNotEqual(ParseCache.key_for(io.BytesIO(data)), ParseCache.key_for(io.BytesIO(same_header)))
+        self.assertEqual(ParseCache.key_for(io.BytesIO(data)), ParseCache.key_for(io.BytesIO(data)))
+
+    def test_round_trip(self):
+        state = {'header': (1, 2, b'\x00'), 'names': ['a', 'b']}
+        self.assertIsNone(self.cache.get('k'))
+        self.cache.put('k', state)
+        self.assertEqual(self.cache.get('k'), state)
+        self.assertEqual(self._entries(), ['k' + ParseCache.SUFFIX])
+
+    def test_unreadable_entries(self):
+        with open(os.path.join(self.cache.directory, 'bad' + ParseCache.SUFFIX), 'wb') as fileobj:
+            fileobj.write(b'\x00garbage')
+        self.assertIsNone(self.cache.get('bad'))
+        with open(os.path.join(self.cache.directory, 'old' + ParseCache.SUFFIX), 'wb') as fileobj:
+            fileobj.write(marshal.dumps((cache.CACHE_FORMAT - 1, {})))
+        self.assertIsNone(self.cache.get('old'))
+
+    def test_evict_least_recently_used(self):
+        for i, key in enumerate(('a', 'b', 'c')):
+            self.cache.put(key, {'data': b'\x00' * 100})
+            os.utime(self.cache._path(key), (1000 + i, 1000 + i))
+        size = os.path.getsize(self.cache._path('a'))
+        self.cache.get('a')  # now the most recently used
+        self.cache.max_size = 2 * size
+        self.cache.evict()
+        self.assertEqual(self._entries(), ['a' + ParseCache.SUFFIX, 'c' + ParseCache.SUFFIX])
+
+    def test_load_from_cache(self):
+        data = make_nso(build_image())
+        first = load_nxo(io.BytesIO(data), cache=self.cache)
+        self.assertEqual(len(self._entries()), 1)
+        second = load_nxo(io.BytesIO(data), cache=self.cache)
+        # a hit parses nothing, segments load lazily
+        self.assertEqual(second.materialized_segments, [])
+        self.assertEqual(second.sections, first.sections)
+        self.assertEqual([repr(sym) for sym in second.symbols], [repr(sym) for sym in first.symbols])
+        self.assertEqual(second.eh_table, first.eh_table)
+
+
+if __name__ == '__main__':
+    unittest.main()
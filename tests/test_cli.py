@@ -0,0 +1,66 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from nxo64.cli import main, scan_file
+
+from .fixtures import build_image, make_nso
+
+
+class CliTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.good = self._write('modules/main.nso', make_nso(build_image()))
+        self._write('modules/readme.txt', b'not a module')
+        self.truncated = self._write('truncated.nso', make_nso(build_image())[:0x180])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, data):
+        path = os.path.join(self.dir, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as fileobj:
+            fileobj.write(data)
+        return path
+
+    def _run(self, *argv):
+        output = os.path.join(self.dir, 'out.jsonl')
+        status = main(['-j', '1', '-o', output] + list(argv))
+        with open(output) as fileobj:
+            records = [json.loads(line) for line in fileobj]
+        return status, sorted(records, key=lambda record: record['path'])
+
+    def test_scan_file(self):
+        record = scan_file(self.good, verify=True)
+        self.assertEqual(record['format'], 'NSO')
+        self.assertEqual(record['name'], 'main')
+        self.assertEqual(record['needed'], ['nnSdk.nso'])
+        self.assertEqual(record['hash_mismatches'], [])
+
+    def test_error_records(self):
+        listing = self._write('list.txt', ('%s\n\n%s\n' % (self.truncated, os.path.join(self.dir, 'missing.nso')))
+                              .encode('utf-8'))
+        status, records = self._run(os.path.join(self.dir, 'modules'), '--list', listing)
+        self.assertEqual(status, 1)
+        # directories only yield modules, listed files are always reported
+        self.assertEqual([record['path'] for record in records],
+                         [os.path.join(self.dir, 'missing.nso'), self.good, self.truncated])
+        missing, good, truncated = records
+        self.assertNotIn('error', good)
+        self.assertEqual(good['symbols'], 9)
+        self.assertTrue(missing['error'].startswith(('IOError', 'OSError', 'FileNotFoundError')))
+        self.assertIn('error', truncated)
+        self.assertEqual(set(missing), set(['path', 'error']))
+
+    def test_no_errors(self):
+        status, records = self._run(self.good)
+        self.assertEqual(status, 0)
+        self.assertEqual(len(records), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import io
+import struct
+import unittest
+
+from nxo64 import compat, diff
+from nxo64.diff import Function, FunctionDiff, diff_modules, split_functions
+from nxo64.files import load_nxo
+from nxo64.nxo_exceptions import NxoException
+
+from .fixtures import FUNCS, PLT, bl, build_image, make_nso, without_numpy
+
+
+def _load(img):
+    return load_nxo(io.BytesIO(make_nso(img)))
+
+
+def _functions(specs):
+    """
+    :param specs: (name, hash) per function, 0x10 bytes apart
+    :rtype: list[Function]
+    """
+    return [Function(0x10 * i, 0x10 * i + 0x10, name, h) for i, (name, h) in enumerate(specs)]
+
+
+class SplitFunctionsTest(unittest.TestCase):
+    def test_fixture(self):
+        functions = split_functions(_load(build_image()))
+        # eh_frame_hdr starts, function symbols and bl targets, the .plt included
+        self.assertEqual([(fn.start, fn.end) for fn in functions],
+                         [(start, start + size) for start, size in FUNCS] + [(PLT, PLT + 0x20)])
+        self.assertEqual([fn.name for fn in functions], ['func_one', 'func_two', 'func_three', 'weak_y', None])
+        self.assertEqual(len(set(fn.hash for fn in functions)), len(functions))
+
+    def test_without_numpy(self):
+        f = _load(build_image())
+        expected = [(fn.start, fn.end, fn.name, fn.hash) for fn in split_functions(f)]
+        with without_numpy(compat, diff):
+            self.assertEqual([(fn.start, fn.end, fn.name, fn.hash) for fn in split_functions(f)], expected)
+
+    def test_masked_branches(self):
+        img = build_image()
+        hashes = [fn.hash for fn in split_functions(_load(img))]
+        # a call to another place hashes the same, other instructions don't
+        struct.pack_into('<I', img, 0x110, bl(0x110, 0x600))
+        self.assertEqual([fn.hash for fn in split_functions(_load(img))], hashes)
+        struct.pack_into('<I', img, 0x120, 0xD2800020)  # mov x0, #1
+        changed = [fn.hash for fn in split_functions(_load(img))]
+        self.assertNotEqual(changed[0], hashes[0])
+        self.assertEqual(changed[1:], hashes[1:])
+
+    def test_armv7(self):
+        f = _load(build_image())
+        f.armv7 = True
+        self.assertRaises(NxoException, split_functions, f)
+        self.assertRaises(NxoException, diff_modules, f, _load(build_image()))
+
+
+class FunctionDiffTest(unittest.TestCase):
+    def _methods(self, result):
+        return [(a.start // 0x10, b.start // 0x10, method) for a, b, method in result.matches]
+
+    def test_matching(self):
+        old = _functions([('a', b'1'), (None, b'2'), (None, b'3'), (None, b'4'), (None, b'4')])
+        new = _functions([('a', b'1x'), (None, b'5'), (None, b'3'), (None, b'4'), (None, b'4'), (None, b'6')])
+        result = FunctionDiff(old, new)
+        # names first, then unique hashes, then neighbors of matched functions
+        self.assertEqual(self._methods(result), [(0, 0, 'name'), (1, 1, 'neighbor'), (2, 2, 'hash'),
+                                                 (3, 3, 'neighbor'), (4, 4, 'neighbor')])
+        self.assertEqual([(a.start, b.start) for a, b in result.changed], [(0, 0), (0x10, 0x10)])
+        self.assertEqual(len(result.unchanged), 3)
+        self.assertEqual(result.added, [new[5]])
+        self.assertEqual(result.removed, [])
+
+    def test_neighbors_backward(self):
+        old = _functions([(None, b'1'), (None, b'2'), ('c', b'3')])
+        new = _functions([(None, b'0'), (None, b'1x'), (None, b'2x'), ('c', b'3')])
+        result = FunctionDiff(old, new)
+        self.assertEqual(self._methods(result), [(0, 1, 'neighbor'), (1, 2, 'neighbor'), (2, 3, 'name')])
+        self.assertEqual(result.added, [new[0]])
+
+    def test_removed(self):
+        old = _functions([('a', b'1'), (None, b'2'), (None, b'2')])
+        new = _functions([('a', b'1')])
+        result = FunctionDiff(old, new)
+        self.assertEqual(self._methods(result), [(0, 0, 'name')])
+        self.assertEqual(result.removed, old[1:])
+
+    def test_modules(self):
+        img = build_image()
+        old = _load(img)
+        struct.pack_into('<I', img, 0x220, 0xD2800020)  # mov x0, #1 in func_two
+        result = diff_modules(old, _load(img))
+        self.assertEqual([(a.name, b.name) for a, b in result.changed], [('func_two', 'func_two')])
+        self.assertEqual(len(result.unchanged), len(FUNCS))
+        self.assertEqual((result.added, result.removed), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
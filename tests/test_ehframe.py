@@ -0,0 +1,72 @@
+import io
+import struct
+import unittest
+
+from nxo64.ehframe import EhFrame
+from nxo64.files import load_nxo
+from nxo64.nxo_exceptions import NxoException
+
+from .fixtures import FUNCS, RO, build_image, make_nso
+
+EH_FRAME = RO + 0x900
+
+
+def _load(img):
+    return load_nxo(io.BytesIO(make_nso(img)))
+
+
+def _section_names(f):
+    return [name for _, _, name, _ in f.sections]
+
+
+class EhFrameTest(unittest.TestCase):
+    def test_lookup(self):
+        f = _load(build_image())
+        self.assertEqual([start for start, _ in f.eh_table], [start for start, _ in FUNCS])
+        for start, size in FUNCS:
+            for address in (start, start + size - 4):
+                fde = f.fde_for_address(address)
+                self.assertEqual((fde.start_address, fde.end_address), (start, start + size))
+                self.assertEqual(fde.cie.offset, EH_FRAME)
+            self.assertIsNone(f.fde_for_address(start + size))
+        self.assertIsNone(f.fde_for_address(0))
+        self.assertIs(f.eh_frame.lookup(FUNCS[0][0]), f.fde_for_address(FUNCS[0][0]))
+        self.assertIn('.eh_frame', _section_names(f))
+
+    def test_record_past_the_end(self):
+        img = build_image()
+        f = _load(img)
+        fde = f.eh_table[-1][1]
+        struct.pack_into('<I', img, fde, 0x7FFFFFF0)
+        f = _load(img)
+        # the table is dropped, the rest of the layout is still there
+        self.assertEqual(f.eh_table, [])
+        self.assertNotIn('.eh_frame', _section_names(f))
+        self.assertIn('.eh_frame_hdr', _section_names(f))
+        self.assertRaises(NxoException, f.fde_for_address, FUNCS[-1][0])
+        self.assertEqual(f.fde_for_address(FUNCS[0][0]).start_address, FUNCS[0][0])
+
+    def test_truncated_cie(self):
+        img = build_image()
+        # long enough for the CIE id and version, not the augmentation
+        struct.pack_into('<I', img, EH_FRAME, 5)
+        f = _load(img)
+        self.assertEqual(len(f.eh_table), len(FUNCS))
+        self.assertRaises(NxoException, f.fde_for_address, FUNCS[0][0])
+
+    def test_truncated_view(self):
+        img = build_image()
+        f = _load(img)
+        hdr_start, hdr_end = f.unwindoff, f.unwindend
+        data = memoryview(bytes(img[:hdr_end]))
+        # .eh_frame is cut in the middle of the second FDE's length field
+        cut = f.eh_table[1][1] + 2
+        eh_frame = EhFrame(lambda start, end: data[start:end] if start >= hdr_start else data[start:min(end, cut)],
+                           hdr_start, hdr_end)
+        self.assertEqual(eh_frame.lookup(FUNCS[0][0]).start_address, FUNCS[0][0])
+        self.assertRaises(NxoException, eh_frame.lookup, FUNCS[1][0])
+        self.assertRaises(NxoException, lambda: eh_frame.end)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from nxo64.compat import mmap_views
+from nxo64.files import NxoImage, SegmentSource, load_nxo
+
+from .fixtures import DATA, RO, build_image, make_nso
+
+
+class LazyLoadingTest(unittest.TestCase):
+    def test_lazy_segments_load_on_first_read(self):
+        img = build_image()
+        f = load_nxo(io.BytesIO(make_nso(img)), lazy=True)
+        # the tables all lie in the first page of .rodata and .data
+        self.assertEqual(f.lookup_symbol('func_two').value, 0x200)
+        self.assertEqual(f.materialized_segments, [])
+        self.assertEqual(f.image.segment('.data').tobytes(), bytes(img[DATA:]))
+        self.assertEqual(f.materialized_segments, ['.data'])
+
+    def test_prefix_read_leaves_segment_lazy(self):
+        image = NxoImage(0x3000)
+        image.add_segment('.text', 0, 0x3000, SegmentSource.from_bytes(b'\x11' * 0x2000), lazy=True)
+        image.seek(0)
+        self.assertEqual(image.read(4), b'\x11' * 4)
+        self.assertFalse(image.is_materialized('.text'))
+        self.assertEqual(image.materialized_segments, [])
+
+    def test_prefix_covering_segment_materializes_it(self):
+        image = NxoImage(0x1000)
+        image.add_segment('.text', 0, 0x1000, SegmentSource.from_bytes(b'\x22' * 0x40), lazy=True)
+        image.seek(0)
+        self.assertEqual(image.read(4), b'\x22' * 4)
+        self.assertTrue(image.is_materialized('.text'))
+        self.assertEqual(image.segment('.text').tobytes(), b'\x22' * 0x40)
+
+    def test_read_returns_content(self):
+        image = NxoImage(0x100)
+        image.add_segment('.text', 0, 0x100, SegmentSource.from_segment(memoryview(b'abcdefgh')), lazy=True)
+        image.seek(2)
+        data = image.read(4)
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(data, b'cdef')
+
+    def test_lazy_matches_eager(self):
+        data = make_nso(build_image())
+        eager = load_nxo(io.BytesIO(data))
+        lazy = load_nxo(io.BytesIO(data), lazy=True)
+        self.assertEqual(lazy.eh_table, eager.eh_table)
+        self.assertEqual(lazy.image.view(RO, DATA).tobytes(), eager.image.view(RO, DATA).tobytes())
+
+
+class PreviousBuildTest(unittest.TestCase):
+    def test_unchanged_segments_reused(self):
+        data = make_nso(build_image())
+        old = load_nxo(io.BytesIO(data))
+        old.symbols
+        f = load_nxo(io.BytesIO(data), lazy=True, previous=old)
+        self.assertEqual([repr(sym) for sym in f.symbols], [repr(sym) for sym in old.symbols])
+        self.assertEqual(f.image.segment('.data').tobytes(), old.image.segment('.data').tobytes())
+
+    def test_closed_previous_build(self):
+        img = build_image()
+        with load_nxo(io.BytesIO(make_nso(img))) as old:
+            symbols = [repr(sym) for sym in old.symbols]
+        f = load_nxo(io.BytesIO(make_nso(img)), previous=old)
+        self.assertEqual([repr(sym) for sym in f.symbols], symbols)
+        self.assertEqual(f.image.segment('.rodata').tobytes(), bytes(img[RO:DATA]))
+
+
+class MappedFileTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, data):
+        path = os.path.join(self.dir, 'main.nso')
+        with open(path, 'wb') as fileobj:
+            fileobj.write(data)
+        return path
+
+    def test_path_matches_file_object(self):
+        img = build_image()
+        path = self._write(make_nso(img, compress=False))
+        with load_nxo(path) as f:
+            self.assertEqual(f.image.segment('.rodata').tobytes(), bytes(img[RO:DATA]))
+            self.assertEqual(f.eh_table, load_nxo(io.BytesIO(make_nso(img))).eh_table)
+            # uncompressed segments are used in place where the mapping can be viewed
+            self.assertEqual(f.image._get_segment('.rodata').backing is not f.image.buffer, mmap_views)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import io
+import struct
+import unittest
+
+from nxo64 import compat, moduleset
+from nxo64.consts import SHN_ABS
+from nxo64.files import load_nxo
+from nxo64.moduleset import ModuleSet
+
+from .fixtures import GOT, RO, build_image, make_nso, symbols, without_numpy
+
+BASES = [0x8000000, 0x9000000]
+ABS_VALUE = 0x1234
+
+
+def _index(name):
+    return [sym[0] for sym in symbols()].index(name)
+
+
+def _provider():
+    """
+    :return: the fixture with imp_a defined in .text and imp_data absolute,
+             imp_b stays undefined
+    :rtype: bytearray
+    """
+    img = build_image()
+    for name, shndx, value in (('imp_a', 1, 0x100), ('imp_data', SHN_ABS, ABS_VALUE)):
+        struct.pack_into('<HQ', img, RO + 0x300 + _index(name) * 0x18 + 6, shndx, value)
+    return img
+
+
+class ModuleSetTest(unittest.TestCase):
+    def setUp(self):
+        modules = [load_nxo(io.BytesIO(make_nso(img))) for img in (build_image(), _provider())]
+        self.modules = ModuleSet(modules, ['main', 'sdk'])
+
+    def test_link(self):
+        ms = self.modules
+        self.assertEqual(ms.index('sdk'), 1)
+        # the first definition wins
+        self.assertEqual(ms.exports['func_one'], (0, _index('func_one')))
+        self.assertEqual(ms.exports['imp_data'], (1, _index('imp_data')))
+        self.assertNotIn('imp_b', ms.exports)
+        self.assertEqual(ms.resolve(0, _index('imp_a')), (1, _index('imp_a')))
+        self.assertIsNone(ms.resolve(0, _index('imp_b')))
+        self.assertIsNone(ms.resolve(0, _index('func_one')))
+        self.assertEqual([sym.name for sym in ms.unresolved(0)], ['imp_b'])
+        self.assertEqual([sym.name for sym in ms.unresolved(1)], ['imp_b'])
+
+    def _addresses(self, module_index):
+        return [int(address) for address in self.modules.addresses(module_index, BASES)]
+
+    def test_addresses(self):
+        for i in range(2):
+            addresses = self._addresses(i)
+            self.assertEqual(addresses[0], -1)
+            self.assertEqual(addresses[_index('imp_a')], BASES[1] + 0x100)
+            self.assertEqual(addresses[_index('imp_b')], -1)
+            self.assertEqual(addresses[_index('func_two')], BASES[i] + 0x200)
+            # absolute, whether imported or defined in the module itself
+            self.assertEqual(addresses[_index('imp_data')], ABS_VALUE)
+
+    def test_addresses_without_numpy(self):
+        expected = [self._addresses(i) for i in range(2)]
+        with without_numpy(compat, moduleset):
+            self.modules.link()
+            self.assertEqual([self._addresses(i) for i in range(2)], expected)
+
+    def test_resolver(self):
+        resolve = self.modules.resolver(0, BASES)
+        syms = self.modules.modules[0].symbols
+        self.assertEqual(resolve(syms[_index('imp_a')]), BASES[1] + 0x100)
+        self.assertEqual(resolve(syms[_index('imp_data')]), ABS_VALUE)
+        self.assertIsNone(resolve(syms[_index('imp_b')]))
+        img, unresolved = self.modules.modules[0].relocated_image(BASES[0], resolve)
+        # ABS64 imp_data+0x10
+        self.assertEqual(struct.unpack_from('<Q', img, GOT + 8)[0], ABS_VALUE + 0x10)
+        self.assertEqual([int(i) for i in unresolved.sym_indices], [_index('imp_b')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import io
+import struct
+import unittest
+
+from nxo64 import relocations
+from nxo64.compat import numpy
+from nxo64.consts import R_AArch64, R_Arm, R_FAKE_RELR
+from nxo64.files import load_nxo
+from nxo64.relocations import RelocationTable, apply_relocations, decode_relr
+
+from .fixtures import DATA, GOT, INIT_ARRAY, build_image, make_nso, relr_locations, without_numpy
+
+# address, bitmap, bitmap continuing 63 words later with only its top bit set,
+# address, empty bitmap and an address below the others
+RELR = struct.pack('<6Q', 0x1000, 0b101 << 1 | 1, 1 << 63 | 1, 0x3000, 1, 0x800)
+RELR_OFFSETS = [0x800, 0x1000, 0x1008, 0x1018, 0x13F0, 0x3000]
+
+RELA = b''.join(struct.pack('<QQq', *r) for r in (
+    (0x10, R_AArch64.RELATIVE, 0x100),
+    (0x18, 2 << 32 | R_AArch64.GLOB_DAT, 0),
+    (0x20, 1 << 32 | R_AArch64.ABS64, 0x10),
+    (0x28, 3 << 32 | R_AArch64.TLSDESC, 0),
+    (0x30, 1 << 32 | R_AArch64.JUMP_SLOT, 0),
+    (0x1000, R_AArch64.RELATIVE, 0),
+))
+
+REL = b''.join(struct.pack('<II', *r) for r in (
+    (0x10, R_Arm.RELATIVE),
+    (0x14, 1 << 8 | R_Arm.ABS32),
+    (0x18, 2 << 8 | R_Arm.GLOB_DAT),
+))
+
+
+def _rows(table):
+    """
+    :type table: RelocationTable
+    :rtype: list[tuple[int, int, int, int]]
+    """
+    return [tuple(int(v) for v in row)
+            for row in zip(table.offsets, table.types, table.sym_indices, table.addends)]
+
+
+class DecodeRelrTest(unittest.TestCase):
+    def test_decode(self):
+        self.assertEqual([int(o) for o in decode_relr(RELR)], RELR_OFFSETS)
+
+    def test_bitmap_without_address_and_partial_entry(self):
+        data = struct.pack('<Q', 0b11) + RELR + b'\x00\x00\x00'
+        self.assertEqual([int(o) for o in decode_relr(data)], RELR_OFFSETS)
+
+    def test_empty(self):
+        self.assertEqual(len(decode_relr(b'')), 0)
+
+    @unittest.skipIf(numpy is None, 'needs NumPy')
+    def test_fallback_matches_numpy(self):
+        expected = decode_relr(RELR).tolist()
+        with without_numpy(relocations):
+            self.assertEqual(list(decode_relr(RELR)), expected)
+
+
+class RelocationTableTest(unittest.TestCase):
+    def test_from_bytes(self):
+        table = RelocationTable.from_bytes(RELA, False)
+        self.assertTrue(table.has_addends)
+        self.assertEqual(_rows(table)[:3], [(0x10, 1027, 0, 0x100), (0x18, 1025, 2, 0), (0x20, 257, 1, 0x10)])
+        table = RelocationTable.from_bytes(REL + b'\x00', True)
+        self.assertFalse(table.has_addends)
+        self.assertEqual(_rows(table), [(0x10, 23, 0, 0), (0x14, 2, 1, 0), (0x18, 21, 2, 0)])
+
+    def test_concat_and_select(self):
+        table = RelocationTable.concat([RelocationTable.from_bytes(RELA, False), RelocationTable.from_relr(RELR)])
+        self.assertEqual(len(table), 12)
+        self.assertEqual(_rows(table)[6:8], [(0x800, R_FAKE_RELR, 0, 0), (0x1000, R_FAKE_RELR, 0, 0)])
+        self.assertEqual(_rows(table.of_type(R_AArch64.RELATIVE)), [(0x10, 1027, 0, 0x100), (0x1000, 1027, 0, 0)])
+        self.assertEqual(len(table.of_type(R_AArch64.GLOB_DAT, R_AArch64.JUMP_SLOT)), 2)
+        self.assertEqual(len(RelocationTable.concat([])), 0)
+
+    def test_locations(self):
+        table = RelocationTable.concat([RelocationTable.from_bytes(RELA, False), RelocationTable.from_relr(RELR)])
+        self.assertEqual([int(o) for o in table.locations],
+                         sorted(set([0x10, 0x18, 0x20, 0x30] + RELR_OFFSETS)))
+        self.assertIn(0x13F0, table)
+        self.assertNotIn(0x28, table)  # TLS descriptor
+        self.assertEqual(list(table.contains([0x18, 0x28, 0x3000])), [True, False, True])
+
+    def test_state_round_trip(self):
+        table = RelocationTable.from_bytes(REL, True)
+        state = table.get_state()
+        self.assertEqual(state[0], struct.pack('<3q', 0x10, 0x14, 0x18))
+        restored = RelocationTable.from_state(state)
+        self.assertEqual(_rows(restored), _rows(table))
+        self.assertFalse(restored.has_addends)
+
+    @unittest.skipIf(numpy is None, 'needs NumPy')
+    def test_fallback_matches_numpy(self):
+        def run():
+            table = RelocationTable.concat([RelocationTable.from_bytes(RELA, False),
+                                            RelocationTable.from_relr(RELR)])
+            return (_rows(table), _rows(table.of_type(R_FAKE_RELR, R_AArch64.ABS64)),
+                    [int(o) for o in table.locations], table.get_state())
+
+        expected = run()
+        with without_numpy(relocations):
+            self.assertEqual(run(), expected)
+
+
+class ApplyRelocationsTest(unittest.TestCase):
+    def _apply_rela(self):
+        buf = bytearray(0x40)
+        struct.pack_into('<Q', buf, 0x38, 0x200)
+        table = RelocationTable.concat([RelocationTable.from_bytes(RELA, False),
+                                        RelocationTable.from_relr(struct.pack('<Q', 0x38))])
+        # symbol 1 unresolved, symbol 2 resolved
+        failed = apply_relocations(buf, table, 0x7100000000, [None, None, 0x7100004000], False)
+        return buf, failed
+
+    def test_rela(self):
+        buf, failed = self._apply_rela()
+        self.assertEqual(struct.unpack_from('<Q', buf, 0x10)[0], 0x7100000100)
+        self.assertEqual(struct.unpack_from('<Q', buf, 0x18)[0], 0x7100004000)
+        self.assertEqual(struct.unpack_from('<Q', buf, 0x38)[0], 0x7100000200)
+        # unresolved symbols, the TLS descriptor and the location past the end
+        self.assertEqual([int(o) for o in failed.offsets], [0x20, 0x28, 0x30, 0x1000])
+        self.assertEqual(struct.unpack_from('<Q', buf, 0x20)[0], 0)
+
+    def test_rel(self):
+        buf = bytearray(0x20)
+        struct.pack_into('<II', buf, 0x10, 0x1300, 4)
+        table = RelocationTable.from_bytes(REL, True)
+        failed = apply_relocations(buf, table, 0xFFFFF000, [None, 0x2000, None], True)
+        # REL addends come from the patched words, which wrap around at 32 bits
+        self.assertEqual(struct.unpack_from('<II', buf, 0x10), (0x300, 0x2004))
+        self.assertEqual([int(o) for o in failed.offsets], [0x18])
+
+    @unittest.skipIf(numpy is None, 'needs NumPy')
+    def test_fallback_matches_numpy(self):
+        buf, failed = self._apply_rela()
+        with without_numpy(relocations):
+            fallback_buf, fallback_failed = self._apply_rela()
+        self.assertEqual(fallback_buf, buf)
+        self.assertEqual(_rows(fallback_failed), _rows(failed))
+
+
+class ModuleRelocationsTest(unittest.TestCase):
+    def test_fixture(self):
+        f = load_nxo(io.BytesIO(make_nso(build_image())))
+        table = f.relocation_table
+        relative = [int(o) for o in table.of_type(R_AArch64.RELATIVE).offsets]
+        self.assertEqual(relative, [INIT_ARRAY + 8 * k for k in range(4)])
+        self.assertEqual([int(o) for o in table.of_type(R_FAKE_RELR).offsets], relr_locations())
+        self.assertIn(GOT, table)
+
+        image, failed = f.relocated_image(0x7100000000)
+        self.assertEqual(struct.unpack_from('<Q', image, INIT_ARRAY)[0], 0x7100000100)
+        self.assertEqual(struct.unpack_from('<Q', image, relr_locations()[1])[0], 0x7100000200)
+        self.assertTrue(all(DATA <= int(o) for o in failed.offsets))
+
+
+if __name__ == '__main__':
+    unittest.main()
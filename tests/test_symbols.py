@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import io
+import unittest
+
+from nxo64.files import load_nxo
+from nxo64.symbols import DictSymbolTable, GnuHashTable, SysvHashTable, elf_hash, gnu_hash
+
+from . import fixtures
+from .fixtures import EXPORTS, IMPORTS, build_image, make_nso
+
+
+class HashTest(unittest.TestCase):
+    def test_known_values(self):
+        self.assertEqual(elf_hash(b''), 0)
+        self.assertEqual(elf_hash(b'printf'), 0x077905A6)
+        self.assertEqual(gnu_hash(b''), 5381)
+        self.assertEqual(gnu_hash(b'printf'), 0x156B2BB8)
+
+    def test_long_names(self):
+        # long enough for the top nibble of the SysV hash to fold back in
+        for name in ('_ZN2nn2os11SleepThreadENS_8TimeSpanE', 'nnMain', 'a' * 100):
+            self.assertEqual(elf_hash(name.encode('ascii')), fixtures.elf_hash(name))
+            self.assertEqual(gnu_hash(name.encode('ascii')), fixtures.gnu_hash(name))
+
+
+class LookupTest(unittest.TestCase):
+    def _check(self, img, table_type):
+        f = load_nxo(io.BytesIO(make_nso(img)))
+        self.assertIsInstance(f._get_symbol_table(), table_type)
+        for name, _, _, value, _ in EXPORTS:
+            self.assertEqual(f.lookup_symbol(name).value, value)
+            self.assertEqual(f.lookup_symbol(name.encode('ascii')).value, value)
+        # imports aren't defined here
+        for name, _, _, _, _ in IMPORTS:
+            self.assertIsNone(f.lookup_symbol(name))
+        self.assertIsNone(f.lookup_symbol('func_four'))
+        self.assertIsNone(f.lookup_symbol(u'func_on\xe9'))
+        self.assertIsNone(f.lookup_symbol(b'func_on\xc3\xa9'))
+        self.assertEqual([sym and sym.name for sym in f.lookup_symbols(['weak_y', u'☃', 'obj_x'])],
+                         ['weak_y', None, 'obj_x'])
+
+    def test_gnu_hash(self):
+        self._check(build_image(), GnuHashTable)
+
+    def test_sysv_hash(self):
+        self._check(build_image(gnu_hash_table=False), SysvHashTable)
+
+    def test_no_hash_table(self):
+        self._check(build_image(sysv_hash=False, gnu_hash_table=False), DictSymbolTable)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import struct
+import unittest
+
+from nxo64.utils import kip1_blz_decompress
+
+
+def _blz(region, init_index, uncompressed_addl_size):
+    """
+    :param region: compressed data, read backwards from its end
+    :type region: bytes
+    :rtype: bytearray
+    """
+    compressed_size = len(region) + 0xC
+    return bytearray(region + struct.pack('<III', compressed_size, init_index, uncompressed_addl_size))
+
+
+def _stream(tokens):
+    """
+    Lay out BLZ tokens, which are decoded from the end of the output to its
+    start, as they sit in memory.
+
+    :param tokens: literal bytes and (length, distance) back-references, in decoding order
+    :type tokens: list[int | tuple[int, int]]
+    :rtype: bytes
+    """
+    read = bytearray()  # in the order the decoder reads it, backwards
+    for i in range(0, len(tokens), 8):
+        group = tokens[i:i + 8]
+        read.append(sum(0x80 >> k for k, token in enumerate(group) if isinstance(token, tuple)))
+        for token in group:
+            if isinstance(token, tuple):
+                value = (token[0] - 3) << 12 | (token[1] - 3)
+                read += bytearray((value >> 8, value & 0xFF))
+            else:
+                read.append(token)
+    return bytes(read[::-1])
+
+
+class KipBlzDecompressTest(unittest.TestCase):
+    def test_back_reference(self):
+        # read backwards: control 0x10 (3 literals, then a reference), 'cba',
+        # then a reference of 18 bytes at distance 3
+        stream = _blz(b'\x00\xF0abc\x10', 0xC, 3)
+        self.assertEqual(kip1_blz_decompress(stream), b'abc' * 7)
+
+    def test_overlapping_back_reference(self):
+        # 7 literals, then 18 bytes at distance 7, copied in 7, 7 and 4 byte chunks
+        stream = _blz(_stream([0x67, 0x66, 0x65, 0x64, 0x63, 0x62, 0x61, (18, 7)]), 0xC, 3)
+        self.assertEqual(kip1_blz_decompress(stream), (b'abcdefg' * 4)[3:])
+
+    def test_long_literal_run(self):
+        # 40 literals spanning five control bytes, then four references to them
+        literals = bytearray(range(0x40, 0x68))
+        tokens = list(reversed(literals)) + [(18, 40)] * 4
+        stream = _blz(_stream(tokens), 0xC, 46)
+        expected = bytearray(112)
+        expected[72:] = literals
+        for i in range(71, -1, -1):
+            expected[i] = expected[i + 40]
+        self.assertEqual(kip1_blz_decompress(stream), bytes(expected))
+
+    def test_truncated(self):
+        stream = _blz(_stream([0x61, 0x62, 0x63, (18, 3)]), 0xC, 9)
+        # the footer claims more data than there is
+        with self.assertRaises(ValueError):
+            kip1_blz_decompress(stream[4:])
+        with self.assertRaises(ValueError):
+            kip1_blz_decompress(stream[-8:])
+
+    def test_stream_runs_out(self):
+        # a control byte announcing 8 literals with nothing left to read
+        with self.assertRaises(ValueError):
+            kip1_blz_decompress(_blz(b'\x00', 0xC, 8))
+        # a reference without its second byte
+        with self.assertRaises(ValueError):
+            kip1_blz_decompress(_blz(b'\x00\x80', 0xC, 8))
+
+    def test_corrupt_footer(self):
+        stream = bytearray(_blz(_stream([0x61, 0x62, 0x63, (18, 3)]), 0xC, 9))
+        stream[-8:-4] = struct.pack('<I', len(stream) + 1)  # init_index past the data
+        with self.assertRaises(ValueError):
+            kip1_blz_decompress(stream)
+
+    def test_reference_past_output(self):
+        with self.assertRaises(ValueError):
+            kip1_blz_decompress(_blz(_stream([0x61, (3, 0x1002)]), 0xC, 8))
+
+    def test_reference_into_overwritten_input(self):
+        # 3 literals and an 18 byte reference produce more than they consume, so
+        # the output overwrites the second reference before it is read. Decoding
+        # in place reads it as 0xF44 bytes back, past the end of the output; decoders
+        # reading references from a copy of the input accepted this stream.
+        stream = _blz(b'\x00\x00\x00\x00' b'\x00\x00' b'\x00\xF0' b'C\x41\x0F' b'\x18', 0xC, 0)
+        with self.assertRaises(ValueError):
+            kip1_blz_decompress(stream)
+
+
+if __name__ == '__main__':
+    unittest.main()